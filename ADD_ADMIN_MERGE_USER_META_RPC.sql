@@ -0,0 +1,55 @@
+-- Admin metadata merge RPC for the admin panel (premium toggle / reject)
+-- Run this in Supabase SQL editor (production project).
+-- Merges a JSON patch into a gym account's user metadata in one statement,
+-- instead of reading the user, merging in Python and writing it back.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.admin_merge_user_meta(
+	p_user_id uuid,
+	p_patch jsonb
+)
+RETURNS TABLE (
+	status text,
+	user_metadata jsonb
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, auth
+AS $$
+DECLARE
+	v_meta jsonb;
+BEGIN
+	SELECT u.raw_user_meta_data INTO v_meta
+	FROM auth.users u
+	WHERE u.id = p_user_id
+	FOR UPDATE;
+
+	IF NOT FOUND THEN
+		RETURN QUERY SELECT 'not_found'::text, NULL::jsonb;
+		RETURN;
+	END IF;
+
+	IF COALESCE(v_meta->>'is_gym_account', '') <> 'true' THEN
+		RETURN QUERY SELECT 'not_gym_account'::text, v_meta;
+		RETURN;
+	END IF;
+
+	UPDATE auth.users u
+	SET
+		raw_user_meta_data = COALESCE(u.raw_user_meta_data, '{}'::jsonb) || p_patch,
+		updated_at = now()
+	WHERE u.id = p_user_id
+	RETURNING u.raw_user_meta_data INTO v_meta;
+
+	RETURN QUERY SELECT 'ok'::text, v_meta;
+END;
+$$;
+
+-- Ensure function is owned by postgres so it can update auth.users
+ALTER FUNCTION public.admin_merge_user_meta(uuid, jsonb) OWNER TO postgres;
+
+REVOKE ALL ON FUNCTION public.admin_merge_user_meta(uuid, jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.admin_merge_user_meta(uuid, jsonb) TO service_role;
+
+COMMIT;
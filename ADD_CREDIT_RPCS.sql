@@ -0,0 +1,122 @@
+-- Credit RPCs for the vision endpoints
+-- Run this in Supabase SQL editor (production project), after create_credits_table.sql.
+-- Execute rights are limited to service_role so clients cannot mint or spend credits directly.
+
+BEGIN;
+
+-- Atomically take one credit, applying the monthly reset.
+-- Returns the credits left after the deduction, or -1 when the user has none.
+CREATE OR REPLACE FUNCTION public.consume_credit(
+	p_user_id uuid,
+	p_month text
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+	v_remaining integer;
+BEGIN
+	INSERT INTO public.user_credits AS uc (user_id, credits_remaining, last_reset_month)
+	VALUES (p_user_id, 9, p_month)
+	ON CONFLICT (user_id) DO UPDATE
+	SET
+		credits_remaining = CASE
+			WHEN uc.last_reset_month IS DISTINCT FROM p_month THEN 9
+			ELSE uc.credits_remaining - 1
+		END,
+		last_reset_month = p_month,
+		updated_at = now()
+	WHERE uc.last_reset_month IS DISTINCT FROM p_month OR uc.credits_remaining > 0
+	RETURNING uc.credits_remaining INTO v_remaining;
+
+	RETURN COALESCE(v_remaining, -1);
+END;
+$$;
+
+-- Spend one credit for /api/user-credits/deduct, applying the monthly reset.
+-- Never goes below 0; returns the credits left.
+CREATE OR REPLACE FUNCTION public.deduct_credit(
+	p_user_id uuid,
+	p_month text
+)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+	INSERT INTO public.user_credits AS uc (user_id, credits_remaining, last_reset_month)
+	VALUES (p_user_id, 9, p_month)
+	ON CONFLICT (user_id) DO UPDATE
+	SET
+		credits_remaining = CASE
+			WHEN uc.last_reset_month IS DISTINCT FROM p_month THEN 9
+			ELSE GREATEST(uc.credits_remaining - 1, 0)
+		END,
+		last_reset_month = p_month,
+		updated_at = now()
+	RETURNING uc.credits_remaining;
+$$;
+
+-- Give back a credit taken by consume_credit (e.g. when the vision call failed).
+CREATE OR REPLACE FUNCTION public.refund_credit(
+	p_user_id uuid,
+	p_month text
+)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+	UPDATE public.user_credits
+	SET
+		credits_remaining = LEAST(credits_remaining + 1, 10),
+		updated_at = now()
+	WHERE user_id = p_user_id AND last_reset_month = p_month
+	RETURNING credits_remaining;
+$$;
+
+-- Read a user's credits, creating the row (10 credits) or applying the monthly reset as needed.
+CREATE OR REPLACE FUNCTION public.ensure_user_credits(
+	p_user_id uuid,
+	p_month text
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+	v_remaining integer;
+BEGIN
+	INSERT INTO public.user_credits AS uc (user_id, credits_remaining, last_reset_month)
+	VALUES (p_user_id, 10, p_month)
+	ON CONFLICT (user_id) DO UPDATE
+	SET
+		credits_remaining = 10,
+		last_reset_month = p_month,
+		updated_at = now()
+	WHERE uc.last_reset_month IS DISTINCT FROM p_month
+	RETURNING uc.credits_remaining INTO v_remaining;
+
+	IF v_remaining IS NULL THEN
+		SELECT credits_remaining INTO v_remaining
+		FROM public.user_credits
+		WHERE user_id = p_user_id;
+	END IF;
+
+	RETURN v_remaining;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.consume_credit(uuid, text) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.refund_credit(uuid, text) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.ensure_user_credits(uuid, text) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.deduct_credit(uuid, text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.consume_credit(uuid, text) TO service_role;
+GRANT EXECUTE ON FUNCTION public.refund_credit(uuid, text) TO service_role;
+GRANT EXECUTE ON FUNCTION public.ensure_user_credits(uuid, text) TO service_role;
+GRANT EXECUTE ON FUNCTION public.deduct_credit(uuid, text) TO service_role;
+
+COMMIT;
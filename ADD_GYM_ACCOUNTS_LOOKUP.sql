@@ -0,0 +1,80 @@
+-- Gym account lookup table for resolving a gym name to its account
+-- Run this in Supabase SQL editor (production project), after gym_accounts_schema.sql.
+-- Kept in sync with auth.users metadata by trigger, so the backend can find a gym account
+-- with one indexed query instead of paging through every auth user.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS public.gym_accounts (
+	user_id uuid PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+	gym_name text,
+	gym_name_lower text,
+	is_gym_account boolean NOT NULL DEFAULT false,
+	is_verified boolean NOT NULL DEFAULT false,
+	updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_gym_accounts_gym_name_lower ON public.gym_accounts (gym_name_lower);
+
+-- Service role only (bypasses RLS); no client access.
+ALTER TABLE public.gym_accounts ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.sync_gym_account_from_user()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, auth
+AS $$
+BEGIN
+	IF COALESCE(NEW.raw_user_meta_data->>'is_gym_account', 'false') = 'true' THEN
+		INSERT INTO public.gym_accounts AS ga (user_id, gym_name, gym_name_lower, is_gym_account, is_verified, updated_at)
+		VALUES (
+			NEW.id,
+			NEW.raw_user_meta_data->>'gym_name',
+			NULLIF(LOWER(TRIM(NEW.raw_user_meta_data->>'gym_name')), ''),
+			true,
+			COALESCE(NEW.raw_user_meta_data->>'is_verified', 'false') = 'true',
+			now()
+		)
+		ON CONFLICT (user_id) DO UPDATE
+		SET
+			gym_name = EXCLUDED.gym_name,
+			gym_name_lower = EXCLUDED.gym_name_lower,
+			is_gym_account = true,
+			is_verified = EXCLUDED.is_verified,
+			updated_at = now();
+	ELSE
+		DELETE FROM public.gym_accounts WHERE user_id = NEW.id;
+	END IF;
+	RETURN NEW;
+END;
+$$;
+
+ALTER FUNCTION public.sync_gym_account_from_user() OWNER TO postgres;
+
+DROP TRIGGER IF EXISTS sync_gym_account_from_user ON auth.users;
+CREATE TRIGGER sync_gym_account_from_user
+	AFTER INSERT OR UPDATE OF raw_user_meta_data ON auth.users
+	FOR EACH ROW
+	EXECUTE FUNCTION public.sync_gym_account_from_user();
+
+-- Backfill existing gym accounts
+INSERT INTO public.gym_accounts (user_id, gym_name, gym_name_lower, is_gym_account, is_verified, updated_at)
+SELECT
+	id,
+	raw_user_meta_data->>'gym_name',
+	NULLIF(LOWER(TRIM(raw_user_meta_data->>'gym_name')), ''),
+	true,
+	COALESCE(raw_user_meta_data->>'is_verified', 'false') = 'true',
+	now()
+FROM auth.users
+WHERE raw_user_meta_data->>'is_gym_account' = 'true'
+ON CONFLICT (user_id) DO UPDATE
+SET
+	gym_name = EXCLUDED.gym_name,
+	gym_name_lower = EXCLUDED.gym_name_lower,
+	is_gym_account = true,
+	is_verified = EXCLUDED.is_verified,
+	updated_at = now();
+
+COMMIT;
@@ -0,0 +1,162 @@
+-- Chart aggregation bundle RPC for gym dashboard
+-- Run this in Supabase SQL editor (production project), after ADD_GYM_PEAK_TIMES_RPC.sql.
+-- Returns one JSON object with the per-day, per-week, per-hour and per-exercise aggregates the
+-- dashboard charts need, so the app no longer walks every workout's exercises JSON itself.
+-- peak_times matches get_gym_peak_times, so one call covers every chart.
+-- Exercise rows are grouped by key + muscles; the app maps them onto MACHINE_METADATA.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_gym_chart_bundle(
+	p_user_ids uuid[],
+	p_gym_name text,
+	p_start_date date DEFAULT NULL,
+	p_end_date date DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+	WITH filtered_workouts AS (
+		SELECT
+			w.user_id,
+			w.date::date AS workout_date,
+			EXTRACT(
+				HOUR FROM timezone(
+					'Europe/Amsterdam',
+					COALESCE(w.inserted_at, w.created_at, (w.date::timestamp + interval '12 hour'))
+				)
+			)::int AS workout_hour,
+			to_char(w.date::date, 'IYYY') || '-W' || to_char(w.date::date, 'IW') AS week_key,
+			CASE WHEN jsonb_typeof(w.exercises) = 'array' THEN w.exercises ELSE '[]'::jsonb END AS exercises
+		FROM public.workouts w
+		WHERE
+			w.user_id = ANY(p_user_ids)
+			AND w.date IS NOT NULL
+			AND (p_start_date IS NULL OR w.date >= p_start_date)
+			AND (p_end_date IS NULL OR w.date <= p_end_date)
+			AND lower(trim(COALESCE(w.gym_name, ''))) = lower(trim(COALESCE(p_gym_name, '')))
+			AND lower(trim(COALESCE(w.gym_name, ''))) NOT IN ('', '-', 'gym -')
+	),
+	exercise_rows AS (
+		SELECT
+			fw.week_key,
+			COALESCE(ex->>'key', '') AS ex_key,
+			CASE WHEN jsonb_typeof(ex->'muscles') = 'array' THEN ex->'muscles' ELSE '[]'::jsonb END AS muscles,
+			CASE WHEN jsonb_typeof(ex->'sets') = 'array' THEN ex->'sets' ELSE '[]'::jsonb END AS sets
+		FROM filtered_workouts fw
+		CROSS JOIN LATERAL jsonb_array_elements(fw.exercises) AS ex
+		WHERE jsonb_typeof(ex) = 'object'
+	),
+	set_rows AS (
+		SELECT
+			er.week_key,
+			er.ex_key,
+			er.muscles,
+			er.sets,
+			(COALESCE(s->>'weight', '') <> '' AND COALESCE(s->>'reps', '') <> '') AS has_strength,
+			(COALESCE(s->>'min', '') <> '' OR COALESCE(s->>'sec', '') <> '' OR COALESCE(s->>'km', '') <> '' OR COALESCE(s->>'cal', '') <> '') AS has_cardio,
+			(COALESCE(s->>'weight', '') <> '' OR COALESCE(s->>'reps', '') <> '') AS has_any_strength,
+			CASE
+				WHEN s->>'weight' ~ '^\s*[0-9]+([.,][0-9]*)?\s*$' AND s->>'reps' ~ '^\s*[0-9]+\s*$'
+				THEN replace(trim(s->>'weight'), ',', '.')::numeric * trim(s->>'reps')::numeric
+				ELSE 0
+			END AS volume
+		FROM exercise_rows er
+		CROSS JOIN LATERAL jsonb_array_elements(er.sets) AS s
+		WHERE jsonb_typeof(s) = 'object'
+	),
+	-- One row per exercise entry; entries without any filled-in set are ignored like in the app
+	exercise_stats AS (
+		SELECT
+			week_key,
+			ex_key,
+			muscles,
+			sets,
+			COUNT(*) FILTER (WHERE has_any_strength OR has_cardio) AS counted_sets,
+			COUNT(*) AS object_sets,
+			COUNT(*) FILTER (WHERE has_cardio) AS cardio_field_sets,
+			COUNT(*) FILTER (WHERE has_strength AND NOT has_cardio) AS strength_only_sets,
+			SUM(volume) AS volume
+		FROM set_rows
+		GROUP BY week_key, ex_key, muscles, sets
+	)
+	SELECT jsonb_build_object(
+		'day_counts', COALESCE((
+			SELECT jsonb_object_agg(day_key, workout_count)
+			FROM (
+				SELECT to_char(workout_date, 'YYYY-MM-DD') AS day_key, COUNT(*) AS workout_count
+				FROM filtered_workouts
+				GROUP BY 1
+			) d
+		), '{}'::jsonb),
+		'week_counts', COALESCE((
+			SELECT jsonb_object_agg(week_key, workout_count)
+			FROM (
+				SELECT week_key, COUNT(*) AS workout_count
+				FROM filtered_workouts
+				GROUP BY 1
+			) wk
+		), '{}'::jsonb),
+		'active_users_by_week', COALESCE((
+			SELECT jsonb_object_agg(week_key, user_count)
+			FROM (
+				SELECT week_key, COUNT(DISTINCT user_id) AS user_count
+				FROM filtered_workouts
+				WHERE user_id IS NOT NULL
+				GROUP BY 1
+			) au
+		), '{}'::jsonb),
+		'volume_by_week', COALESCE((
+			SELECT jsonb_object_agg(week_key, volume)
+			FROM (
+				SELECT week_key, SUM(volume) AS volume
+				FROM exercise_stats
+				WHERE counted_sets > 0
+				GROUP BY 1
+				HAVING SUM(volume) > 0
+			) v
+		), '{}'::jsonb),
+		'peak_times', COALESCE((
+			SELECT jsonb_agg(jsonb_build_object(
+				'weekday_name', to_char(workout_date, 'FMDay'),
+				'hour', workout_hour,
+				'workout_count', workout_count
+			))
+			FROM (
+				SELECT workout_date, workout_hour, COUNT(*) AS workout_count
+				FROM filtered_workouts
+				GROUP BY 1, 2
+			) p
+		), '[]'::jsonb),
+		'exercises', COALESCE((
+			SELECT jsonb_agg(jsonb_build_object(
+				'key', ex_key,
+				'muscles', muscles,
+				'sets', counted_sets,
+				'object_sets', object_sets,
+				'cardio_field_sets', cardio_field_sets,
+				'strength_only_sets', strength_only_sets
+			))
+			FROM (
+				SELECT
+					ex_key,
+					muscles,
+					SUM(counted_sets) AS counted_sets,
+					SUM(object_sets) AS object_sets,
+					SUM(cardio_field_sets) AS cardio_field_sets,
+					SUM(strength_only_sets) AS strength_only_sets
+				FROM exercise_stats
+				WHERE counted_sets > 0
+				GROUP BY ex_key, muscles
+			) e
+		), '[]'::jsonb)
+	);
+$$;
+
+REVOKE ALL ON FUNCTION public.get_gym_chart_bundle(uuid[], text, date, date) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.get_gym_chart_bundle(uuid[], text, date, date) TO service_role;
+
+COMMIT;
@@ -0,0 +1,50 @@
+-- Problem report submission RPC (resolves the gym account and inserts in one call)
+-- Run this in Supabase SQL editor (production project), after create_gym_problem_reports_table.sql
+-- and ADD_GYM_ACCOUNTS_LOOKUP.sql.
+-- Execute rights are limited to service_role.
+
+BEGIN;
+
+-- gym_id comes from the user's gym_analytics link, else from the gym account with the same name.
+-- Returns the new report id.
+CREATE OR REPLACE FUNCTION public.submit_problem_report(
+	p_user_id uuid,
+	p_gym_name text,
+	p_gym_place_id text,
+	p_exercise_key text,
+	p_exercise_display text,
+	p_issue_type text,
+	p_note text
+)
+RETURNS uuid
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+	INSERT INTO public.gym_problem_reports (
+		user_id, gym_id, gym_name, gym_place_id, exercise_key, exercise_display,
+		issue_type, note, status, is_read
+	)
+	SELECT
+		p_user_id,
+		COALESCE(
+			(SELECT a.gym_id FROM public.gym_analytics a WHERE a.user_id = p_user_id LIMIT 1),
+			(SELECT ga.user_id FROM public.gym_accounts ga
+			 WHERE ga.gym_name_lower = LOWER(TRIM(p_gym_name)) AND ga.is_gym_account
+			 LIMIT 1)
+		),
+		p_gym_name,
+		NULLIF(p_gym_place_id, ''),
+		NULLIF(p_exercise_key, ''),
+		p_exercise_display,
+		p_issue_type,
+		NULLIF(p_note, ''),
+		'open',
+		false
+	RETURNING id;
+$$;
+
+REVOKE ALL ON FUNCTION public.submit_problem_report(uuid, text, text, text, text, text, text) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.submit_problem_report(uuid, text, text, text, text, text, text) TO service_role;
+
+COMMIT;
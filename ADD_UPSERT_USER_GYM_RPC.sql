@@ -0,0 +1,88 @@
+-- Save a user's gym settings in one call: merge user_metadata and sync gym_analytics
+-- Run this in Supabase SQL editor (production project), after gym_analytics_table.sql
+-- and ADD_GYM_ACCOUNTS_LOOKUP.sql.
+-- Execute rights are limited to service_role.
+
+BEGIN;
+
+-- p_set is merged into raw_user_meta_data after removing the keys in p_remove.
+-- Returns the new user_metadata, or NULL when the user does not exist.
+CREATE OR REPLACE FUNCTION public.upsert_user_gym(
+	p_user_id uuid,
+	p_set jsonb,
+	p_remove text[] DEFAULT '{}'
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, auth
+AS $$
+DECLARE
+	v_meta jsonb;
+	v_gym_name text;
+	v_gym_place_id text;
+	v_consent boolean;
+	v_consent_at timestamptz;
+	v_gym_id uuid;
+BEGIN
+	UPDATE auth.users
+	SET
+		raw_user_meta_data = (COALESCE(raw_user_meta_data, '{}'::jsonb) - p_remove) || COALESCE(p_set, '{}'::jsonb),
+		updated_at = now()
+	WHERE id = p_user_id
+	RETURNING raw_user_meta_data INTO v_meta;
+
+	IF v_meta IS NULL THEN
+		RETURN NULL;
+	END IF;
+
+	v_gym_name := v_meta->>'gym_name';
+	v_gym_place_id := NULLIF(v_meta->>'gym_place_id', '');
+	v_consent := COALESCE(v_meta->>'data_collection_consent', 'false') = 'true';
+	v_consent_at := NULLIF(v_meta->>'consent_updated_at', '')::timestamptz;
+
+	IF v_consent AND NULLIF(TRIM(v_gym_name), '') IS NOT NULL THEN
+		SELECT ga.user_id INTO v_gym_id
+		FROM public.gym_accounts ga
+		WHERE ga.gym_name_lower = LOWER(TRIM(v_gym_name)) AND ga.is_gym_account
+		LIMIT 1;
+	END IF;
+
+	INSERT INTO public.gym_analytics AS a (
+		user_id, gym_name, gym_place_id, data_collection_consent, gym_id,
+		consent_given_at, consent_revoked_at, gym_name_updated_at, created_at, updated_at
+	)
+	VALUES (
+		p_user_id,
+		v_gym_name,
+		v_gym_place_id,
+		v_consent,
+		CASE WHEN v_consent THEN v_gym_id END,
+		CASE WHEN v_consent THEN v_consent_at END,
+		CASE WHEN NOT v_consent THEN v_consent_at END,
+		NULLIF(v_meta->>'gym_name_updated_at', '')::timestamptz,
+		now(),
+		now()
+	)
+	ON CONFLICT (user_id) DO UPDATE
+	SET
+		gym_name = EXCLUDED.gym_name,
+		gym_place_id = COALESCE(EXCLUDED.gym_place_id, a.gym_place_id),
+		data_collection_consent = EXCLUDED.data_collection_consent,
+		-- Revoking consent unlinks the user from the gym dashboard
+		gym_id = CASE WHEN EXCLUDED.data_collection_consent THEN COALESCE(EXCLUDED.gym_id, a.gym_id) END,
+		consent_given_at = COALESCE(EXCLUDED.consent_given_at, a.consent_given_at),
+		consent_revoked_at = COALESCE(EXCLUDED.consent_revoked_at, a.consent_revoked_at),
+		gym_name_updated_at = COALESCE(EXCLUDED.gym_name_updated_at, a.gym_name_updated_at),
+		updated_at = now();
+
+	RETURN v_meta;
+END;
+$$;
+
+ALTER FUNCTION public.upsert_user_gym(uuid, jsonb, text[]) OWNER TO postgres;
+
+REVOKE ALL ON FUNCTION public.upsert_user_gym(uuid, jsonb, text[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.upsert_user_gym(uuid, jsonb, text[]) TO service_role;
+
+COMMIT;
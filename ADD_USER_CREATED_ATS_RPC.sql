@@ -0,0 +1,27 @@
+-- Account creation dates for a set of users (gym dashboard user comparisons)
+-- Run this in Supabase SQL editor (production project).
+-- Execute rights are limited to service_role because it reads auth.users.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_user_created_ats(
+	p_user_ids uuid[]
+)
+RETURNS TABLE (
+	id uuid,
+	created_at timestamptz
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, auth
+AS $$
+	SELECT u.id, u.created_at
+	FROM auth.users u
+	WHERE u.id = ANY(p_user_ids);
+$$;
+
+REVOKE ALL ON FUNCTION public.get_user_created_ats(uuid[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.get_user_created_ats(uuid[]) TO service_role;
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- ============================================
+-- Add exercise_count column to workouts table
+-- Run this in Supabase SQL Editor
+-- ============================================
+-- The gym dashboard's statistics and comparisons only need how many exercises a workout has;
+-- selecting this column instead of the full exercises JSON keeps those rows small.
+
+ALTER TABLE public.workouts
+ADD COLUMN IF NOT EXISTS exercise_count integer
+GENERATED ALWAYS AS (
+  CASE WHEN jsonb_typeof(exercises) = 'array' THEN jsonb_array_length(exercises) ELSE 0 END
+) STORED;
+
+-- Refresh schema cache
+NOTIFY pgrst, 'reload schema';
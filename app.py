@@ -1,18 +1,34 @@
 from __future__ import annotations
 
+import atexit
+import logging
 import os
+import queue
+import re
 import json
+import base64
+import bisect
+import csv
+import hashlib
+import heapq
+import io
 import sqlite3
+import threading
 import time
 import urllib.parse
 import urllib.request
 import requests
-from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 from typing import Dict, Any, List, Optional
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from difflib import get_close_matches
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # Load environment variables from .env file (for local development)
@@ -23,8 +39,9 @@ except ImportError:
 	# python-dotenv not installed, continue without it
 	pass
 
-from flask import Flask, jsonify, render_template, request, send_from_directory, redirect, url_for, flash
+from flask import Flask, g, has_request_context, jsonify, render_template, request, send_from_directory, stream_with_context, redirect, url_for, flash
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
 try:
@@ -49,9 +66,56 @@ try:
 except Exception:
 	OPENAI_AVAILABLE = False
 
+try:
+	import httpx  # type: ignore
+	HTTPX_AVAILABLE = True
+except Exception:
+	HTTPX_AVAILABLE = False
+
+try:
+	import h2  # type: ignore  # noqa: F401 - lets httpx negotiate HTTP/2
+	HTTP2_AVAILABLE = True
+except Exception:
+	HTTP2_AVAILABLE = False
+
+try:
+	from PIL import Image, ImageOps  # type: ignore
+	PIL_AVAILABLE = True
+except Exception:
+	PIL_AVAILABLE = False
+
+try:
+	from zoneinfo import ZoneInfo  # py3.9+
+	AMSTERDAM_TZ = ZoneInfo("Europe/Amsterdam")
+except Exception:
+	AMSTERDAM_TZ = None
+
+try:
+	import orjson  # type: ignore
+	ORJSON_AVAILABLE = True
+except Exception:
+	ORJSON_AVAILABLE = False
+
+try:
+	import jwt  # type: ignore
+	JWT_AVAILABLE = True
+except Exception:
+	JWT_AVAILABLE = False
+
 APP_ROOT = Path(__file__).resolve().parent
 # Model paths removed - models no longer used to save memory
 DATABASE_PATH = APP_ROOT / "gymvision.db"
+
+# Supabase config is read once at startup (Render restarts the service on env changes)
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+SUPABASE_CONFIGURED = bool(SUPABASE_URL and SUPABASE_ANON_KEY and SUPABASE_SERVICE_ROLE_KEY)
+# Optional: lets access tokens be verified locally instead of with an Auth round-trip
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+# AI provider keys, read once at startup as well
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 IMAGES_PATHS = [APP_ROOT / "images"]
 PARENT_IMAGES_PATH = APP_ROOT.parent / "images"
 if PARENT_IMAGES_PATH.exists():
@@ -63,13 +127,22 @@ if WWW_IMAGES_PATH.exists():
 
 IMAGE_FILE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
 IMAGE_BASENAMES = []
+_image_filenames = set()
 for directory in IMAGES_PATHS:
 	if directory.exists():
 		for file in directory.iterdir():
 			if file.suffix.lower() in IMAGE_FILE_EXTENSIONS:
 				IMAGE_BASENAMES.append(file.stem.lower())
+				_image_filenames.add(file.name)
 IMAGE_BASENAMES = sorted(set(IMAGE_BASENAMES))
 
+# Basename -> served image URL, preferring extensions in IMAGE_FILE_EXTENSIONS order
+IMAGE_URLS_BY_BASENAME: Dict[str, str] = {}
+for _ext in IMAGE_FILE_EXTENSIONS:
+	for _name in sorted(_image_filenames):
+		if _name.endswith(_ext):
+			IMAGE_URLS_BY_BASENAME.setdefault(_name[:-len(_ext)], f"/images/{_name}")
+
 def normalize_label(text: str) -> str:
 	return "".join(ch if ch.isalnum() else "_" for ch in (text or "").lower()).strip("_")
 
@@ -84,6 +157,30 @@ app = Flask(
 )
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key-change-in-production-2024")  # Change in production!
 
+if ORJSON_AVAILABLE:
+	class OrjsonJSONProvider(DefaultJSONProvider):
+		"""Serve jsonify()/get_json() through orjson; stdlib json is only used for custom kwargs."""
+		option = orjson.OPT_NON_STR_KEYS
+
+		def dumps(self, obj: Any, **kwargs: Any) -> str:
+			if kwargs:
+				return super().dumps(obj, **kwargs)
+			return orjson.dumps(obj, default=self.default, option=self.option).decode("utf-8")
+
+		def loads(self, s: Any, **kwargs: Any) -> Any:
+			if kwargs:
+				return super().loads(s, **kwargs)
+			return orjson.loads(s)
+
+		def response(self, *args: Any, **kwargs: Any):
+			obj = self._prepare_response_obj(args, kwargs)
+			return self._app.response_class(
+				orjson.dumps(obj, default=self.default, option=self.option),
+				mimetype=self.mimetype,
+			)
+
+	app.json = OrjsonJSONProvider(app)
+
 # Enable CORS for all routes (needed for Capacitor/iOS app)
 # Allow all origins for Capacitor apps (capacitor://localhost, file://, etc.)
 CORS(app, resources={
@@ -91,6 +188,56 @@ CORS(app, resources={
 	r"/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]}
 })
 
+
+@app.before_request
+def _answer_preflight():
+	"""
+	Answer CORS preflights for routes that accept OPTIONS before the view runs.
+	flask-cors still adds the Access-Control-* headers in its after_request hook.
+	"""
+	if request.method == "OPTIONS" and request.url_rule is not None and not request.url_rule.provide_automatic_options:
+		return app.response_class(status=204)
+
+
+# Logging goes through a queue so request threads never block on stdout.
+# LOG_LEVEL=DEBUG enables the verbose per-request traces.
+log = logging.getLogger("gymvision")
+log.setLevel(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO))
+log.propagate = False
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+class _DeferredQueueHandler(QueueHandler):
+	"""Queue records unformatted so messages and tracebacks are rendered on the listener thread."""
+
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		return record
+
+
+log.addHandler(_DeferredQueueHandler(_log_queue))
+# Gym dashboard traces; inherits the level and queue handler from "gymvision".
+# DEBUG_GYM_DASHBOARD=1 turns them on without lowering LOG_LEVEL for the whole app.
+dashboard_log = logging.getLogger("gymvision.dashboard")
+DEBUG_GYM_DASHBOARD = os.getenv("DEBUG_GYM_DASHBOARD") == "1"
+if DEBUG_GYM_DASHBOARD:
+	dashboard_log.setLevel(logging.DEBUG)
+
+# Stack traces are only formatted for logged errors when DEBUG_TRACEBACKS=1
+_LOG_TRACEBACKS = os.getenv("DEBUG_TRACEBACKS") == "1"
+# Re-read a gym account after an admin reject to confirm the saved metadata (one extra Auth round-trip)
+DEBUG_ADMIN_VERIFY = bool(os.getenv("DEBUG_ADMIN_VERIFY"))
+
+
+def _log_exception(msg: str, *args: Any) -> None:
+	"""Log an error from an except block, with the traceback only in debug mode or when DEBUG_TRACEBACKS=1."""
+	log.error(msg, *args, exc_info=_LOG_TRACEBACKS or app.debug)
+
+
 # Flask-Mail removed - using Supabase for email verification
 
 # Flask-Login setup
@@ -141,6 +288,118 @@ def normalize_problem_report_type(value: Optional[str]) -> Optional[str]:
 	return PROBLEM_REPORT_TYPES.get(key)
 
 
+_supabase_clients: Dict[tuple[str, str], Any] = {}
+_supabase_clients_lock = threading.Lock()
+
+
+def _supabase_client_options() -> Any:
+	"""Server-side client options: no session persistence/refresh, pooled HTTP connections."""
+	try:
+		from supabase import ClientOptions
+	except ImportError:
+		return None
+	kwargs: Dict[str, Any] = {"auto_refresh_token": False, "persist_session": False}
+	if HTTPX_AVAILABLE:
+		kwargs["httpx_client"] = httpx.Client(
+			http2=HTTP2_AVAILABLE,
+			limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+			timeout=httpx.Timeout(30.0, connect=10.0)
+		)
+	try:
+		return ClientOptions(**kwargs)
+	except TypeError:
+		# Older supabase-py without httpx_client support
+		kwargs.pop("httpx_client", None)
+		return ClientOptions(**kwargs)
+
+
+def _shared_supabase_client(supabase_url: str, key: str) -> Any:
+	"""One Supabase client per (url, key), created lazily and reused across requests."""
+	client = _supabase_clients.get((supabase_url, key))
+	if client is not None:
+		return client
+	with _supabase_clients_lock:
+		client = _supabase_clients.get((supabase_url, key))
+		if client is None:
+			options = _supabase_client_options()
+			client = create_client(supabase_url, key, options=options) if options is not None else create_client(supabase_url, key)
+			_supabase_clients[(supabase_url, key)] = client
+	return client
+
+
+def _get_anon_client() -> Any:
+	return _shared_supabase_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+
+
+def _get_admin_client() -> Any:
+	return _shared_supabase_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+
+# Build both clients at import so the first requests do not pay for client/pool setup
+if SUPABASE_AVAILABLE and SUPABASE_CONFIGURED:
+	try:
+		_get_anon_client()
+		_get_admin_client()
+	except Exception as e:
+		log.warning("[SUPABASE] Could not create clients at startup: %s", e)
+
+
+_auth_cache: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+_auth_cache_lock = threading.Lock()
+_AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+_AUTH_CACHE_MAX = 1000
+
+
+def _auth_cache_key(access_token: str) -> str:
+	return hashlib.blake2b(access_token.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _forget_token(access_token: Optional[str]) -> None:
+	"""Drop a cached verification (e.g. after the account was deleted)."""
+	if not access_token:
+		return
+	with _auth_cache_lock:
+		_auth_cache.pop(_auth_cache_key(access_token), None)
+
+
+def _verify_token(access_token: str) -> Optional[Any]:
+	"""
+	Supabase `auth.get_user(access_token).user`, cached per token for a short TTL
+	so repeated calls with the same session skip the Auth round-trip.
+	Returns None for tokens Supabase rejects; Supabase errors are raised as before.
+	"""
+	key = _auth_cache_key(access_token)
+	now_ts = time.monotonic()
+	with _auth_cache_lock:
+		cached = _auth_cache.get(key)
+		if cached and now_ts - cached[0] < _AUTH_CACHE_TTL_SECONDS:
+			# No move_to_end on hits: entries stay ordered by cached_at (FIFO), so with a fixed TTL
+			# every expired entry sits at the front
+			return cached[1]
+	
+	try:
+		user = _get_anon_client().auth.get_user(access_token).user
+	except Exception:
+		_forget_token(access_token)
+		raise
+	
+	with _auth_cache_lock:
+		if user:
+			_auth_cache[key] = (now_ts, user)
+			_auth_cache.move_to_end(key)
+			while len(_auth_cache) > _AUTH_CACHE_MAX:
+				_auth_cache.popitem(last=False)
+			# Opportunistically drop expired entries from the oldest end
+			while _auth_cache:
+				oldest_key, (cached_at, _) = next(iter(_auth_cache.items()))
+				if now_ts - cached_at < _AUTH_CACHE_TTL_SECONDS:
+					break
+				del _auth_cache[oldest_key]
+		else:
+			_auth_cache.pop(key, None)
+	return user
+
+
 def verify_user_token(access_token: str) -> tuple[Optional[Any], Optional[str]]:
 	"""
 	Verify user token and return user object or error message.
@@ -154,18 +413,14 @@ def verify_user_token(access_token: str) -> tuple[Optional[Any], Optional[str]]:
 	if not SUPABASE_AVAILABLE:
 		return None, "Supabase not available"
 	
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-	
 	if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 		return None, "Supabase configuration missing"
 	
 	try:
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		user = _verify_token(access_token)
 		
-		if user_response.user:
-			return user_response.user, None
+		if user:
+			return user, None
 		else:
 			return None, "Invalid token"
 	except Exception as e:
@@ -177,9 +432,99 @@ def verify_user_token(access_token: str) -> tuple[Optional[Any], Optional[str]]:
 			return None, "Session expired. Please sign in again."
 		else:
 			# Log other errors for debugging
-			print(f"[AUTH ERROR] {error_msg}")
+			log.warning("[AUTH ERROR] %s", error_msg)
 			return None, "Authentication failed. Please sign in again."
 
+
+@lru_cache(maxsize=4)
+def _supabase_admin_rest(supabase_url: str, service_role_key: str) -> tuple[str, str, Dict[str, str]]:
+	"""
+	Admin users URL, per-user URL template and headers for the Supabase Auth REST API.
+	Built once per project/key; callers must not mutate the returned headers.
+	"""
+	users_url = f"{supabase_url}/auth/v1/admin/users"
+	headers = {
+		"apikey": service_role_key,
+		"Authorization": f"Bearer {service_role_key}",
+		"Content-Type": "application/json"
+	}
+	return users_url, users_url + "/{}", headers
+
+
+def _is_missing_rpc(e: Exception) -> bool:
+	"""True when PostgREST reports that the called function does not exist (its migration has not been run)."""
+	if getattr(e, "code", None) == "PGRST202":
+		return True
+	message = str(e)
+	return "PGRST202" in message or "Could not find the function" in message
+
+
+def _admin_merge_user_meta(admin_client: Any, user_id: str, patch: Dict[str, Any]) -> Optional[tuple[str, Optional[Dict[str, Any]]]]:
+	"""
+	Merge `patch` into a gym account's user_metadata in one round-trip
+	(admin_merge_user_meta RPC, see ADD_ADMIN_MERGE_USER_META_RPC.sql).
+	Returns (status, user_metadata) with status "ok", "not_found" or "not_gym_account",
+	or None when the RPC is not installed so callers can fall back to the Admin API.
+	Other RPC errors are raised.
+	"""
+	try:
+		response = admin_client.rpc("admin_merge_user_meta", {"p_user_id": user_id, "p_patch": patch}).execute()
+	except Exception as e:
+		# Only a missing function falls back; the Admin API path is a racy read-modify-write
+		if not _is_missing_rpc(e):
+			raise
+		log.warning("[ADMIN] admin_merge_user_meta RPC not installed, using Admin API: %s", e)
+		return None
+	rows = response.data or []
+	if isinstance(rows, dict):
+		rows = [rows]
+	if not rows:
+		return "not_found", None
+	return rows[0].get("status") or "not_found", rows[0].get("user_metadata")
+
+
+def _verify_jwt_locally(access_token: str) -> Optional[Dict[str, Any]]:
+	"""
+	Verify a Supabase access token with the project's JWT secret (HS256).
+	Returns the claims, or None when the token can't be checked locally
+	(no secret configured, asymmetric signing keys, expired/invalid token);
+	callers then fall back to auth.get_user.
+	"""
+	if not JWT_AVAILABLE or not SUPABASE_JWT_SECRET or not access_token:
+		return None
+	try:
+		claims = jwt.decode(access_token, key=SUPABASE_JWT_SECRET, algorithms=["HS256"], audience="authenticated")
+	except jwt.InvalidTokenError:
+		return None
+	return claims if isinstance(claims.get("sub"), str) else None
+
+
+# Shared pool for overlapping independent Supabase round-trips within a request
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# Keep-alive session for Supabase Admin REST calls (avoids a TLS handshake per admin action)
+_SUPA_SESSION = requests.Session()
+_SUPA_SESSION.mount("https://", HTTPAdapter(
+	pool_connections=10,
+	pool_maxsize=20,
+	max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+
+
+def _unverified_jwt_sub(access_token: str) -> Optional[str]:
+	"""
+	Read the `sub` claim from a JWT without checking its signature.
+	Only use the result after the token has been verified by Supabase.
+	"""
+	if not JWT_AVAILABLE or not access_token:
+		return None
+	try:
+		claims = jwt.decode(access_token, options={"verify_signature": False})
+	except Exception:
+		return None
+	sub = claims.get("sub")
+	return sub if isinstance(sub, str) else None
+
 MACHINE_METADATA: Dict[str, Dict[str, Any]] = {
 	# Chest
 	"bench_press": {"display": "Bench Press", "muscles": normalize_muscles(["Chest", "Triceps", "Shoulders"]), "video": "https://www.youtube.com/embed/ejI1Nlsul9k", "image": "https://strengthlevel.com/images/illustrations/bench-press.png"},
@@ -339,6 +684,76 @@ MACHINE_METADATA: Dict[str, Dict[str, Any]] = {
 	"dumbbell": {"display": "Dumbbell", "muscles": [], "video": "", "image": ""},
 }
 
+# Muscle lists are stored de-duplicated (order kept) so readers never need to re-check
+for _meta in MACHINE_METADATA.values():
+	_meta["muscles"] = list(dict.fromkeys(_meta.get("muscles", [])))
+del _meta
+
+# Per-key lookups for the gym dashboard reducers (MACHINE_METADATA is static)
+_DISPLAY_BY_KEY: Dict[str, str] = {k: str(v.get("display") or k) for k, v in MACHINE_METADATA.items()}
+_MUSCLES_BY_KEY: Dict[str, List[str]] = {k: normalize_muscles(v["muscles"]) for k, v in MACHINE_METADATA.items()}
+_CARDIO_KEYS = frozenset(
+	k for k, v in MACHINE_METADATA.items()
+	if any(m.lower() == "cardio" for m in v["muscles"] if isinstance(m, str))
+)
+_KNOWN_DISPLAYS = frozenset(v.get("display") for v in MACHINE_METADATA.values())
+
+# Indexes for matching AI-generated exercises to MACHINE_METADATA (first key in dict order wins)
+_KEY_LC: Dict[str, str] = {}
+_DISPLAY_LC: Dict[str, str] = {}
+for _key, _meta in MACHINE_METADATA.items():
+	_KEY_LC.setdefault(_key.lower(), _key)
+	_DISPLAY_LC.setdefault(str(_meta.get("display", "")).lower().strip(), _key)
+del _key, _meta
+_DISPLAYS_LC: List[tuple] = [(k, str(v.get("display", "")).lower()) for k, v in MACHINE_METADATA.items()]
+# All lower-cased display names in one string, so "display contained in a name" is a single str.find
+_DISPLAY_HAYSTACK = "\n".join(d for _, d in _DISPLAYS_LC)
+_DISPLAY_OFFSETS: List[int] = []
+_offset = 0
+for _, _display in _DISPLAYS_LC:
+	_DISPLAY_OFFSETS.append(_offset)
+	_offset += len(_display) + 1
+del _offset, _display
+_KEYS_SPACED: List[tuple] = [(k, k.lower().replace("_", " ")) for k in MACHINE_METADATA]
+
+
+def _match_exercise_key(key: str, display: str) -> Optional[str]:
+	"""Resolve an AI-suggested exercise to a MACHINE_METADATA key: exact key, exact display, display substring, then key parts."""
+	display_lower = display.lower()
+	meta_key = _KEY_LC.get(key) or _DISPLAY_LC.get(display_lower)
+	if meta_key:
+		return meta_key
+
+	# Fuzzy: the display names contain each other
+	if display and len(display_lower) > 3:
+		if "\n" in display_lower:
+			# The joined haystack cannot be searched for a name with a newline; scan the names directly
+			for candidate, meta_display in _DISPLAYS_LC:
+				if display_lower in meta_display or meta_display in display_lower:
+					return candidate
+			return _match_key_parts(key)
+		pos = _DISPLAY_HAYSTACK.find(display_lower)
+		first_hit = bisect.bisect_right(_DISPLAY_OFFSETS, pos) - 1 if pos >= 0 else len(_DISPLAYS_LC)
+		# An earlier name contained in the display still wins, as in dict order
+		for candidate, meta_display in _DISPLAYS_LC[:first_hit]:
+			if meta_display in display_lower:
+				return candidate
+		if first_hit < len(_DISPLAYS_LC):
+			return _DISPLAYS_LC[first_hit][0]
+
+	return _match_key_parts(key)
+
+
+def _match_key_parts(key: str) -> Optional[str]:
+	"""First MACHINE_METADATA key (dict order) containing every part of `key` longer than 2 characters."""
+	if not key:
+		return None
+	key_parts = [part for part in key.replace("_", " ").split() if len(part) > 2]
+	for candidate, key_spaced in _KEYS_SPACED:
+		if all(part in key_spaced for part in key_parts):
+			return candidate
+	return None
+
 # Map normalized model output labels to our canonical keys above
 ALIASES: Dict[str, str] = {
 	# Chest
@@ -548,7 +963,7 @@ def init_db():
 	# verification_codes table removed - using Supabase for email verification
 	conn.commit()
 	conn.close()
-	print("[INFO] Database initialized")
+	log.info("Database initialized")
 
 
 def get_db_connection():
@@ -612,8 +1027,8 @@ def login():
 		return redirect(url_for("index"))
 	# Load Supabase config from environment variables (safe to expose - these are public anon keys)
 	# Ensure we always pass strings, never None
-	supabase_url = os.getenv("SUPABASE_URL") or ""
-	supabase_anon_key = os.getenv("SUPABASE_ANON_KEY") or ""
+	supabase_url = SUPABASE_URL or ""
+	supabase_anon_key = SUPABASE_ANON_KEY or ""
 	return render_template("login.html", SUPABASE_URL=supabase_url, SUPABASE_ANON_KEY=supabase_anon_key)
 
 
@@ -624,8 +1039,8 @@ def register():
 		return redirect(url_for("index"))
 	# Load Supabase config from environment variables (safe to expose - these are public anon keys)
 	# Ensure we always pass strings, never None
-	supabase_url = os.getenv("SUPABASE_URL") or ""
-	supabase_anon_key = os.getenv("SUPABASE_ANON_KEY") or ""
+	supabase_url = SUPABASE_URL or ""
+	supabase_anon_key = SUPABASE_ANON_KEY or ""
 	return render_template("register.html", SUPABASE_URL=supabase_url, SUPABASE_ANON_KEY=supabase_anon_key)
 
 
@@ -704,9 +1119,6 @@ def list_gym_accounts():
 	List all gym accounts for admin panel.
 	Only accessible by admin users.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -722,22 +1134,17 @@ def list_gym_accounts():
 		access_token = auth_header.replace("Bearer ", "").strip()
 		
 		try:
-			SUPABASE_URL = os.getenv("SUPABASE_URL")
-			SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-			SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-			
-			if not SUPABASE_URL or not SUPABASE_ANON_KEY or not SUPABASE_SERVICE_ROLE_KEY:
+			if not SUPABASE_CONFIGURED:
 				return jsonify({"error": "Supabase configuration missing"}), 500
 			
 			# Verify user
-			supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-			user_response = supabase_client.auth.get_user(access_token)
+			user = _verify_token(access_token)
 			
-			if not user_response.user:
+			if not user:
 				return jsonify({"error": "Invalid token"}), 401
 			
 			# Check if user is admin (by ID or email)
-			if not is_admin_user(user_response.user.id, user_response.user.email):
+			if not is_admin_user(user.id, user.email):
 				return jsonify({"error": "Admin access required"}), 403
 		except Exception as e:
 			return jsonify({"error": "Authentication error: " + str(e)}), 401
@@ -745,40 +1152,32 @@ def list_gym_accounts():
 	# Get all gym accounts (always execute, even when skip_auth is True)
 	# SIMPLIFIED: Just return empty list if there's any issue - don't hang
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-			print("[ADMIN] Supabase config missing - returning empty list")
+			log.debug("[ADMIN] Supabase config missing - returning empty list")
 			return jsonify({"accounts": []}), 200
 		
-		print("[ADMIN] Fetching gym accounts from Supabase...")
+		log.debug("[ADMIN] Fetching gym accounts from Supabase...")
 		
 		# Use direct REST API call instead of Python client (more reliable)
 		users_list = []
 		
 		try:
 			# Direct REST API call to Supabase Admin API
-			auth_url = f"{SUPABASE_URL}/auth/v1/admin/users"
-			headers = {
-				"apikey": SUPABASE_SERVICE_ROLE_KEY,
-				"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-				"Content-Type": "application/json"
-			}
+			auth_url, _, headers = _supabase_admin_rest(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 			
-			print(f"[ADMIN] Calling Supabase REST API: {auth_url}")
-			response = requests.get(auth_url, headers=headers, timeout=10)
+			log.debug("[ADMIN] Calling Supabase REST API: %s", auth_url)
+			response = _SUPA_SESSION.get(auth_url, headers=headers, timeout=10)
 			
 			if response.status_code == 200:
 				data = response.json()
 				# Supabase returns users in a 'users' array
 				users_list = data.get('users', [])
-				print(f"[ADMIN] REST API returned {len(users_list)} users")
+				log.debug("[ADMIN] REST API returned %s users", len(users_list))
 			else:
-				print(f"[ADMIN] REST API error: {response.status_code} - {response.text}")
+				log.warning("[ADMIN] REST API error: %s - %s", response.status_code, response.text)
 				# Fallback to Python client
-				print("[ADMIN] Falling back to Python client...")
-				admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+				log.debug("[ADMIN] Falling back to Python client...")
+				admin_client = _get_admin_client()
 				all_users = admin_client.auth.admin.list_users()
 				
 				# Try to extract users from response
@@ -790,26 +1189,24 @@ def list_gym_accounts():
 					users_list = all_users.get('users', []) or all_users.get('data', [])
 				
 		except requests.exceptions.RequestException as e:
-			print(f"[ADMIN] REST API request failed: {e}")
+			log.warning("[ADMIN] REST API request failed: %s", e)
 			# Fallback to Python client
 			try:
-				admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+				admin_client = _get_admin_client()
 				all_users = admin_client.auth.admin.list_users()
 				if hasattr(all_users, 'users'):
 					users_list = all_users.users
 				elif hasattr(all_users, 'data'):
 					users_list = all_users.data
 			except Exception as client_error:
-				print(f"[ADMIN] Python client also failed: {client_error}")
+				log.warning("[ADMIN] Python client also failed: %s", client_error)
 				return jsonify({"accounts": []}), 200
 		except Exception as e:
-			print(f"[ADMIN] Error fetching users: {e}")
-			import traceback
-			traceback.print_exc()
+			_log_exception("[ADMIN] Error fetching users: %s", e)
 			return jsonify({"accounts": []}), 200
 		
 		# Log alleen een geaggregeerde samenvatting, geen volledige usergegevens
-		print(f"[ADMIN] Found {len(users_list)} total users (summary only, no PII)")
+		log.debug("[ADMIN] Found %s total users (summary only, no PII)", len(users_list))
 		
 		# Eventueel kun je hier in de toekomst een volledig anonieme samenvatting toevoegen
 		# (bijvoorbeeld aantallen gym-accounts), maar log geen ruwe metadata meer.
@@ -851,17 +1248,17 @@ def list_gym_accounts():
 				
 				# Beperk logging: geen volledige metadata of e-mails meer loggen
 				if is_gym or idx < 10:  # Alleen beperkte, geanonimiseerde info
-					safe_user_id = str(user_id)[:8] if user_id else "unknown"
-					print(
-						f"[ADMIN] User id_prefix={safe_user_id}: "
-						f"is_gym_account={is_gym}, has_metadata={bool(user_meta)}, "
-						f"metadata_keys={list(user_meta.keys()) if user_meta else []}"
-					)
+					if log.isEnabledFor(logging.DEBUG):
+						safe_user_id = str(user_id)[:8] if user_id else "unknown"
+						log.debug(
+							"[ADMIN] User id_prefix=%s: is_gym_account=%s, has_metadata=%s, metadata_keys=%s",
+							safe_user_id, is_gym, bool(user_meta), list(user_meta.keys()) if user_meta else [],
+						)
 					if not is_gym and user_meta:
 						# Check of er mogelijke gym-velden zijn zonder correcte flag,
 						# maar log geen volledige waarden meer.
 						if user_meta.get("gym_name") or user_meta.get("contact_name"):
-							print("[ADMIN]   WARNING: Possible gym metadata without is_gym_account flag")
+							log.warning("[ADMIN] Possible gym metadata without is_gym_account flag")
 				
 				if is_gym:
 					# Only show gym accounts that are not rejected
@@ -885,12 +1282,10 @@ def list_gym_accounts():
 					})
 			except Exception as e:
 				user_id = getattr(user, 'id', 'unknown') if hasattr(user, 'id') else (user.get('id') if isinstance(user, dict) else 'unknown')
-				print(f"[ADMIN] Error processing user {user_id}: {e}")
-				import traceback
-				traceback.print_exc()
+				_log_exception("[ADMIN] Error processing user %s: %s", user_id, e)
 				continue
 		
-		print(f"[ADMIN] Found {len(gym_accounts)} gym accounts")
+		log.debug("[ADMIN] Found %s gym accounts", len(gym_accounts))
 		
 		# Sort by created_at (newest first)
 		gym_accounts.sort(key=lambda x: x.get("created_at", ""), reverse=True)
@@ -898,7 +1293,7 @@ def list_gym_accounts():
 		return jsonify({"accounts": gym_accounts}), 200
 		
 	except Exception as e:
-		print(f"[ADMIN] Error listing gym accounts: {e}")
+		log.error("[ADMIN] Error listing gym accounts: %s", e)
 		# Don't crash - just return empty list so dashboard loads
 		return jsonify({"accounts": []}), 200
 
@@ -909,9 +1304,6 @@ def approve_gym_account(user_id: str):
 	Approve a gym account (set is_verified = true).
 	Only accessible by admin users.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -928,35 +1320,27 @@ def approve_gym_account(user_id: str):
 		access_token = auth_header.replace("Bearer ", "").strip()
 		
 		try:
-			SUPABASE_URL = os.getenv("SUPABASE_URL")
-			SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-			SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-			
 			if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 				return jsonify({"error": "Supabase configuration missing"}), 500
 			
 			# Verify user
-			supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-			user_response = supabase_client.auth.get_user(access_token)
+			user = _verify_token(access_token)
 			
-			if not user_response.user:
+			if not user:
 				return jsonify({"error": "Invalid token"}), 401
 			
 			# Check if user is admin (by ID or email)
-			if not is_admin_user(user_response.user.id, user_response.user.email):
+			if not is_admin_user(user.id, user.email):
 				return jsonify({"error": "Admin access required"}), 403
 		except Exception as e:
 			return jsonify({"error": "Authentication error: " + str(e)}), 401
 	
 	# Update gym account (always execute, even when skip_auth is True)
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 		user_to_update = admin_client.auth.admin.get_user_by_id(user_id)
 		
 		if not user_to_update.user:
@@ -969,35 +1353,31 @@ def approve_gym_account(user_id: str):
 		# Update metadata - set is_verified to True
 		updated_metadata = {**user_meta, "is_verified": True}
 		
-		print(f"[ADMIN APPROVE] Updating user {user_id} metadata: is_verified=True")
+		log.debug("[ADMIN APPROVE] Updating user %s metadata: is_verified=True", user_id)
 		
 		# Use direct REST API call for more reliable updates
 		try:
-			auth_url = f"{SUPABASE_URL}/auth/v1/admin/users/{user_id}"
-			headers = {
-				"apikey": SUPABASE_SERVICE_ROLE_KEY,
-				"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-				"Content-Type": "application/json"
-			}
+			_, user_url_template, headers = _supabase_admin_rest(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+			auth_url = user_url_template.format(user_id)
 			
 			update_data = {"user_metadata": updated_metadata}
-			response = requests.put(auth_url, headers=headers, json=update_data, timeout=10)
+			response = _SUPA_SESSION.put(auth_url, headers=headers, json=update_data, timeout=10)
 			
 			if response.status_code == 200:
-				print(f"[ADMIN APPROVE] REST API update successful for user {user_id}")
+				log.info("[ADMIN APPROVE] REST API update successful for user %s", user_id)
 			else:
-				print(f"[ADMIN APPROVE] REST API error: {response.status_code} - {response.text}")
+				log.warning("[ADMIN APPROVE] REST API error: %s - %s", response.status_code, response.text)
 				# Fallback to Python client
 				update_response = admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
 				if hasattr(update_response, 'error') and update_response.error:
-					print(f"[ADMIN APPROVE] Python client also failed: {update_response.error}")
+					log.warning("[ADMIN APPROVE] Python client also failed: %s", update_response.error)
 					return jsonify({"error": f"Failed to update metadata: {update_response.error}"}), 500
 		except requests.exceptions.RequestException as e:
-			print(f"[ADMIN APPROVE] REST API request failed: {e}")
+			log.warning("[ADMIN APPROVE] REST API request failed: %s", e)
 			# Fallback to Python client
 			update_response = admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
 			if hasattr(update_response, 'error') and update_response.error:
-				print(f"[ADMIN APPROVE] Python client also failed: {update_response.error}")
+				log.warning("[ADMIN APPROVE] Python client also failed: %s", update_response.error)
 				return jsonify({"error": f"Failed to update metadata: {update_response.error}"}), 500
 		
 		# Verify the update worked
@@ -1006,18 +1386,16 @@ def approve_gym_account(user_id: str):
 			if verify_user and verify_user.user:
 				verify_meta = verify_user.user.user_metadata or {}
 				if verify_meta.get("is_verified") != True:
-					print(f"[ADMIN APPROVE] WARNING: Metadata update may have failed. is_verified is still: {verify_meta.get('is_verified')}")
+					log.warning("[ADMIN APPROVE] Metadata update may have failed. is_verified is still: %s", verify_meta.get('is_verified'))
 				else:
-					print(f"[ADMIN APPROVE] Successfully approved gym account {user_id}")
+					log.info("[ADMIN APPROVE] Successfully approved gym account %s", user_id)
 		except Exception as verify_error:
-			print(f"[ADMIN APPROVE] Error verifying update: {verify_error}")
+			log.error("[ADMIN APPROVE] Error verifying update: %s", verify_error)
 		
 		return jsonify({"success": True, "message": "Gym account approved"}), 200
 		
 	except Exception as e:
-		print(f"[ADMIN] Error approving gym account: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[ADMIN] Error approving gym account: %s", e)
 		return jsonify({"error": f"Failed to approve gym account: {str(e)}"}), 500
 
 
@@ -1027,9 +1405,6 @@ def reject_gym_account(user_id: str):
 	Reject a gym account (set is_verified = false).
 	Only accessible by admin users.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -1046,96 +1421,106 @@ def reject_gym_account(user_id: str):
 		access_token = auth_header.replace("Bearer ", "").strip()
 		
 		try:
-			SUPABASE_URL = os.getenv("SUPABASE_URL")
-			SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-			SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-			
 			if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 				return jsonify({"error": "Supabase configuration missing"}), 500
 			
 			# Verify user
-			supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-			user_response = supabase_client.auth.get_user(access_token)
+			user = _verify_token(access_token)
 			
-			if not user_response.user:
+			if not user:
 				return jsonify({"error": "Invalid token"}), 401
 			
 			# Check if user is admin (by ID or email)
-			if not is_admin_user(user_response.user.id, user_response.user.email):
+			if not is_admin_user(user.id, user.email):
 				return jsonify({"error": "Admin access required"}), 403
 		except Exception as e:
 			return jsonify({"error": "Authentication error: " + str(e)}), 401
 	
 	# Update gym account (always execute, even when skip_auth is True)
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-		user_to_update = admin_client.auth.admin.get_user_by_id(user_id)
-		
-		if not user_to_update.user:
-			return jsonify({"error": "Gym account not found"}), 404
-		
-		user_meta = user_to_update.user.user_metadata or {}
-		if user_meta.get("is_gym_account") != True:
-			return jsonify({"error": "User is not a gym account"}), 400
-		
-		# Update metadata - mark as rejected (this will remove it from the admin list)
-		updated_metadata = {**user_meta, "is_verified": False, "is_rejected": True}
-		
-		print(f"[ADMIN REJECT] Updating user {user_id} metadata: is_verified=False, is_rejected=True")
-		
-		# Use direct REST API call for more reliable updates
-		try:
-			auth_url = f"{SUPABASE_URL}/auth/v1/admin/users/{user_id}"
-			headers = {
-				"apikey": SUPABASE_SERVICE_ROLE_KEY,
-				"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-				"Content-Type": "application/json"
-			}
+		admin_client = _get_admin_client()
+		saved_meta: Optional[Dict[str, Any]] = None
+		
+		# Merge the flags server-side in one round-trip when the RPC is installed
+		merged = _admin_merge_user_meta(admin_client, user_id, {"is_verified": False, "is_rejected": True})
+		if merged is not None:
+			status, saved_meta = merged
+			if status == "not_found":
+				return jsonify({"error": "Gym account not found"}), 404
+			if status == "not_gym_account":
+				return jsonify({"error": "User is not a gym account"}), 400
+			log.debug("[ADMIN REJECT] Merged is_verified=False, is_rejected=True for user %s", user_id)
+		else:
+			user_to_update = admin_client.auth.admin.get_user_by_id(user_id)
 			
-			update_data = {"user_metadata": updated_metadata}
-			response = requests.put(auth_url, headers=headers, json=update_data, timeout=10)
+			if not user_to_update.user:
+				return jsonify({"error": "Gym account not found"}), 404
 			
-			if response.status_code == 200:
-				print(f"[ADMIN REJECT] REST API update successful for user {user_id}")
-			else:
-				print(f"[ADMIN REJECT] REST API error: {response.status_code} - {response.text}")
+			user_meta = user_to_update.user.user_metadata or {}
+			if user_meta.get("is_gym_account") != True:
+				return jsonify({"error": "User is not a gym account"}), 400
+			
+			# Update metadata - mark as rejected (this will remove it from the admin list)
+			updated_metadata = {**user_meta, "is_verified": False, "is_rejected": True}
+			
+			log.debug("[ADMIN REJECT] Updating user %s metadata: is_verified=False, is_rejected=True", user_id)
+			
+			# Use direct REST API call for more reliable updates
+			try:
+				_, user_url_template, headers = _supabase_admin_rest(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+				auth_url = user_url_template.format(user_id)
+				
+				update_data = {"user_metadata": updated_metadata}
+				response = _SUPA_SESSION.put(auth_url, headers=headers, json=update_data, timeout=10)
+				
+				if response.status_code == 200:
+					log.info("[ADMIN REJECT] REST API update successful for user %s", user_id)
+					# The PUT response already contains the updated user
+					try:
+						saved_meta = (response.json() or {}).get("user_metadata")
+					except ValueError:
+						saved_meta = None
+				else:
+					log.warning("[ADMIN REJECT] REST API error: %s - %s", response.status_code, response.text)
+					# Fallback to Python client
+					update_response = admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
+					if hasattr(update_response, 'error') and update_response.error:
+						log.warning("[ADMIN REJECT] Python client also failed: %s", update_response.error)
+						return jsonify({"error": f"Failed to update metadata: {update_response.error}"}), 500
+					if getattr(update_response, "user", None):
+						saved_meta = update_response.user.user_metadata
+			except requests.exceptions.RequestException as e:
+				log.warning("[ADMIN REJECT] REST API request failed: %s", e)
 				# Fallback to Python client
 				update_response = admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
 				if hasattr(update_response, 'error') and update_response.error:
-					print(f"[ADMIN REJECT] Python client also failed: {update_response.error}")
+					log.warning("[ADMIN REJECT] Python client also failed: %s", update_response.error)
 					return jsonify({"error": f"Failed to update metadata: {update_response.error}"}), 500
-		except requests.exceptions.RequestException as e:
-			print(f"[ADMIN REJECT] REST API request failed: {e}")
-			# Fallback to Python client
-			update_response = admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
-			if hasattr(update_response, 'error') and update_response.error:
-				print(f"[ADMIN REJECT] Python client also failed: {update_response.error}")
-				return jsonify({"error": f"Failed to update metadata: {update_response.error}"}), 500
+				if getattr(update_response, "user", None):
+					saved_meta = update_response.user.user_metadata
 		
-		# Verify the update worked
-		try:
-			verify_user = admin_client.auth.admin.get_user_by_id(user_id)
-			if verify_user and verify_user.user:
-				verify_meta = verify_user.user.user_metadata or {}
-				if verify_meta.get("is_verified") != False:
-					print(f"[ADMIN REJECT] WARNING: Metadata update may have failed. is_verified is still: {verify_meta.get('is_verified')}")
-				else:
-					print(f"[ADMIN REJECT] Successfully rejected gym account {user_id}")
-		except Exception as verify_error:
-			print(f"[ADMIN REJECT] Error verifying update: {verify_error}")
+		# Re-reading the user costs an extra round-trip; only do it when debugging
+		if DEBUG_ADMIN_VERIFY:
+			try:
+				verify_user = admin_client.auth.admin.get_user_by_id(user_id)
+				if verify_user and verify_user.user:
+					saved_meta = verify_user.user.user_metadata
+			except Exception as verify_error:
+				log.error("[ADMIN REJECT] Error verifying update: %s", verify_error)
+		
+		if saved_meta is not None:
+			if (saved_meta or {}).get("is_verified") != False:
+				log.warning("[ADMIN REJECT] Metadata update may have failed. is_verified is still: %s", saved_meta.get('is_verified'))
+			else:
+				log.info("[ADMIN REJECT] Successfully rejected gym account %s", user_id)
 		
 		return jsonify({"success": True, "message": "Gym account rejected"}), 200
 		
 	except Exception as e:
-		print(f"[ADMIN] Error rejecting gym account: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[ADMIN] Error rejecting gym account: %s", e)
 		return jsonify({"error": f"Failed to reject gym account: {str(e)}"}), 500
 
 
@@ -1145,9 +1530,6 @@ def toggle_premium_gym_account(user_id: str):
 	Toggle premium status for a gym account.
 	Only accessible by admin users.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -1164,57 +1546,57 @@ def toggle_premium_gym_account(user_id: str):
 		access_token = auth_header.replace("Bearer ", "").strip()
 		
 		try:
-			SUPABASE_URL = os.getenv("SUPABASE_URL")
-			SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-			SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-			
 			if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 				return jsonify({"error": "Supabase configuration missing"}), 500
 			
 			# Verify user
-			supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-			user_response = supabase_client.auth.get_user(access_token)
+			user = _verify_token(access_token)
 			
-			if not user_response.user:
+			if not user:
 				return jsonify({"error": "Invalid token"}), 401
 			
 			# Check if user is admin (by ID or email)
-			if not is_admin_user(user_response.user.id, user_response.user.email):
+			if not is_admin_user(user.id, user.email):
 				return jsonify({"error": "Admin access required"}), 403
 		except Exception as e:
 			return jsonify({"error": "Authentication error: " + str(e)}), 401
 	
 	# Get request data and update gym account (always execute, even when skip_auth is True)
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
 		data = request.get_json() or {}
 		is_premium = data.get("is_premium", False) == True
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-		user_to_update = admin_client.auth.admin.get_user_by_id(user_id)
-		
-		if not user_to_update.user:
-			return jsonify({"error": "Gym account not found"}), 404
-		
-		user_meta = user_to_update.user.user_metadata or {}
-		if user_meta.get("is_gym_account") != True:
-			return jsonify({"error": "User is not a gym account"}), 400
+		admin_client = _get_admin_client()
 		
-		# Update metadata
-		updated_metadata = {**user_meta, "is_premium": is_premium}
-		admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
+		# Merge the flag server-side in one round-trip when the RPC is installed
+		merged = _admin_merge_user_meta(admin_client, user_id, {"is_premium": is_premium})
+		if merged is not None:
+			status, _ = merged
+			if status == "not_found":
+				return jsonify({"error": "Gym account not found"}), 404
+			if status == "not_gym_account":
+				return jsonify({"error": "User is not a gym account"}), 400
+		else:
+			user_to_update = admin_client.auth.admin.get_user_by_id(user_id)
+			
+			if not user_to_update.user:
+				return jsonify({"error": "Gym account not found"}), 404
+			
+			user_meta = user_to_update.user.user_metadata or {}
+			if user_meta.get("is_gym_account") != True:
+				return jsonify({"error": "User is not a gym account"}), 400
+			
+			# Update metadata
+			updated_metadata = {**user_meta, "is_premium": is_premium}
+			admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
 		
 		return jsonify({"success": True, "message": f"Premium status {'enabled' if is_premium else 'disabled'}"}), 200
 		
 	except Exception as e:
-		print(f"[ADMIN] Error toggling premium: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[ADMIN] Error toggling premium: %s", e)
 		return jsonify({"error": f"Failed to update premium status: {str(e)}"}), 500
 
 
@@ -1225,9 +1607,6 @@ def list_all_exercises():
 	Shows exercise name, usage count, and whether it's a custom exercise.
 	Only accessible by admin users.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -1255,13 +1634,10 @@ def list_all_exercises():
 			return jsonify({"error": "Authentication error: " + str(e)}), 401
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 		
 		# Get all workouts with exercises
 		result = admin_client.table("workouts").select("exercises").execute()
@@ -1340,9 +1716,7 @@ def list_all_exercises():
 		}), 200
 		
 	except Exception as e:
-		print(f"[ADMIN] Error listing exercises: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[ADMIN] Error listing exercises: %s", e)
 		return jsonify({"error": f"Failed to list exercises: {str(e)}"}), 500
 
 
@@ -1386,28 +1760,39 @@ def get_user():
 	if not access_token:
 		return jsonify({"error": "Missing access token"}), 401
 	
-	# Initialize Supabase client - load from environment variables only
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
+	# Fast path: a token signed with the project's JWT secret already carries the user's claims,
+	# so no Supabase Auth round-trip is needed and unchanged tokens can be answered with a 304
+	claims = _verify_jwt_locally(access_token)
+	if claims:
+		response = jsonify({
+			"id": claims["sub"],
+			"email": claims.get("email"),
+			"user_metadata": claims.get("user_metadata") or {},
+			"authenticated": True
+		})
+		response.set_etag(claims.get("jti") or hashlib.blake2b(access_token.encode("utf-8"), digest_size=8).hexdigest())
+		response.cache_control.private = True
+		response.cache_control.no_cache = True
+		response.vary.add("Authorization")
+		return response.make_conditional(request)
 	
 	if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 		return jsonify({"error": "Supabase configuration missing. Set SUPABASE_URL and SUPABASE_ANON_KEY environment variables."}), 500
 	
 	try:
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		user = _verify_token(access_token)
 		
-		if user_response.user:
+		if user:
 			return jsonify({
-				"id": user_response.user.id,
-				"email": user_response.user.email,
-				"user_metadata": user_response.user.user_metadata or {},
+				"id": user.id,
+				"email": user.email,
+				"user_metadata": user.user_metadata or {},
 				"authenticated": True
 			})
 		else:
 			return jsonify({"error": "Invalid token"}), 401
 	except Exception as e:
-		print(f"Error verifying user: {e}")
+		log.warning("Error verifying user: %s", e)
 		return jsonify({"error": "Failed to verify user", "details": str(e)}), 401
 
 
@@ -1418,22 +1803,18 @@ def delete_account():
 	if not access_token:
 		return jsonify({"error": "Authentication required"}), 401
 	
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	# Use service role key for admin operations (deleting users)
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-	
 	if not SUPABASE_URL:
 		return jsonify({"error": "Supabase configuration missing"}), 500
 	
 	# If service role key is not available, use anon key (less secure but works for self-deletion)
-	SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or os.getenv("SUPABASE_ANON_KEY")
+	SUPABASE_KEY = SUPABASE_SERVICE_ROLE_KEY or SUPABASE_ANON_KEY
 	
 	if not SUPABASE_KEY:
 		return jsonify({"error": "Supabase key missing"}), 500
 	
 	try:
 		# First verify the user
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+		supabase_client = _shared_supabase_client(SUPABASE_URL, SUPABASE_KEY)
 		user_response = supabase_client.auth.get_user(access_token)
 		
 		if not user_response.user:
@@ -1443,36 +1824,35 @@ def delete_account():
 		
 		# Delete user using admin API (requires service role key)
 		if SUPABASE_SERVICE_ROLE_KEY:
-			print(f"[DELETE ACCOUNT] Attempting to delete user {user_id} using service role key")
-			admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+			log.debug("[DELETE ACCOUNT] Attempting to delete user %s using service role key", user_id)
+			admin_client = _get_admin_client()
 			
 			try:
 				# Delete user from auth.users (this will cascade delete from other tables due to ON DELETE CASCADE)
 				delete_response = admin_client.auth.admin.delete_user(user_id)
+				_forget_token(access_token)
 				
-				print(f"[DELETE ACCOUNT] Delete response type: {type(delete_response)}")
-				print(f"[DELETE ACCOUNT] Delete response: {delete_response}")
+				log.debug("[DELETE ACCOUNT] Delete response type: %s", type(delete_response))
+				log.debug("[DELETE ACCOUNT] Delete response: %s", delete_response)
 				
 				# Supabase Python client returns a response object
 				# Check if it's a successful response (no error attribute or error is None)
 				if hasattr(delete_response, 'error'):
 					if delete_response.error is not None:
 						error_msg = str(delete_response.error)
-						print(f"[DELETE ACCOUNT] Error: {error_msg}")
+						log.error("[DELETE ACCOUNT] Error: %s", error_msg)
 						return jsonify({"error": f"Failed to delete account: {error_msg}"}), 500
 					else:
 						# No error, success
-						print(f"[DELETE ACCOUNT] Successfully deleted user {user_id}")
+						log.info("[DELETE ACCOUNT] Successfully deleted user %s", user_id)
 						return jsonify({"success": True, "message": "Account deleted successfully"}), 200
 				else:
 					# Response doesn't have error attribute, assume success
-					print(f"[DELETE ACCOUNT] Successfully deleted user {user_id} (no error attribute)")
+					log.info("[DELETE ACCOUNT] Successfully deleted user %s (no error attribute)", user_id)
 					return jsonify({"success": True, "message": "Account deleted successfully"}), 200
 					
 			except Exception as delete_error:
-				print(f"[DELETE ACCOUNT] Exception during delete: {delete_error}")
-				import traceback
-				traceback.print_exc()
+				_log_exception("[DELETE ACCOUNT] Exception during delete: %s", delete_error)
 				return jsonify({"error": f"Failed to delete account: {str(delete_error)}"}), 500
 		else:
 			# Fallback: Return instructions if service role key is not configured
@@ -1482,9 +1862,7 @@ def delete_account():
 			}), 501
 			
 	except Exception as e:
-		print(f"Error deleting account: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Error deleting account: %s", e)
 		return jsonify({"error": f"Failed to delete account: {str(e)}"}), 500
 
 
@@ -1495,8 +1873,8 @@ def index():
 	"""Main app page - authentication handled by frontend."""
 	# Load Supabase config from environment variables (safe to expose - these are public anon keys)
 	# Ensure we always pass strings, never None
-	supabase_url = os.getenv("SUPABASE_URL") or ""
-	supabase_anon_key = os.getenv("SUPABASE_ANON_KEY") or ""
+	supabase_url = SUPABASE_URL or ""
+	supabase_anon_key = SUPABASE_ANON_KEY or ""
 	return render_template("index.html", SUPABASE_URL=supabase_url, SUPABASE_ANON_KEY=supabase_anon_key)
 
 
@@ -1512,42 +1890,54 @@ def support():
 	return render_template("support.html")
 
 
+# Static icons ship with the app, so clients may cache them for a day (ETag revalidation after)
+_STATIC_ASSET_MAX_AGE = 86400
+
+
+@lru_cache(maxsize=32)
+def _first_existing_app_file(candidates: tuple) -> Optional[str]:
+	for filename in candidates:
+		if (APP_ROOT / filename).exists():
+			return filename
+	return None
+
+
+def _send_app_asset(filename: str):
+	return send_from_directory(str(APP_ROOT), filename, max_age=_STATIC_ASSET_MAX_AGE, conditional=True)
+
+
 @app.route("/logo.png")
 def logo():
 	# Prefer the new logo filename; fall back to the old one
-	candidates = [
+	filename = _first_existing_app_file((
 		"gymvision-removebg-preview.png",
 		"GymVision_AI-removebg-preview.png",
-	]
-	for filename in candidates:
-		path = APP_ROOT / filename
-		if path.exists():
-			return send_from_directory(str(APP_ROOT), filename)
+	))
+	if filename:
+		return _send_app_asset(filename)
 	return ("", 204)
 
 
 @app.route("/flame.png")
 def flame():
     # Serve user-provided flame icon
-    candidates = [
+    filename = _first_existing_app_file((
         "flame-removebg-preview.png",
-    ]
-    for filename in candidates:
-        path = APP_ROOT / filename
-        if path.exists():
-            return send_from_directory(str(APP_ROOT), filename)
+    ))
+    if filename:
+        return _send_app_asset(filename)
     return ("", 204)
 
 
 @app.route("/loupe.png")
 def loupe_icon():
 	"""Serve the loupe icon used for the Explore tab."""
-	path = APP_ROOT / "loupe.png"
-	if path.exists():
-		return send_from_directory(str(APP_ROOT), "loupe.png")
+	if _first_existing_app_file(("loupe.png",)):
+		return _send_app_asset("loupe.png")
 	return ("", 204)
 
 
+@lru_cache(maxsize=512)
 def resolve_image_path(filename: str) -> Optional[Path]:
 	for directory in IMAGES_PATHS:
 		candidate = directory / filename
@@ -1564,8 +1954,12 @@ def image_url_for_key(key: str, meta: Optional[Dict[str, Any]] = None) -> Option
 	if not key:
 		return None
 	meta = meta or MACHINE_METADATA.get(key, {})
+	return _image_url_for(key, meta.get("display") or None)
+
+
+@lru_cache(maxsize=2048)
+def _image_url_for(key: str, display_name: Optional[str]) -> Optional[str]:
 	candidates: List[str] = []
-	display_name = meta.get("display")
 	if display_name:
 		candidates.append(_slugify_for_image(display_name))
 	candidates.append(_slugify_for_image(key.replace("_", " ")))
@@ -1577,19 +1971,15 @@ def image_url_for_key(key: str, meta: Optional[Dict[str, Any]] = None) -> Option
 			seen.add(candidate)
 			unique_candidates.append(candidate)
 	for base in unique_candidates:
-		for ext in IMAGE_FILE_EXTENSIONS:
-			filename = f"{base}{ext}"
-			if resolve_image_path(filename):
-				return f"/images/{filename}"
+		url = IMAGE_URLS_BY_BASENAME.get(base)
+		if url:
+			return url
 	# Fallback to fuzzy match
 	target = unique_candidates[0] if unique_candidates else _slugify_for_image(key)
 	if target:
 		match = next(iter(get_close_matches(target, IMAGE_BASENAMES, n=1, cutoff=0.87)), None)
 		if match:
-			for ext in IMAGE_FILE_EXTENSIONS:
-				filename = f"{match}{ext}"
-				if resolve_image_path(filename):
-					return f"/images/{filename}"
+			return IMAGE_URLS_BY_BASENAME.get(match)
 	return None
 
 
@@ -1598,16 +1988,15 @@ def custom_image(filename: str):
     file_path = resolve_image_path(filename)
     if not file_path:
         return ("", 404)
-    return send_from_directory(str(file_path.parent), file_path.name)
+    return send_from_directory(str(file_path.parent), file_path.name, max_age=_STATIC_ASSET_MAX_AGE, conditional=True)
 
 
 @app.route("/nav/<filename>")
 def nav_icon(filename):
     # Serve nav icons: home.png, settings.png, dumbell.png, progress.png
     if filename in ["home.png", "settings.png", "dumbell.png", "progress.png"]:
-        path = APP_ROOT / filename
-        if path.exists():
-            return send_from_directory(str(APP_ROOT), filename)
+        if _first_existing_app_file((filename,)):
+            return _send_app_asset(filename)
     return ("", 204)
 
 
@@ -1633,6 +2022,31 @@ def predict():
 	return jsonify({"error": "This endpoint is disabled. Models are no longer used."}), 503
 
 
+def _now_iso() -> str:
+	"""UTC timestamp for database writes, taken once per request so related rows share it."""
+	if not has_request_context():
+		return datetime.now(timezone.utc).isoformat()
+	now_iso = g.get("_now_iso")
+	if now_iso is None:
+		now_iso = g._now_iso = datetime.now(timezone.utc).isoformat()
+	return now_iso
+
+
+_current_month_cache: tuple[float, str] = (0.0, "")
+
+
+def _current_month() -> str:
+	"""Current credits month ("YYYY-MM", server local time), recomputed only when the month rolls over."""
+	global _current_month_cache
+	valid_until, month = _current_month_cache
+	if time.time() >= valid_until:
+		now = datetime.now()
+		next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+		month = now.strftime("%Y-%m")
+		_current_month_cache = (next_month.timestamp(), month)
+	return month
+
+
 def _deduct_credit_for_user(user_id: str) -> dict:
 	"""
 	Helper function to deduct 1 credit from user's account. 
@@ -1643,15 +2057,11 @@ def _deduct_credit_for_user(user_id: str) -> dict:
 		raise ValueError("Credits system not available")
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			raise ValueError("Credits system not configured")
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-		now = datetime.now()
-		current_month = now.strftime("%Y-%m")
+		admin_client = _get_admin_client()
+		current_month = _current_month()
 		
 		# Get existing credits record
 		credits_response = admin_client.table("user_credits").select("*").eq("user_id", user_id).execute()
@@ -1681,7 +2091,7 @@ def _deduct_credit_for_user(user_id: str) -> dict:
 			admin_client.table("user_credits").update({
 				"credits_remaining": credits_remaining,
 				"last_reset_month": current_month,
-				"updated_at": now.isoformat()
+				"updated_at": _now_iso()
 			}).eq("user_id", user_id).execute()
 		else:
 			# Create new record
@@ -1696,94 +2106,392 @@ def _deduct_credit_for_user(user_id: str) -> dict:
 		# Re-raise ValueError (no credits)
 		raise
 	except Exception as e:
-		print(f"[ERROR] Error deducting credit: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Error deducting credit: %s", e)
 		raise ValueError(f"Failed to deduct credit: {str(e)}")
 
 
-@app.route("/api/vision-detect", methods=["POST"])
-def vision_detect():
-	"""Chat endpoint: photo + question → AI chat response."""
-	import base64
-	
+def _reserve_credit(user_id: str, month: str) -> Optional[int]:
+	"""
+	Take one credit up front via the consume_credit RPC (ADD_CREDIT_RPCS.sql).
+	Returns the credits left, -1 if the user has none, or None if the RPC is unavailable.
+	"""
+	if not SUPABASE_AVAILABLE or not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+		return None
 	try:
-		if not OPENAI_AVAILABLE:
-			return jsonify({"success": False, "error": "OpenAI not available"}), 500
-		
-		# Get image file
-		file = request.files.get("image")
-		if not file:
-			return jsonify({"success": False, "error": "No image provided"}), 400
-		
-		# Get OpenAI API key
-		api_key = os.getenv("OPENAI_API_KEY")
-		if not api_key:
-			return jsonify({"success": False, "error": "OpenAI API key not configured"}), 500
-		
-		# Read image and encode
-		image_bytes = file.read()
-		if not image_bytes:
-			return jsonify({"success": False, "error": "Image is empty"}), 400
-		
-		image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-		
-		# Determine format
-		image_format = "jpeg"
-		if file.content_type and "png" in file.content_type:
-			image_format = "png"
-		elif file.content_type and "webp" in file.content_type:
-			image_format = "webp"
-		
-		# Get user message (optional, defaults to "welke oefening is dit?")
-		user_message = request.form.get("message", "Welke oefening is dit?")
+		admin_client = _get_admin_client()
+		response = admin_client.rpc("consume_credit", {"p_user_id": user_id, "p_month": month}).execute()
+	except Exception as e:
+		log.warning("consume_credit RPC unavailable, deducting after recognition instead: %s", e)
+		return None
+	data = response.data
+	if isinstance(data, list):
+		data = data[0] if data else None
+	try:
+		return int(data)
+	except (TypeError, ValueError):
+		return None
+
+
+def _release_credit_reservation(reserve_future: Any, user_id: str, month: str) -> None:
+	"""Refund a credit taken by _reserve_credit when the recognition did not succeed."""
+	if reserve_future is None:
+		return
+	try:
+		reserved = reserve_future.result()
+	except Exception:
+		return
+	if reserved is None or reserved < 0:
+		return
+	try:
+		admin_client = _get_admin_client()
+		admin_client.rpc("refund_credit", {"p_user_id": user_id, "p_month": month}).execute()
+	except Exception as e:
+		log.warning("Could not refund reserved credit for %s: %s", user_id, e)
+
+
+_openai_client_lock = threading.Lock()
+_openai_client: Optional[Any] = None
+_openai_client_key: Optional[str] = None
+
+
+def _get_openai_client(api_key: str) -> Any:
+	"""Return the shared OpenAI client, rebuilding it if the API key rotates."""
+	global _openai_client, _openai_client_key
+	with _openai_client_lock:
+		if _openai_client is None or _openai_client_key != api_key:
+			if HTTPX_AVAILABLE:
+				http_client = httpx.Client(
+					http2=HTTP2_AVAILABLE,
+					limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+					timeout=30.0,
+				)
+				_openai_client = OpenAI(api_key=api_key, http_client=http_client)
+			else:
+				_openai_client = OpenAI(api_key=api_key)
+			_openai_client_key = api_key
+		return _openai_client
+
+
+_GROQ_TIMEOUT_SECONDS = 60.0
+_groq_client_lock = threading.Lock()
+_groq_client: Optional[Any] = None
+_groq_client_key: Optional[str] = None
+
+
+def _get_groq_client(api_key: str) -> Any:
+	"""Return the shared Groq client, rebuilding it if the API key rotates."""
+	global _groq_client, _groq_client_key
+	with _groq_client_lock:
+		if _groq_client is None or _groq_client_key != api_key:
+			if HTTPX_AVAILABLE:
+				http_client = httpx.Client(
+					http2=HTTP2_AVAILABLE,
+					limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+					timeout=httpx.Timeout(_GROQ_TIMEOUT_SECONDS, connect=10.0),
+				)
+				_groq_client = Groq(api_key=api_key, http_client=http_client)
+			else:
+				_groq_client = Groq(api_key=api_key)
+			_groq_client_key = api_key
+		return _groq_client
+
+
+# Output budgets: a workout object with ~10 exercises fits in well under 400 tokens, and chat replies are kept concise.
+# JSON-mode calls keep the larger budget: Groq rejects a cut-off JSON-mode reply instead of returning it for repair.
+_WORKOUT_MAX_TOKENS = 400
+_WORKOUT_JSON_MAX_TOKENS = 800
+_CHAT_MAX_TOKENS = 350
+# Groq JSON mode: the reply is always one JSON object (not available together with stream=True)
+_GROQ_JSON_MODE = {"type": "json_object"}
+
+_groq_inflight: Dict[str, Future] = {}
+_groq_inflight_lock = threading.Lock()
+
+
+def _groq_completion_shared(client: Any, **kwargs: Any) -> Any:
+	"""Chat completion where identical concurrent requests share one Groq call instead of each paying for it."""
+	request_key = hashlib.blake2b(app.json.dumps(kwargs).encode("utf-8"), digest_size=16).hexdigest()
+	with _groq_inflight_lock:
+		shared = _groq_inflight.get(request_key)
+		if shared is None:
+			shared = _groq_inflight[request_key] = Future()
+			leader = True
+		else:
+			leader = False
+	if not leader:
+		# Bounded like the leader's own HTTP call, so a lost leader cannot block followers forever
+		return shared.result(timeout=_GROQ_TIMEOUT_SECONDS)
+	try:
+		response = client.chat.completions.create(**kwargs)
+		shared.set_result(response)
+		return response
+	except BaseException as e:
+		# Also on worker timeouts/interrupts, so followers are always released (with a plain error)
+		shared.set_exception(e if isinstance(e, Exception) else RuntimeError("Groq request was interrupted"))
+		raise
+	finally:
+		with _groq_inflight_lock:
+			_groq_inflight.pop(request_key, None)
+
+
+_workout_content_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_workout_content_cache_lock = threading.Lock()
+_WORKOUT_CONTENT_CACHE_MAX = 512
+
+
+def _normalize_prompt(text: Optional[str]) -> str:
+	return re.sub(r"\s+", " ", (text or "").lower()).strip()
+
+
+def _workout_cache_key(message: str, workout_context: Optional[Dict] = None, ai_reply: str = "") -> tuple:
+	"""LRU key for a workout prompt; includes the catalog version so metadata reloads miss automatically."""
+	context_key = ""
+	if workout_context:
+		context_key = hashlib.blake2b(app.json.dumps(workout_context).encode("utf-8"), digest_size=16).hexdigest()
+	return (_MACHINE_METADATA_VERSION, _normalize_prompt(message), _normalize_prompt(ai_reply), context_key)
+
+
+def _cached_workout_content(key: tuple) -> Optional[str]:
+	with _workout_content_cache_lock:
+		content = _workout_content_cache.get(key)
+		if content is not None:
+			_workout_content_cache.move_to_end(key)
+		return content
+
+
+def _store_workout_content(key: tuple, content: str) -> None:
+	"""Remember the raw AI reply for a prompt that produced a valid workout."""
+	with _workout_content_cache_lock:
+		_workout_content_cache[key] = content
+		_workout_content_cache.move_to_end(key)
+		while len(_workout_content_cache) > _WORKOUT_CONTENT_CACHE_MAX:
+			_workout_content_cache.popitem(last=False)
+
+
+def _is_json_validate_failed(e: Exception) -> bool:
+	"""True when Groq rejected a JSON-mode reply because the generated output was not valid JSON."""
+	body = getattr(e, "body", None)
+	if isinstance(body, dict):
+		error = body.get("error", body)
+		if isinstance(error, dict) and error.get("code") == "json_validate_failed":
+			return True
+	return "json_validate_failed" in str(e)
+
+
+def _groq_workout_completion(client: Any, messages: List[Dict[str, str]]) -> Any:
+	"""
+	Non-streaming workout completion in JSON mode. When Groq rejects the output
+	(json_validate_failed, e.g. a reply cut off at max_tokens), retry as a plain
+	completion so _parse_workout_content can repair the JSON locally.
+	"""
+	params = {
+		"model": "llama-3.3-70b-versatile",
+		"messages": messages,
+		"temperature": 0.3,
+		"max_tokens": _WORKOUT_JSON_MAX_TOKENS,
+	}
+	try:
+		return _groq_completion_shared(client, response_format=_GROQ_JSON_MODE, **params)
+	except Exception as e:
+		if not _is_json_validate_failed(e):
+			raise
+		log.warning("[GROQ] JSON mode reply failed validation, retrying without JSON mode: %s", e)
+		return _groq_completion_shared(client, **params)
+
+
+class CreditError(Exception):
+	"""Raised when a user has no monthly credits left for an AI call."""
+
+	def __init__(self, error: str = "no_credits", message: str = "You are out of your monthly credits", status: int = 403):
+		super().__init__(message)
+		self.error = error
+		self.message = message
+		self.status = status
+
+
+@app.errorhandler(CreditError)
+def _handle_credit_error(e: CreditError):
+	return jsonify({"success": False, "error": e.error, "message": e.message}), e.status
+
+
+def _bearer_token() -> Optional[str]:
+	auth_header = request.headers.get("Authorization")
+	if auth_header and auth_header.startswith("Bearer "):
+		return auth_header.replace("Bearer ", "").strip() or None
+	return None
+
+
+def _check_credit_or_403(access_token: Optional[str]) -> tuple[Optional[str], Optional[int]]:
+	"""
+	Resolve the user behind an access token and check their credits BEFORE an OpenAI call.
+	Returns (user_id, current_credits); either may be None when the user or credits are unknown.
+	Raises CreditError when the user is out of credits.
+	"""
+	user_id = None
+	current_credits = None
+	if not access_token or not SUPABASE_AVAILABLE:
+		return user_id, current_credits
+	try:
+		if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+			return user_id, current_credits
+		
+		# Start the credit lookup for the token's subject while the token is verified
+		token_sub = _unverified_jwt_sub(access_token)
+		credits_future = None
+		if token_sub and SUPABASE_SERVICE_ROLE_KEY:
+			admin_client = _get_admin_client()
+			credits_future = _IO_EXECUTOR.submit(
+				admin_client.table("user_credits").select("*").eq("user_id", token_sub).execute
+			)
+		
+		# Tokens signed with the project's JWT secret are verified without calling Supabase Auth
+		local_claims = _verify_jwt_locally(access_token)
+		if local_claims:
+			user_id = local_claims["sub"]
+		else:
+			user = _verify_token(access_token)
+			if user:
+				user_id = user.id
+	except Exception as e:
+		log.warning("Could not get user ID for credit deduction: %s", e)
+		return None, None
+	
+	if not user_id or not SUPABASE_SERVICE_ROLE_KEY:
+		return user_id, current_credits
+	
+	try:
+		current_month = _current_month()
+		# Only trust the prefetched row once the verified id matches the claim
+		if credits_future is not None and token_sub == user_id:
+			credits_response = credits_future.result()
+		else:
+			admin_client = _get_admin_client()
+			credits_response = admin_client.table("user_credits").select("*").eq("user_id", user_id).execute()
+		
+		current_credits = 10  # Default if no record
+		if credits_response.data and len(credits_response.data) > 0:
+			credits_record = credits_response.data[0]
+			current_credits = credits_record.get("credits_remaining", 10)
+			# Reset if new month
+			if credits_record.get("last_reset_month") != current_month:
+				current_credits = 10
+	except Exception as e:
+		# Continue if credit check fails (fallback behavior)
+		log.warning("Could not check credits: %s", e)
+		return user_id, None
+	
+	if current_credits <= 0:
+		raise CreditError()
+	return user_id, current_credits
+
+
+# Multiple of 3, so base64 chunks concatenate without padding in between
+_B64_CHUNK_SIZE = 48 * 1024
+# Anything smaller than this cannot be a usable photo
+_MIN_VISION_IMAGE_BYTES = 2048
+# Photos below this size are sent as-is; larger ones are downscaled first. 2 MB rather than 4 MB:
+# most phone photos are 2-4 MB and far above 1024px, so they are shrunk too instead of uploaded whole.
+_DOWNSCALE_VISION_IMAGE_BYTES = 2_000_000
+_VISION_IMAGE_MAX_EDGE = 1024
+# Uploads above this are refused before the multipart body is parsed
+_MAX_VISION_UPLOAD_BYTES = 20 * 1024 * 1024
+
+
+def _shrink_vision_image(image_bytes: bytes, fmt: str) -> tuple[Any, str]:
+	"""
+	Downscale large photos to _VISION_IMAGE_MAX_EDGE before they are sent to OpenAI.
+	Returns the original bytes and format when Pillow is unavailable or not needed.
+	"""
+	if not PIL_AVAILABLE or len(image_bytes) < _DOWNSCALE_VISION_IMAGE_BYTES:
+		return image_bytes, fmt
+	try:
+		img = Image.open(io.BytesIO(image_bytes))
+		if max(img.size) <= _VISION_IMAGE_MAX_EDGE:
+			return image_bytes, fmt
+		img = ImageOps.exif_transpose(img)
+		img.thumbnail((_VISION_IMAGE_MAX_EDGE, _VISION_IMAGE_MAX_EDGE), Image.LANCZOS)
+		if img.mode != "RGB":
+			img = img.convert("RGB")
+		out = io.BytesIO()
+		img.save(out, format="JPEG", quality=85)
+		return out.getbuffer(), "jpeg"
+	except Exception as e:
+		log.warning("Could not downscale image: %s", e)
+		return image_bytes, fmt
+
+
+def _b64_data_url(image_bytes: Any, fmt: str) -> str:
+	"""
+	Return image bytes as a base64 data URL. Chunks are encoded into one buffer sized up front and
+	decoded once, so peak memory is the raw bytes, that buffer and the final str (one copy fewer
+	than encoded bytes + decoded str + concatenated URL).
+	"""
+	view = memoryview(image_bytes)
+	prefix = f"data:image/{fmt};base64,".encode("ascii")
+	buffer = bytearray(len(prefix) + 4 * ((len(view) + 2) // 3))
+	buffer[:len(prefix)] = prefix
+	pos = len(prefix)
+	for start in range(0, len(view), _B64_CHUNK_SIZE):
+		encoded = base64.b64encode(view[start:start + _B64_CHUNK_SIZE])
+		buffer[pos:pos + len(encoded)] = encoded
+		pos += len(encoded)
+	return buffer.decode("ascii")
+
+
+def _upload_too_large() -> bool:
+	"""True when the request declares a body above _MAX_VISION_UPLOAD_BYTES."""
+	return bool(request.content_length and request.content_length > _MAX_VISION_UPLOAD_BYTES)
+
+
+@app.route("/api/vision-detect", methods=["POST"])
+def vision_detect():
+	"""Chat endpoint: photo + question → AI chat response."""
+	try:
+		if not OPENAI_AVAILABLE:
+			return jsonify({"success": False, "error": "OpenAI not available"}), 500
+		
+		if _upload_too_large():
+			return jsonify({"success": False, "error": "Image is too large"}), 413
+		
+		# Get image file
+		file = request.files.get("image")
+		if not file:
+			return jsonify({"success": False, "error": "No image provided"}), 400
+		
+		# Get OpenAI API key
+		api_key = OPENAI_API_KEY
+		if not api_key:
+			return jsonify({"success": False, "error": "OpenAI API key not configured"}), 500
+		
+		# Determine format
+		image_format = "jpeg"
+		if file.content_type and "png" in file.content_type:
+			image_format = "png"
+		elif file.content_type and "webp" in file.content_type:
+			image_format = "webp"
+		
+		# Read image and encode
+		image_bytes = file.read()
+		if not image_bytes:
+			return jsonify({"success": False, "error": "Image is empty"}), 400
+		if len(image_bytes) < _MIN_VISION_IMAGE_BYTES:
+			# Too small to be a real photo - don't spend an OpenAI call on it
+			return jsonify({
+				"success": True,
+				"message": "Sorry, ik kon de oefening niet goed identificeren. Kun je een duidelijkere foto maken?"
+			}), 200
+		image_bytes, image_format = _shrink_vision_image(image_bytes, image_format)
+		image_data_url = _b64_data_url(image_bytes, image_format)
+		del image_bytes
+		
+		# Get user message (optional, defaults to "welke oefening is dit?")
+		user_message = request.form.get("message", "Welke oefening is dit?")
 		
 		# Get user ID and check credits BEFORE making OpenAI API call
-		user_id = None
-		auth_header = request.headers.get("Authorization")
-		if auth_header and auth_header.startswith("Bearer "):
-			access_token = auth_header.replace("Bearer ", "").strip()
-			if access_token and SUPABASE_AVAILABLE:
-				try:
-					SUPABASE_URL = os.getenv("SUPABASE_URL")
-					SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-					if SUPABASE_URL and SUPABASE_ANON_KEY:
-						supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-						user_response = supabase_client.auth.get_user(access_token)
-						if user_response.user:
-							user_id = user_response.user.id
-							
-							# Check credits BEFORE making OpenAI API call
-							if user_id:
-								try:
-									# Check if user has credits (but don't deduct yet)
-									SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-									if SUPABASE_SERVICE_ROLE_KEY:
-										admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-										now = datetime.now()
-										current_month = now.strftime("%Y-%m")
-										credits_response = admin_client.table("user_credits").select("*").eq("user_id", user_id).execute()
-										
-										current_credits = 10  # Default if no record
-										if credits_response.data and len(credits_response.data) > 0:
-											credits_record = credits_response.data[0]
-											last_reset_month = credits_record.get("last_reset_month")
-											current_credits = credits_record.get("credits_remaining", 10)
-											# Reset if new month
-											if last_reset_month != current_month:
-												current_credits = 10
-										
-										# Check if user has credits BEFORE API call
-										if current_credits <= 0:
-											return jsonify({"success": False, "error": "no_credits", "message": "You are out of your monthly credits"}), 403
-								except Exception as e:
-									print(f"[WARNING] Could not check credits: {e}")
-									# Continue if credit check fails (fallback behavior)
-				except Exception as e:
-					print(f"[WARNING] Could not get user ID for credit deduction: {e}")
+		user_id, _ = _check_credit_or_403(_bearer_token())
 		
 		# Call OpenAI Vision for chat response (only if user has credits)
-		client = OpenAI(api_key=api_key)
+		client = _get_openai_client(api_key)
 		response = client.chat.completions.create(
 			model="gpt-4o-mini",
 			messages=[
@@ -1795,7 +2503,7 @@ def vision_detect():
 					"role": "user",
 					"content": [
 						{"type": "text", "text": user_message},
-						{"type": "image_url", "image_url": {"url": f"data:image/{image_format};base64,{image_base64}"}}
+						{"type": "image_url", "image_url": {"url": image_data_url}}
 					]
 				}
 			],
@@ -1807,7 +2515,7 @@ def vision_detect():
 			response_content = response.choices[0].message.content
 			if response_content:
 				chat_response = response_content.strip()
-				print(f"[SUCCESS] AI chat response: {chat_response}")
+				log.debug("AI chat response: %s", chat_response)
 				
 				# Deduct credit if user is authenticated (only on successful recognition)
 				# Credits were already checked before the API call, so this should always succeed
@@ -1822,22 +2530,22 @@ def vision_detect():
 					except ValueError as e:
 						# This should not happen since we checked before, but handle it anyway
 						if "No credits remaining" in str(e):
-							return jsonify({"success": False, "error": "no_credits", "message": "You are out of your monthly credits"}), 403
+							raise CreditError()
 						raise
 				
 				return jsonify(result), 200
 		
 		# Fallback if OpenAI response is empty
-		print("[ERROR] OpenAI returned empty response")
+		log.error("OpenAI returned empty response")
 		# Return a friendly message instead of error
 		return jsonify({
 			"success": True,
 			"message": "Sorry, ik kon de oefening niet goed identificeren. Kun je een duidelijkere foto maken?"
 		}), 200
+	except CreditError:
+		raise
 	except Exception as e:
-		print(f"[ERROR] Vision detect error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Vision detect error: %s", e)
 		# Return a friendly message instead of technical error
 		return jsonify({
 			"success": True,
@@ -1848,6 +2556,12 @@ def vision_detect():
 # /predict endpoint removed - now using /api/vision-detect with OpenAI Vision
 
 
+# Filler phrases the vision model sometimes puts in front of the exercise name
+_EXERCISE_PREFIX_RE = re.compile(
+	r"^(?:dit is (?:een )?|this is (?:a )?|looks like |appears to be |i see (?:a )?|it(?:'s| is) a |probably a |likely a )+"
+)
+
+
 @app.route("/api/recognize-exercise", methods=["POST", "OPTIONS"])
 def recognize_exercise():
 	"""
@@ -1855,92 +2569,62 @@ def recognize_exercise():
 	Same pattern as vision-detect - just call OpenAI Vision directly.
 	Also deducts 1 credit from user's account on successful recognition.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
-	import base64
-	
 	# Get user ID and check credits BEFORE making OpenAI API call
-	user_id = None
-	auth_header = request.headers.get("Authorization")
-	if auth_header and auth_header.startswith("Bearer "):
-		access_token = auth_header.replace("Bearer ", "").strip()
-		if access_token and SUPABASE_AVAILABLE:
-			try:
-				SUPABASE_URL = os.getenv("SUPABASE_URL")
-				SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-				if SUPABASE_URL and SUPABASE_ANON_KEY:
-					supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-					user_response = supabase_client.auth.get_user(access_token)
-					if user_response.user:
-						user_id = user_response.user.id
-						
-						# Check credits BEFORE making OpenAI API call
-						if user_id:
-							try:
-								# Check if user has credits (but don't deduct yet)
-								SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-								if SUPABASE_SERVICE_ROLE_KEY:
-									admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-									now = datetime.now()
-									current_month = now.strftime("%Y-%m")
-									credits_response = admin_client.table("user_credits").select("*").eq("user_id", user_id).execute()
-									
-									current_credits = 10  # Default if no record
-									if credits_response.data and len(credits_response.data) > 0:
-										credits_record = credits_response.data[0]
-										last_reset_month = credits_record.get("last_reset_month")
-										current_credits = credits_record.get("credits_remaining", 10)
-										# Reset if new month
-										if last_reset_month != current_month:
-											current_credits = 10
-									
-									# Check if user has credits BEFORE API call
-									if current_credits <= 0:
-										return jsonify({"error": "no_credits", "message": "You are out of your monthly credits"}), 403
-							except Exception as e:
-								print(f"[WARNING] Could not check credits: {e}")
-								# Continue if credit check fails (fallback behavior)
-			except Exception as e:
-				print(f"[WARNING] Could not get user ID for credit deduction: {e}")
+	user_id, _ = _check_credit_or_403(_bearer_token())
 	
+	reserve_future = None
+	reserve_month = None
 	try:
 		if not OPENAI_AVAILABLE:
 			return jsonify({"exercise": "unknown exercise"}), 200
 		
+		if _upload_too_large():
+			log.error("Upload too large: %s bytes", request.content_length)
+			return jsonify({"exercise": "unknown exercise"}), 200
+		
 		# Get image file (same as vision-detect)
 		file = request.files.get("image")
 		if not file:
-			print("[ERROR] No file in request")
+			log.error("No file in request")
 			return jsonify({"exercise": "unknown exercise"}), 200
 		
-		print(f"[DEBUG] File received: {file.filename}, content_type: {file.content_type}")
+		log.debug("File received: %s, content_type: %s", file.filename, file.content_type)
 		
 		# Get OpenAI API key
-		api_key = os.getenv("OPENAI_API_KEY")
+		api_key = OPENAI_API_KEY
 		if not api_key:
-			print("[ERROR] OPENAI_API_KEY not set")
+			log.error("OPENAI_API_KEY not set")
 			return jsonify({"exercise": "unknown exercise"}), 200
 		
+		# Determine format (same as vision-detect)
+		image_format = "jpeg"
+		if file.content_type and "png" in file.content_type:
+			image_format = "png"
+		elif file.content_type and "webp" in file.content_type:
+			image_format = "webp"
+		
 		# Read image and encode (same as vision-detect)
 		image_bytes = file.read()
 		if not image_bytes:
-			print("[ERROR] Image bytes is empty")
+			log.error("Image bytes is empty")
 			return jsonify({"exercise": "unknown exercise"}), 200
 		
-		print(f"[DEBUG] Image size: {len(image_bytes)} bytes")
+		log.debug("Image size: %s bytes", len(image_bytes))
+		if len(image_bytes) < _MIN_VISION_IMAGE_BYTES:
+			# Too small to be a real photo - don't spend an OpenAI call on it
+			return jsonify({"exercise": "unknown exercise"}), 200
 		
-		image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+		image_bytes, image_format = _shrink_vision_image(image_bytes, image_format)
+		image_data_url = _b64_data_url(image_bytes, image_format)
+		del image_bytes
 		
-		# Determine format (same as vision-detect)
-		image_format = "jpeg"
-		if file.content_type and "png" in file.content_type:
-			image_format = "png"
-		elif file.content_type and "webp" in file.content_type:
-			image_format = "webp"
+		# Reserve the credit while OpenAI looks at the image; it is refunded if recognition fails
+		if user_id:
+			reserve_month = _current_month()
+			reserve_future = _IO_EXECUTOR.submit(_reserve_credit, user_id, reserve_month)
 		
 		# Call OpenAI Vision - FORCE it to always give an exercise
-		client = OpenAI(api_key=api_key)
+		client = _get_openai_client(api_key)
 		response = client.chat.completions.create(
 			model="gpt-4o-mini",
 			messages=[
@@ -1953,7 +2637,7 @@ def recognize_exercise():
 						},
 						{
 							"type": "image_url",
-							"image_url": {"url": f"data:image/{image_format};base64,{image_base64}"}
+							"image_url": {"url": image_data_url}
 						}
 					]
 				}
@@ -1967,25 +2651,19 @@ def recognize_exercise():
 			response_content = response.choices[0].message.content
 			if response_content:
 				raw_response = response_content.strip()
-				print(f"[DEBUG] OpenAI raw response: '{raw_response}'")
+				log.debug("OpenAI raw response: '%s'", raw_response)
 				
 				exercise_name = raw_response.lower()
 				
 				# Clean up - remove common prefixes and phrases
-				exercise_name = exercise_name.strip('"\'.,;:!?')
-				exercise_name = exercise_name.replace("dit is een ", "").replace("dit is ", "")
-				exercise_name = exercise_name.replace("this is a ", "").replace("this is ", "")
-				exercise_name = exercise_name.replace("looks like ", "").replace("appears to be ", "")
-				exercise_name = exercise_name.replace("i see a ", "").replace("i see ", "")
-				exercise_name = exercise_name.replace("it's a ", "").replace("it is a ", "")
-				exercise_name = exercise_name.replace("probably a ", "").replace("likely a ", "")
+				exercise_name = _EXERCISE_PREFIX_RE.sub("", exercise_name.strip('"\'.,;:!?'))
 				exercise_name = " ".join(exercise_name.split())  # Normalize whitespace
 				
 				# ONLY mark as unknown if EXPLICITLY stated
 				# Accept everything else, even if weird
 				if exercise_name == "unknown exercise" or exercise_name == "unknown":
 					# Try one more time with a different prompt if we get unknown
-					print("[DEBUG] Got 'unknown', trying again with different prompt...")
+					log.debug("Got 'unknown', trying again with different prompt...")
 					# For now, just return unknown - but we could retry here
 					exercise_name = "unknown exercise"
 				elif len(exercise_name.strip()) < 2:
@@ -1996,41 +2674,68 @@ def recognize_exercise():
 					# Don't mark as unknown even if it's weird
 					pass
 				
-				print(f"[DEBUG] Final exercise: '{exercise_name}'")
+				log.debug("Final exercise: '%s'", exercise_name)
 				
 				# Deduct credit if user is authenticated (only on successful recognition)
 				result = {"exercise": exercise_name}
 				if user_id:
-					try:
-						credits_info = _deduct_credit_for_user(user_id)
-						result["credits_remaining"] = credits_info["credits_remaining"]
-					except ValueError as e:
-						# No credits remaining - return error
-						if "No credits remaining" in str(e):
-							return jsonify({"error": "no_credits", "message": "You are out of your monthly credits"}), 403
-						raise
+					reserved = reserve_future.result() if reserve_future is not None else None
+					reserve_future = None
+					if reserved is not None and reserved < 0:
+						raise CreditError()
+					if reserved is not None:
+						result["credits_remaining"] = reserved
+					else:
+						try:
+							credits_info = _deduct_credit_for_user(user_id)
+							result["credits_remaining"] = credits_info["credits_remaining"]
+						except ValueError as e:
+							# No credits remaining - return error
+							if "No credits remaining" in str(e):
+								raise CreditError()
+							raise
 				
 				return jsonify(result), 200
 		
-		print("[DEBUG] No response from OpenAI")
+		log.debug("No response from OpenAI")
+		_release_credit_reservation(reserve_future, user_id, reserve_month)
 		return jsonify({"exercise": "unknown exercise"}), 200
 		
+	except CreditError:
+		raise
 	except Exception as e:
-		print(f"[ERROR] Exercise recognition error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Exercise recognition error: %s", e)
+		_release_credit_reservation(reserve_future, user_id, reserve_month)
 		return jsonify({"exercise": "unknown exercise"}), 200
 
 
+def _rpc_credit_balance(admin_client: Any, rpc_name: str, user_id: str, month: str) -> Optional[int]:
+	"""
+	Call one of the credit RPCs in ADD_CREDIT_RPCS.sql and return the balance it reports.
+	Returns None when the function is not installed (or reports no balance); other errors are raised.
+	"""
+	try:
+		response = admin_client.rpc(rpc_name, {"p_user_id": user_id, "p_month": month}).execute()
+	except Exception as e:
+		if not _is_missing_rpc(e):
+			raise
+		log.warning("%s RPC not installed: %s", rpc_name, e)
+		return None
+	data = response.data
+	if isinstance(data, list):
+		data = data[0] if data else None
+	try:
+		return int(data)
+	except (TypeError, ValueError):
+		return None
+
+
 @app.route("/api/user-credits", methods=["GET", "OPTIONS"])
 def user_credits():
 	"""
 	Get user credits from Supabase.
 	Handles monthly reset automatically.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -2044,34 +2749,36 @@ def user_credits():
 	if not access_token:
 		return jsonify({"error": "Missing access token"}), 401
 	
-	# Initialize Supabase clients
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-	
 	if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 		return jsonify({"error": "Supabase configuration missing"}), 500
 	
 	try:
 		# Get user from token
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		supabase_client = _get_anon_client()
+		user = _verify_token(access_token)
 		
-		if not user_response.user:
+		if not user:
 			return jsonify({"error": "Invalid token"}), 401
 		
-		user_id = user_response.user.id
+		user_id = user.id
 		
 		# Use service role key for database operations
 		if SUPABASE_SERVICE_ROLE_KEY:
-			admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+			admin_client = _get_admin_client()
 		else:
 			# Fallback to anon key if service role not available
 			admin_client = supabase_client
 		
 		# Get current month
-		now = datetime.now()
-		current_month = now.strftime("%Y-%m")
+		current_month = _current_month()
+		
+		# One round-trip: create/reset/read in the ensure_user_credits RPC (ADD_CREDIT_RPCS.sql)
+		credits_remaining = _rpc_credit_balance(admin_client, "ensure_user_credits", user_id, current_month)
+		if credits_remaining is not None:
+			return jsonify({
+				"credits_remaining": credits_remaining,
+				"last_reset_month": current_month
+			}), 200
 		
 		# Try to get existing credits record
 		credits_response = admin_client.table("user_credits").select("*").eq("user_id", user_id).execute()
@@ -2086,19 +2793,19 @@ def user_credits():
 				update_response = admin_client.table("user_credits").update({
 					"credits_remaining": 10,
 					"last_reset_month": current_month,
-					"updated_at": now.isoformat()
+					"updated_at": _now_iso()
 				}).eq("user_id", user_id).execute()
 				
 				credits_remaining = 10
 			else:
 				credits_remaining = credits_record.get("credits_remaining", 10)
 		else:
-			# Create new record with 10 credits
-			insert_response = admin_client.table("user_credits").insert({
+			# Create new record with 10 credits (a concurrent request may have just created it)
+			insert_response = admin_client.table("user_credits").upsert({
 				"user_id": user_id,
 				"credits_remaining": 10,
 				"last_reset_month": current_month
-			}).execute()
+			}, on_conflict="user_id", ignore_duplicates=True).execute()
 			
 			credits_remaining = 10
 		
@@ -2108,9 +2815,7 @@ def user_credits():
 		}), 200
 		
 	except Exception as e:
-		print(f"[ERROR] Error getting user credits: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Error getting user credits: %s", e)
 		return jsonify({"error": "Failed to get credits", "details": str(e)}), 500
 
 
@@ -2119,9 +2824,6 @@ def deduct_user_credits():
 	"""
 	Deduct 1 credit from user's account.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -2135,62 +2837,35 @@ def deduct_user_credits():
 	if not access_token:
 		return jsonify({"error": "Missing access token"}), 401
 	
-	# Initialize Supabase clients
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-	
 	if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 		return jsonify({"error": "Supabase configuration missing"}), 500
 	
 	try:
 		# Get user from token
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		supabase_client = _get_anon_client()
+		user = _verify_token(access_token)
 		
-		if not user_response.user:
+		if not user:
 			return jsonify({"error": "Invalid token"}), 401
 		
-		user_id = user_response.user.id
+		user_id = user.id
 		
 		# Use service role key for database operations
 		if SUPABASE_SERVICE_ROLE_KEY:
-			admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+			admin_client = _get_admin_client()
 		else:
 			admin_client = supabase_client
 		
 		# Get current month
-		now = datetime.now()
-		current_month = now.strftime("%Y-%m")
+		current_month = _current_month()
 		
-		# Get existing credits record
-		credits_response = admin_client.table("user_credits").select("*").eq("user_id", user_id).execute()
-		
-		if credits_response.data and len(credits_response.data) > 0:
-			credits_record = credits_response.data[0]
-			last_reset_month = credits_record.get("last_reset_month")
-			current_credits = credits_record.get("credits_remaining", 10)
-			
-			# Reset if new month
-			if last_reset_month != current_month:
-				credits_remaining = 10
-			else:
-				credits_remaining = max(0, current_credits - 1)
-			
-			# Update credits
-			update_response = admin_client.table("user_credits").update({
-				"credits_remaining": credits_remaining,
-				"last_reset_month": current_month,
-				"updated_at": now.isoformat()
-			}).eq("user_id", user_id).execute()
-		else:
-			# Create new record with 9 credits (10 - 1)
-			insert_response = admin_client.table("user_credits").insert({
-				"user_id": user_id,
-				"credits_remaining": 9,
-				"last_reset_month": current_month
-			}).execute()
-			credits_remaining = 9
+		# Atomic reset + decrement in the deduct_credit RPC (ADD_CREDIT_RPCS.sql), so concurrent
+		# requests cannot both spend the same credit
+		credits_remaining = _rpc_credit_balance(admin_client, "deduct_credit", user_id, current_month)
+		if credits_remaining is None:
+			# deduct_credit always returns a balance, so None means it is not installed
+			log.error("deduct_credit returned no balance; is ADD_CREDIT_RPCS.sql applied?")
+			return jsonify({"error": "Failed to deduct credits"}), 500
 		
 		return jsonify({
 			"credits_remaining": credits_remaining,
@@ -2198,9 +2873,7 @@ def deduct_user_credits():
 		}), 200
 		
 	except Exception as e:
-		print(f"[ERROR] Error deducting credits: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Error deducting credits: %s", e)
 		return jsonify({"error": "Failed to deduct credits", "details": str(e)}), 500
 
 
@@ -2218,13 +2891,13 @@ def favicon():
 	return ("", 204)
 
 
-@app.route("/exercise-info", methods=["POST"])
-def exercise_info():
-	"""Get metadata for a manually selected exercise."""
-	# Public endpoint - exercise metadata is not sensitive
-	data = request.json
-	exercise_key = data.get("exercise", "")
-	
+# Bump when MACHINE_METADATA is changed at runtime so the cached payloads below are rebuilt
+_MACHINE_METADATA_VERSION = 0
+
+
+@lru_cache(maxsize=1024)
+def _exercise_info_payload(exercise_key: str, version: int = 0) -> Dict[str, Any]:
+	"""Response body for /exercise-info; callers must not mutate it."""
 	# Normalize the key
 	norm = normalize_label(exercise_key)
 	key = ALIASES.get(norm, norm)
@@ -2238,31 +2911,97 @@ def exercise_info():
 	
 	muscles = normalize_muscles(meta.get("muscles", []))
 	
-	return jsonify({
+	return {
 		"display": meta["display"],
 		"muscles": muscles,
 		"video": meta["video"],
 		"key": key,
 		"image": image_url_for_key(key, meta) or meta.get("image"),
-	})
+	}
 
 
-@app.route("/exercises", methods=["GET"])
-def exercises_list():
-	"""Get list of all available exercises."""
-	# Public endpoint - exercises are not sensitive data
+@lru_cache(maxsize=2)
+def _exercises_json(version: int = 0) -> bytes:
+	"""Serialized /exercises body, built once per MACHINE_METADATA version."""
 	exercises = []
 	for key, meta in MACHINE_METADATA.items():
-		# Remove duplicates from muscles array (safety check)
-		muscles = meta.get("muscles", [])
-		unique_muscles = list(dict.fromkeys(muscles))  # Preserves order while removing duplicates
 		exercises.append({
 			"key": key,
 			"display": meta.get("display", key.replace("_", " ").title()),
-			"muscles": unique_muscles,
+			"muscles": meta.get("muscles", []),
 			"image": image_url_for_key(key, meta) or meta.get("image"),
 		})
-	return jsonify({"exercises": exercises})
+	body = app.json.dumps({"exercises": exercises})
+	return body if isinstance(body, bytes) else body.encode("utf-8")
+
+
+@lru_cache(maxsize=2)
+def _exercise_info_json_table(version: int = 0) -> Dict[str, bytes]:
+	"""
+	Serialized /exercise-info bodies for every known exercise, keyed by normalized label
+	(exercise keys and alias spellings). Unknown labels are not in the table.
+	"""
+	table: Dict[str, bytes] = {}
+	for norm in list(MACHINE_METADATA.keys()) + list(ALIASES.keys()):
+		key = ALIASES.get(norm, norm)
+		if key not in MACHINE_METADATA:
+			continue
+		body = app.json.dumps(_exercise_info_payload(key, version))
+		table[norm] = body if isinstance(body, bytes) else body.encode("utf-8")
+	return table
+
+
+def _exercise_muscle_str(meta: Dict[str, Any]) -> str:
+	"""Comma-separated muscles for a prompt line, skipping "-" placeholders."""
+	return ", ".join([m for m in meta.get("muscles", []) if m and m != "-"])
+
+
+@lru_cache(maxsize=2)
+def _workout_exercises_context(version: int = 0) -> str:
+	"""Exercise list (with keys) for the workout-generation prompts, built once per MACHINE_METADATA version."""
+	exercise_list = []
+	for key, meta in MACHINE_METADATA.items():
+		display_name = meta.get("display", key.replace("_", " ").title())
+		muscle_str = _exercise_muscle_str(meta)
+		exercise_list.append(f"{display_name} (key: {key})" + (f" - targets: {muscle_str}" if muscle_str else ""))
+	return "\n".join(exercise_list[:150])
+
+
+@lru_cache(maxsize=2)
+def _chat_exercises_context(version: int = 0) -> str:
+	"""Exercise list for the chat prompt, built once per MACHINE_METADATA version."""
+	exercise_list = []
+	for key, meta in MACHINE_METADATA.items():
+		display_name = meta.get("display", key.replace("_", " ").title())
+		muscle_str = _exercise_muscle_str(meta)
+		exercise_list.append(f"- {display_name}" + (f" (targets: {muscle_str})" if muscle_str else ""))
+	return "\n".join(exercise_list[:100])  # Limit to first 100 exercises to avoid token limits
+
+
+# Build the static exercise payloads at import instead of on the first request
+_exercise_info_json_table(_MACHINE_METADATA_VERSION)
+_exercises_json(_MACHINE_METADATA_VERSION)
+_workout_exercises_context(_MACHINE_METADATA_VERSION)
+_chat_exercises_context(_MACHINE_METADATA_VERSION)
+
+
+@app.route("/exercise-info", methods=["POST"])
+def exercise_info():
+	"""Get metadata for a manually selected exercise."""
+	# Public endpoint - exercise metadata is not sensitive
+	data = request.json
+	exercise_key = data.get("exercise", "")
+	body = _exercise_info_json_table(_MACHINE_METADATA_VERSION).get(normalize_label(exercise_key))
+	if body is not None:
+		return app.response_class(body, mimetype="application/json")
+	return jsonify(_exercise_info_payload(exercise_key, _MACHINE_METADATA_VERSION))
+
+
+@app.route("/exercises", methods=["GET"])
+def exercises_list():
+	"""Get list of all available exercises."""
+	# Public endpoint - exercises are not sensitive data
+	return app.response_class(_exercises_json(_MACHINE_METADATA_VERSION), mimetype="application/json")
 
 
 # /model-classes endpoint removed - no longer using YOLO models
@@ -2281,21 +3020,18 @@ def sync_gym_data_to_analytics_table(
 	if not SUPABASE_AVAILABLE:
 		return False
 
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
 	if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-		print("[GYM SYNC] Supabase configuration missing")
+		log.warning("[GYM SYNC] Supabase configuration missing")
 		return False
 
 	try:
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 
 		# Reuse provided metadata when available to avoid extra auth.users fetches.
 		if user_metadata is None:
 			user_response = admin_client.auth.admin.get_user_by_id(user_id)
 			if not user_response.user:
-				print(f"[GYM SYNC] User {user_id} not found")
+				log.warning("[GYM SYNC] User %s not found", user_id)
 				return False
 			user_metadata = user_response.user.user_metadata or {}
 		else:
@@ -2310,29 +3046,10 @@ def sync_gym_data_to_analytics_table(
 			has_consent = user_metadata.get("data_collection_consent", False)
 
 		# Find matching gym account only when user has consent and selected a gym.
-		gym_id = None
+		# It does not depend on the existing-row check below, so it runs alongside it.
+		gym_id_future = None
 		if has_consent and gym_name:
-			all_users = admin_client.auth.admin.list_users()
-			# supabase-py v2 returns `.data`; older variants may return `.users`
-			users_list = getattr(all_users, "data", None)
-			if users_list is None:
-				users_list = getattr(all_users, "users", None)
-			if users_list is None and isinstance(all_users, dict):
-				users_list = all_users.get("data") or all_users.get("users")
-			if users_list is None and isinstance(all_users, list):
-				users_list = all_users
-			if users_list is None:
-				users_list = []
-
-			for user in users_list:
-				user_meta = user.user_metadata or {}
-				if (
-					user_meta.get("is_gym_account") == True
-					and user_meta.get("gym_name")
-					and user_meta.get("gym_name").lower().strip() == gym_name.lower().strip()
-				):
-					gym_id = user.id
-					break
+			gym_id_future = _IO_EXECUTOR.submit(_find_gym_account_id_by_name, admin_client, gym_name)
 
 		# Parse timestamps
 		consent_given_at = None
@@ -2362,12 +3079,13 @@ def sync_gym_data_to_analytics_table(
 
 		# Check if record exists (only fields we need)
 		existing = admin_client.table("gym_analytics").select("user_id,gym_id").eq("user_id", user_id).execute()
+		gym_id = gym_id_future.result() if gym_id_future is not None else None
 
 		data_to_upsert = {
 			"user_id": user_id,
 			"gym_name": gym_name,
 			"data_collection_consent": has_consent,
-			"updated_at": datetime.now().isoformat(),
+			"updated_at": _now_iso(),
 		}
 
 		# Store place_id if the table has the column (backwards compatible)
@@ -2390,7 +3108,7 @@ def sync_gym_data_to_analytics_table(
 		def _execute_upsert(payload: dict, exists: bool):
 			if exists:
 				return admin_client.table("gym_analytics").update(payload).eq("user_id", user_id).execute()
-			payload2 = {**payload, "created_at": datetime.now().isoformat()}
+			payload2 = {**payload, "created_at": _now_iso()}
 			return admin_client.table("gym_analytics").insert(payload2).execute()
 
 		exists = bool(existing.data and len(existing.data) > 0)
@@ -2402,7 +3120,7 @@ def sync_gym_data_to_analytics_table(
 			if "gym_place_id" in msg and ("PGRST204" in msg or "schema cache" in msg):
 				payload = {k: v for k, v in data_to_upsert.items() if k != "gym_place_id"}
 				_execute_upsert(payload, exists)
-				print("[GYM SYNC] gym_place_id column missing; synced without gym_place_id (run migration to add column).")
+				log.warning("[GYM SYNC] gym_place_id column missing; synced without gym_place_id (run migration to add column).")
 			else:
 				raise
 
@@ -2410,54 +3128,73 @@ def sync_gym_data_to_analytics_table(
 		if existing.data and len(existing.data) > 0:
 			existing_row = existing.data[0]
 			if not exists or (gym_id is not None and existing_row.get("gym_id") != gym_id):
-				print(f"[GYM SYNC] Synced gym analytics for user {user_id}, linked to gym_id: {gym_id}")
+				log.debug("[GYM SYNC] Synced gym analytics for user %s, linked to gym_id: %s", user_id, gym_id)
 		elif not exists:
-			print(f"[GYM SYNC] Synced gym analytics for user {user_id}, linked to gym_id: {gym_id}")
+			log.debug("[GYM SYNC] Synced gym analytics for user %s, linked to gym_id: %s", user_id, gym_id)
 
 		return True
 	except Exception as e:
-		print(f"[GYM SYNC] Error syncing gym data: {e}")
+		_log_exception("[GYM SYNC] Error syncing gym data: %s", e)
 		if "permission denied for table users" in str(e).lower():
-			print("[GYM SYNC] Likely cause: the gym_analytics trigger reads auth.users without SECURITY DEFINER. "
-			      "Re-run gym_accounts_schema.sql with SECURITY DEFINER (see repo) to fix.")
-		import traceback
-		traceback.print_exc()
+			log.error("[GYM SYNC] Likely cause: the gym_analytics trigger reads auth.users without SECURITY DEFINER. "
+				"Re-run gym_accounts_schema.sql with SECURITY DEFINER (see repo) to fix.")
 		return False
 
 
-def _extract_users_list(all_users_response: Any) -> List[Any]:
-	users_list = getattr(all_users_response, "data", None)
-	if users_list is None:
-		users_list = getattr(all_users_response, "users", None)
-	if users_list is None and isinstance(all_users_response, dict):
-		users_list = all_users_response.get("data") or all_users_response.get("users")
-	if users_list is None and isinstance(all_users_response, list):
-		users_list = all_users_response
-	return users_list or []
-
-
 def _find_gym_account_id_by_name(admin_client: Any, gym_name: Optional[str]) -> Optional[str]:
-	target = (gym_name or "").strip().lower()
-	if not target:
+	name = (gym_name or "").strip()
+	if not name:
 		return None
+	# Indexed lookup (gym_accounts table, see ADD_GYM_ACCOUNTS_LOOKUP.sql); must match SQL LOWER()
+	try:
+		result = admin_client.table("gym_accounts").select("user_id").eq("gym_name_lower", name.lower()).eq("is_gym_account", True).limit(1).execute()
+		rows = result.data or []
+		return rows[0].get("user_id") if rows else None
+	except Exception as e:
+		log.warning("[GYM REPORTS] gym_accounts lookup unavailable, scanning users: %s", e)
+	target = name.casefold()
 	try:
-		all_users = admin_client.auth.admin.list_users()
-		for user in _extract_users_list(all_users):
-			user_id = getattr(user, "id", None) or (user.get("id") if isinstance(user, dict) else None)
-			user_meta = getattr(user, "user_metadata", None)
-			if user_meta is None and isinstance(user, dict):
-				user_meta = user.get("user_metadata") or user.get("raw_user_meta_data")
-			user_meta = user_meta or {}
+		for user in _iter_auth_users():
+			user_meta = user.get("user_metadata") or user.get("raw_user_meta_data") or {}
 			if user_meta.get("is_gym_account") != True:
 				continue
-			candidate = (user_meta.get("gym_name") or "").strip().lower()
-			if candidate and candidate == target:
-				return user_id
+			candidate = user_meta.get("gym_name")
+			if candidate and candidate.strip().casefold() == target:
+				return user.get("id")
 	except Exception as e:
-		print(f"[GYM REPORTS] Failed to resolve gym account by name: {e}")
+		log.warning("[GYM REPORTS] Failed to resolve gym account by name: %s", e)
 	return None
 
 
+_AUTH_USERS_PAGE_SIZE = 1000
+
+
+def _iter_auth_users():
+	"""
+	Yield every auth user (as the Admin REST API returns it), fetching pages of
+	_AUTH_USERS_PAGE_SIZE over the shared session instead of the client's 50-user default.
+	GoTrue's `filter` param only matches email/name, so metadata filtering stays in Python.
+	"""
+	users_url, _, headers = _supabase_admin_rest(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+	page = 1
+	while True:
+		response = _SUPA_SESSION.get(
+			users_url,
+			headers=headers,
+			params={"page": page, "per_page": _AUTH_USERS_PAGE_SIZE},
+			timeout=15
+		)
+		response.raise_for_status()
+		users = app.json.loads(response.content).get("users") or []
+		yield from users
+		if len(users) < _AUTH_USERS_PAGE_SIZE:
+			return
+		page += 1
+
+
+_GYM_DATA_CSV_PAGE_SIZE = 1000
+
+
 @app.route("/api/gym-data", methods=["GET", "OPTIONS"])
 def get_gym_data():
 	"""
@@ -2469,9 +3206,6 @@ def get_gym_data():
 	- gym_name: Filter by specific gym name
 	- format: 'json' (default) or 'csv' for export
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -2484,57 +3218,56 @@ def get_gym_data():
 	token = auth_header.replace("Bearer ", "").strip()
 	
 	# Check if it's a service role key (for admin access)
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 	if not SUPABASE_SERVICE_ROLE_KEY or token != SUPABASE_SERVICE_ROLE_KEY:
 		return jsonify({"error": "Unauthorized - service role key required"}), 403
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
 		if not SUPABASE_URL:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
 		# Create admin client
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 		
 		# Get query parameters
 		gym_name_filter = request.args.get("gym_name")
 		format_type = request.args.get("format", "json")
 		
 		# Query gym_analytics table - only users with consent
-		query = admin_client.table("gym_analytics").select("*").eq("data_collection_consent", True)
-		
-		if gym_name_filter:
-			query = query.eq("gym_name", gym_name_filter)
-		
-		result = query.execute()
+		def consented_rows(columns: str):
+			query = admin_client.table("gym_analytics").select(columns).eq("data_collection_consent", True)
+			if gym_name_filter:
+				query = query.eq("gym_name", gym_name_filter)
+			return query
 		
 		if format_type == "csv":
-			# Return CSV format
-			import csv
-			import io
-			output = io.StringIO()
-			writer = csv.writer(output)
+			# Stream CSV, fetching the table page by page so no full copy is held in memory
+			csv_columns = ["user_id", "gym_name", "consent_given_at", "gym_name_updated_at", "created_at"]
 			
-			# Write header
-			writer.writerow(["user_id", "gym_name", "consent_given_at", "gym_name_updated_at", "created_at"])
+			def generate_csv():
+				buffer = io.StringIO()
+				writer = csv.writer(buffer)
+				writer.writerow(csv_columns)
+				offset = 0
+				while True:
+					page = consented_rows(",".join(csv_columns)).order("user_id").range(offset, offset + _GYM_DATA_CSV_PAGE_SIZE - 1).execute().data or []
+					for row in page:
+						writer.writerow([row.get(column, "") for column in csv_columns])
+					yield buffer.getvalue()
+					buffer.seek(0)
+					buffer.truncate()
+					if len(page) < _GYM_DATA_CSV_PAGE_SIZE:
+						return
+					offset += _GYM_DATA_CSV_PAGE_SIZE
 			
-			# Write data
-			for row in result.data:
-				writer.writerow([
-					row.get("user_id", ""),
-					row.get("gym_name", ""),
-					row.get("consent_given_at", ""),
-					row.get("gym_name_updated_at", ""),
-					row.get("created_at", "")
-				])
-			
-			from flask import Response
-			return Response(
-				output.getvalue(),
+			return app.response_class(
+				generate_csv(),
 				mimetype="text/csv",
 				headers={"Content-Disposition": "attachment; filename=gym_analytics.csv"}
 			)
 		else:
+			include_raw = request.args.get("include_raw") == "true"
+			result = consented_rows("*" if include_raw else "user_id,gym_name,consent_given_at,gym_name_updated_at").execute()
+			
 			# Return JSON format
 			# Group by gym name for analytics
 			gym_stats = {}
@@ -2557,13 +3290,11 @@ def get_gym_data():
 				"total_users": len(result.data),
 				"total_gyms": len(gym_stats),
 				"gym_statistics": list(gym_stats.values()),
-				"raw_data": result.data if request.args.get("include_raw") == "true" else None
+				"raw_data": result.data if include_raw else None
 			}), 200
 		
 	except Exception as e:
-		print(f"[GYM DATA] Error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM DATA] Error: %s", e)
 		return jsonify({"error": f"Failed to get gym data: {str(e)}"}), 500
 
 
@@ -2573,28 +3304,20 @@ def collect_gym_data():
 	Endpoint to collect gym name and data consent from the frontend.
 	Updates user_metadata in Supabase and syncs to gym_analytics table.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	access_token = request.headers.get("Authorization", "").replace("Bearer ", "")
 	if not access_token:
 		return jsonify({"error": "Authentication required"}), 401
 
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-	if not SUPABASE_URL or not SUPABASE_ANON_KEY or not SUPABASE_SERVICE_ROLE_KEY:
+	if not SUPABASE_CONFIGURED:
 		return jsonify({"error": "Supabase configuration missing"}), 500
 
 	try:
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		user = _verify_token(access_token)
 
-		if not user_response.user:
+		if not user:
 			return jsonify({"error": "Invalid token"}), 401
 
-		user_id = user_response.user.id
+		user_id = user.id
 		data = request.get_json() or {}
 		# We must distinguish between "field not provided" and "explicitly clear (null)".
 		has_gym_name = "gym_name" in data
@@ -2606,37 +3329,60 @@ def collect_gym_data():
 		data_consent = data.get("data_consent")
 
 		# Update user metadata
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
+		now_iso = _now_iso()
 		
-		# Use metadata from verified access token (avoids extra auth.users call per save).
-		current_metadata = getattr(user_response.user, "user_metadata", None) or {}
-		if not isinstance(current_metadata, dict):
-			current_metadata = {}
-		
-		updated_metadata = {**current_metadata}
-		now_iso = datetime.now().isoformat()
+		# Metadata changes as keys to set and keys to remove
+		meta_set: Dict[str, Any] = {}
+		meta_remove: List[str] = []
 		
 		if has_gym_name:
 			# Allow clearing gym by sending null/empty string
 			if gym_name is None or (isinstance(gym_name, str) and gym_name.strip() == ""):
-				updated_metadata.pop("gym_name", None)
-				updated_metadata.pop("gym_place_id", None)
+				meta_remove += ["gym_name", "gym_place_id"]
 			else:
-				updated_metadata["gym_name"] = gym_name
-			updated_metadata["gym_name_updated_at"] = now_iso
+				meta_set["gym_name"] = gym_name
+			meta_set["gym_name_updated_at"] = now_iso
 
 		if has_gym_place_id:
 			if gym_place_id is None or (isinstance(gym_place_id, str) and gym_place_id.strip() == ""):
-				updated_metadata.pop("gym_place_id", None)
+				meta_remove.append("gym_place_id")
 			else:
-				updated_metadata["gym_place_id"] = gym_place_id
+				meta_set["gym_place_id"] = gym_place_id
 		
 		if has_data_consent and data_consent is not None:
-			updated_metadata["data_collection_consent"] = data_consent
-			updated_metadata["consent_updated_at"] = now_iso
+			meta_set["data_collection_consent"] = data_consent
+			meta_set["consent_updated_at"] = now_iso
+
+		# One round-trip: merge metadata and sync gym_analytics in the upsert_user_gym RPC
+		# (ADD_UPSERT_USER_GYM_RPC.sql). Falls back to the separate calls below if it is missing.
+		try:
+			rpc_response = admin_client.rpc("upsert_user_gym", {
+				"p_user_id": user_id,
+				"p_set": meta_set,
+				"p_remove": meta_remove
+			}).execute()
+		except Exception as e:
+			if not _is_missing_rpc(e):
+				raise
+			log.warning("[GYM SYNC] upsert_user_gym RPC unavailable, using separate updates: %s", e)
+		else:
+			_forget_token(access_token)
+			if rpc_response.data is None:
+				return jsonify({"error": "User not found"}), 404
+			return jsonify({"success": True, "message": "Gym data updated successfully"}), 200
+		
+		# Use metadata from verified access token (avoids extra auth.users call per save).
+		current_metadata = getattr(user, "user_metadata", None) or {}
+		if not isinstance(current_metadata, dict):
+			current_metadata = {}
+		
+		updated_metadata = {k: v for k, v in current_metadata.items() if k not in meta_remove}
+		updated_metadata.update(meta_set)
 
 		# supabase-py v2: update_user_by_id (not update_user)
 		admin_client.auth.admin.update_user_by_id(user_id, {"user_metadata": updated_metadata})
+		_forget_token(access_token)
 
 		# Automatically sync to gym_analytics table
 		ok = sync_gym_data_to_analytics_table(
@@ -2651,9 +3397,7 @@ def collect_gym_data():
 		return jsonify({"success": True, "message": "Gym data updated successfully"}), 200
 
 	except Exception as e:
-		print(f"Error collecting gym data: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Error collecting gym data: %s", e)
 		return jsonify({"error": f"Failed to update gym data: {str(e)}"}), 500
 
 
@@ -2664,9 +3408,6 @@ def sync_gym_data():
 	This endpoint is called automatically when a user updates their gym name or consent.
 	Can also be called manually to sync existing data.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -2678,20 +3419,16 @@ def sync_gym_data():
 	access_token = auth_header.replace("Bearer ", "").strip()
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
 		# Verify user
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		user = _verify_token(access_token)
 		
-		if not user_response.user:
+		if not user:
 			return jsonify({"error": "Invalid token"}), 401
 		
-		user_id = user_response.user.id
+		user_id = user.id
 		
 		# Get data from request body (optional - if not provided, will fetch from user_metadata)
 		data = request.get_json() or {}
@@ -2707,21 +3444,20 @@ def sync_gym_data():
 			return jsonify({"error": "Failed to sync gym data"}), 500
 		
 	except Exception as e:
-		print(f"[GYM SYNC] Error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM SYNC] Error: %s", e)
 		return jsonify({"error": f"Failed to sync gym data: {str(e)}"}), 500
 
 
+# Columns the problem-report list returns to the gym dashboard
+_PROBLEM_REPORT_COLUMNS = "id,exercise_key,exercise_display,issue_type,note,status,is_read,created_at"
+
+
 @app.route("/api/gym/problem-reports", methods=["GET", "POST", "OPTIONS"])
 def gym_problem_reports():
 	"""
 	POST: user submits a problem report for their selected gym.
 	GET: gym account fetches open problem reports for its gym.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 
@@ -2733,10 +3469,7 @@ def gym_problem_reports():
 	if not access_token:
 		return jsonify({"error": "Missing access token"}), 401
 
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-	if not SUPABASE_URL or not SUPABASE_ANON_KEY or not SUPABASE_SERVICE_ROLE_KEY:
+	if not SUPABASE_CONFIGURED:
 		return jsonify({"error": "Supabase configuration missing"}), 500
 
 	try:
@@ -2746,7 +3479,7 @@ def gym_problem_reports():
 
 		user_id = user.id
 		user_meta = user.user_metadata or {}
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 
 		if request.method == "POST":
 			data = request.get_json() or {}
@@ -2766,6 +3499,25 @@ def gym_problem_reports():
 			if not gym_name:
 				return jsonify({"error": "No gym selected. Set your gym first in Settings."}), 400
 
+			# One round-trip: resolve gym_id and insert in the submit_problem_report RPC
+			# (ADD_SUBMIT_PROBLEM_REPORT_RPC.sql); falls back to the lookups below if it is missing
+			try:
+				admin_client.rpc("submit_problem_report", {
+					"p_user_id": user_id,
+					"p_gym_name": gym_name,
+					"p_gym_place_id": gym_place_id,
+					"p_exercise_key": exercise_key,
+					"p_exercise_display": exercise_display,
+					"p_issue_type": issue_type,
+					"p_note": note
+				}).execute()
+				return jsonify({"success": True, "message": "Problem report sent"}), 200
+			except Exception as e:
+				# Only a missing function falls back; other errors may follow a committed insert
+				if not _is_missing_rpc(e):
+					raise
+				log.warning("[GYM REPORTS] submit_problem_report RPC unavailable, inserting directly: %s", e)
+
 			gym_id = None
 			try:
 				analytics_result = admin_client.table("gym_analytics").select("gym_id,gym_name").eq("user_id", user_id).limit(1).execute()
@@ -2809,24 +3561,34 @@ def gym_problem_reports():
 
 		gym_id = user_id
 		gym_name = (user_meta.get("gym_name") or "").strip()
-		result = admin_client.table("gym_problem_reports") \
-			.select("*") \
-			.eq("status", "open") \
-			.eq("gym_id", gym_id) \
-			.order("created_at", desc=True) \
-			.limit(limit) \
-			.execute()
-
-		reports = result.data or []
-		if not reports and gym_name:
-			fallback = admin_client.table("gym_problem_reports") \
-				.select("*") \
+
+		def count_unread(column: str, value: str) -> Optional[int]:
+			# Total unread open reports, not limited by `limit` (HEAD request, no rows transferred)
+			return admin_client.table("gym_problem_reports") \
+				.select("id", count="exact", head=True) \
+				.eq("status", "open") \
+				.eq("is_read", False) \
+				.eq(column, value) \
+				.execute() \
+				.count
+
+		def open_reports(column: str, value: str) -> List[Dict[str, Any]]:
+			return admin_client.table("gym_problem_reports") \
+				.select(_PROBLEM_REPORT_COLUMNS) \
 				.eq("status", "open") \
-				.eq("gym_name", gym_name) \
+				.eq(column, value) \
 				.order("created_at", desc=True) \
 				.limit(limit) \
-				.execute()
-			reports = fallback.data or []
+				.execute() \
+				.data or []
+
+		# The unread count runs while the reports load; the gym_name fallback is only queried when gym_id has none
+		unread_future = _IO_EXECUTOR.submit(count_unread, "gym_id", gym_id)
+		reports = open_reports("gym_id", gym_id)
+		if not reports and gym_name:
+			unread_future.cancel()
+			unread_future = _IO_EXECUTOR.submit(count_unread, "gym_name", gym_name)
+			reports = open_reports("gym_name", gym_name)
 
 		serialized = []
 		unread_count = 0
@@ -2845,6 +3607,14 @@ def gym_problem_reports():
 				"created_at": row.get("created_at"),
 			})
 
+		try:
+			unread_total = unread_future.result()
+		except Exception as e:
+			log.warning("[GYM REPORTS] Unread count query failed, counting listed reports: %s", e)
+			unread_total = None
+		if unread_total is not None:
+			unread_count = unread_total
+
 		return jsonify({
 			"success": True,
 			"open_count": len(serialized),
@@ -2854,20 +3624,20 @@ def gym_problem_reports():
 
 	except Exception as e:
 		msg = str(e)
-		print(f"[GYM REPORTS] Error: {msg}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM REPORTS] Error: %s", msg)
 		if "gym_problem_reports" in msg:
 			return jsonify({"error": "Problem reports table missing. Run create_gym_problem_reports_table.sql"}), 500
 		return jsonify({"error": f"Failed to process problem reports: {msg}"}), 500
 
 
+def _postgrest_quote(value: str) -> str:
+	"""Quote a value for use inside a PostgREST or=(...) filter string."""
+	return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
 @app.route("/api/gym/problem-reports/mark-read", methods=["POST", "OPTIONS"])
 def mark_gym_problem_reports_read():
 	"""Mark one or all open problem reports as read for the current gym account."""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 
@@ -2879,19 +3649,14 @@ def mark_gym_problem_reports_read():
 	if not access_token:
 		return jsonify({"error": "Missing access token"}), 401
 
-	SUPABASE_URL = os.getenv("SUPABASE_URL")
-	SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-	SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-	if not SUPABASE_URL or not SUPABASE_ANON_KEY or not SUPABASE_SERVICE_ROLE_KEY:
+	if not SUPABASE_CONFIGURED:
 		return jsonify({"error": "Supabase configuration missing"}), 500
 
 	try:
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
-		if not user_response.user:
+		user = _verify_token(access_token)
+		if not user:
 			return jsonify({"error": "Invalid token"}), 401
 
-		user = user_response.user
 		user_id = user.id
 		user_meta = user.user_metadata or {}
 		if user_meta.get("is_gym_account") != True or user_meta.get("is_verified") != True:
@@ -2900,27 +3665,23 @@ def mark_gym_problem_reports_read():
 		data = request.get_json() or {}
 		report_id = (data.get("report_id") or "").strip()
 		gym_name = (user_meta.get("gym_name") or "").strip()
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-		update_payload = {"is_read": True, "updated_at": datetime.now().isoformat()}
+		admin_client = _get_admin_client()
+		update_payload = {"is_read": True, "updated_at": _now_iso()}
 
-		query = admin_client.table("gym_problem_reports").update(update_payload).eq("status", "open").eq("gym_id", user_id)
+		query = admin_client.table("gym_problem_reports").update(update_payload).eq("status", "open")
+		if gym_name:
+			# Older records may only have gym_name populated; match both in one UPDATE
+			query = query.or_(f"gym_id.eq.{user_id},gym_name.eq.{_postgrest_quote(gym_name)}")
+		else:
+			query = query.eq("gym_id", user_id)
 		if report_id:
 			query = query.eq("id", report_id)
 		query.execute()
 
-		# Backwards compatible fallback when older records don't have gym_id populated
-		if gym_name:
-			fallback_query = admin_client.table("gym_problem_reports").update(update_payload).eq("status", "open").eq("gym_name", gym_name)
-			if report_id:
-				fallback_query = fallback_query.eq("id", report_id)
-			fallback_query.execute()
-
 		return jsonify({"success": True}), 200
 	except Exception as e:
 		msg = str(e)
-		print(f"[GYM REPORTS] Mark-read error: {msg}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM REPORTS] Mark-read error: %s", msg)
 		if "gym_problem_reports" in msg:
 			return jsonify({"error": "Problem reports table missing. Run create_gym_problem_reports_table.sql"}), 500
 		return jsonify({"error": f"Failed to mark reports as read: {msg}"}), 500
@@ -2932,9 +3693,6 @@ def delete_gym_account():
 	Delete a gym account.
 	Only the account owner can delete their own account.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -2948,28 +3706,24 @@ def delete_gym_account():
 		return jsonify({"error": "Missing access token"}), 401
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		if not SUPABASE_URL or not SUPABASE_ANON_KEY or not SUPABASE_SERVICE_ROLE_KEY:
+		if not SUPABASE_CONFIGURED:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 
 		# Verify user and get user info
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		user = _verify_token(access_token)
 		
-		if not user_response.user:
+		if not user:
 			return jsonify({"error": "Invalid token"}), 401
 		
-		user_id = user_response.user.id
-		user_meta = user_response.user.user_metadata or {}
+		user_id = user.id
+		user_meta = user.user_metadata or {}
 		
 		# Verify this is a gym account
 		if user_meta.get("is_gym_account") != True:
 			return jsonify({"error": "This endpoint is only for gym accounts"}), 403
 		
 		# Use service role key to delete the user
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 		
 		# IMPORTANT: Delete all data associated with this gym account BEFORE deleting the user
 		# This ensures GDPR compliance - right to be forgotten
@@ -2977,29 +3731,28 @@ def delete_gym_account():
 		# 1. Delete all gym_analytics data where gym_id points to this account
 		try:
 			delete_analytics = admin_client.table("gym_analytics").delete().eq("gym_id", user_id).execute()
-			print(f"[GYM DELETE] Deleted gym_analytics data for gym_id: {user_id}")
+			log.debug("[GYM DELETE] Deleted gym_analytics data for gym_id: %s", user_id)
 		except Exception as e:
-			print(f"[GYM DELETE] Warning: Could not delete gym_analytics data: {e}")
+			log.warning("[GYM DELETE] Warning: Could not delete gym_analytics data: %s", e)
 		
 		# 2. Unlink all gym_analytics data where user_id points to this account (set gym_id to NULL)
 		# This handles cases where users had this gym linked but the gym account is being deleted
 		try:
 			unlink_analytics = admin_client.table("gym_analytics").update({"gym_id": None}).eq("gym_id", user_id).execute()
-			print(f"[GYM DELETE] Unlinked gym_analytics data for gym_id: {user_id}")
+			log.debug("[GYM DELETE] Unlinked gym_analytics data for gym_id: %s", user_id)
 		except Exception as e:
-			print(f"[GYM DELETE] Warning: Could not unlink gym_analytics data: {e}")
+			log.warning("[GYM DELETE] Warning: Could not unlink gym_analytics data: %s", e)
 		
 		# 3. Delete user from Supabase auth (this will cascade delete from other tables with ON DELETE CASCADE)
 		delete_response = admin_client.auth.admin.delete_user(user_id)
+		_forget_token(access_token)
 		
-		print(f"[GYM DELETE] Account and all associated data deleted: {user_id}")
+		log.info("[GYM DELETE] Account and all associated data deleted: %s", user_id)
 		
 		return jsonify({"success": True, "message": "Gym account and all associated data deleted successfully"}), 200
 		
 	except Exception as e:
-		print(f"[GYM DELETE] Error deleting gym account: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM DELETE] Error deleting gym account: %s", e)
 		return jsonify({"error": f"Failed to delete account: {str(e)}"}), 500
 
 
@@ -3010,9 +3763,6 @@ def update_gym_metadata():
 	User must already be created via Supabase signUp (frontend).
 	This endpoint only updates metadata, doesn't create users.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -3026,13 +3776,10 @@ def update_gym_metadata():
 		if not user_id or not gym_name:
 			return jsonify({"error": "User ID and gym name are required"}), 400
 		
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 		
 		# Get current metadata
 		try:
@@ -3041,7 +3788,7 @@ def update_gym_metadata():
 			if user_detail and hasattr(user_detail, 'user') and user_detail.user:
 				current_meta = getattr(user_detail.user, 'user_metadata', {}) or getattr(user_detail.user, 'raw_user_meta_data', {}) or {}
 		except Exception as e:
-			print(f"[GYM UPDATE] Error getting user: {e}")
+			log.error("[GYM UPDATE] Error getting user: %s", e)
 			return jsonify({"error": "User not found"}), 404
 		
 		# Update metadata
@@ -3058,21 +3805,17 @@ def update_gym_metadata():
 			admin_client.auth.admin.update_user_by_id(user_id, {
 				"user_metadata": updated_meta
 			})
-			print(f"[GYM UPDATE] Successfully updated metadata for user {user_id}")
+			log.info("[GYM UPDATE] Successfully updated metadata for user %s", user_id)
 			return jsonify({
 				"success": True,
 				"message": "Gym account metadata updated successfully"
 			}), 200
 		except Exception as update_error:
-			print(f"[GYM UPDATE] Error updating metadata: {update_error}")
-			import traceback
-			traceback.print_exc()
+			_log_exception("[GYM UPDATE] Error updating metadata: %s", update_error)
 			return jsonify({"error": f"Failed to update metadata: {str(update_error)}"}), 500
 		
 	except Exception as e:
-		print(f"[GYM UPDATE] Error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM UPDATE] Error: %s", e)
 		return jsonify({"error": f"Failed to update gym metadata: {str(e)}"}), 500
 
 
@@ -3082,8 +3825,6 @@ def register_gym_account():
 	DEPRECATED: This endpoint is no longer used.
 	Gym accounts are now created via Supabase signUp (frontend) and metadata is updated via /api/gym/update-metadata
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
 	return jsonify({"error": "This endpoint is deprecated. Use Supabase signUp instead."}), 410
 
 
@@ -3092,20 +3833,14 @@ def debug_gym_accounts():
 	"""
 	Debug endpoint to check what gym accounts exist and their metadata.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 		
 		# Try to get users with better error handling
 		all_users = None
@@ -3113,54 +3848,53 @@ def debug_gym_accounts():
 		
 		try:
 			all_users = admin_client.auth.admin.list_users()
-			print(f"[DEBUG] list_users() response type: {type(all_users)}")
-			print(f"[DEBUG] list_users() response dir: {[x for x in dir(all_users) if not x.startswith('_')][:20]}")
+			if log.isEnabledFor(logging.DEBUG):
+				log.debug("list_users() response type: %s", type(all_users))
+				log.debug("list_users() response dir: %s", [x for x in dir(all_users) if not x.startswith('_')][:20])
 			
 			# Try multiple ways to access users
 			if hasattr(all_users, 'users'):
 				users_list = all_users.users
-				print(f"[DEBUG] Found {len(users_list)} users via .users")
+				log.debug("Found %s users via .users", len(users_list))
 			elif hasattr(all_users, 'data'):
 				users_list = all_users.data
-				print(f"[DEBUG] Found {len(users_list)} users via .data")
+				log.debug("Found %s users via .data", len(users_list))
 			elif isinstance(all_users, dict):
 				users_list = all_users.get('users', []) or all_users.get('data', [])
-				print(f"[DEBUG] Found {len(users_list)} users via dict")
+				log.debug("Found %s users via dict", len(users_list))
 			elif hasattr(all_users, 'model_dump'):
 				data = all_users.model_dump()
 				users_list = data.get('users', []) or data.get('data', [])
-				print(f"[DEBUG] Found {len(users_list)} users via model_dump")
+				log.debug("Found %s users via model_dump", len(users_list))
 			elif hasattr(all_users, '__dict__'):
 				data = all_users.__dict__
 				users_list = data.get('users', []) or data.get('data', [])
-				print(f"[DEBUG] Found {len(users_list)} users via __dict__")
+				log.debug("Found %s users via __dict__", len(users_list))
 			else:
 				try:
 					users_list = list(all_users) if all_users else []
-					print(f"[DEBUG] Found {len(users_list)} users via list()")
+					log.debug("Found %s users via list()", len(users_list))
 				except:
-					print("[DEBUG] Could not convert to list")
+					log.debug("Could not convert to list")
 			
 			# Try with pagination if empty
 			if not users_list:
-				print("[DEBUG] Trying with pagination...")
+				log.debug("Trying with pagination...")
 				try:
 					all_users_paged = admin_client.auth.admin.list_users(page=1, per_page=1000)
 					if hasattr(all_users_paged, 'users'):
 						users_list = all_users_paged.users
-						print(f"[DEBUG] Found {len(users_list)} users via pagination .users")
+						log.debug("Found %s users via pagination .users", len(users_list))
 					elif hasattr(all_users_paged, 'data'):
 						users_list = all_users_paged.data
-						print(f"[DEBUG] Found {len(users_list)} users via pagination .data")
+						log.debug("Found %s users via pagination .data", len(users_list))
 				except Exception as page_e:
-					print(f"[DEBUG] Pagination failed: {page_e}")
+					log.debug("Pagination failed: %s", page_e)
 			
-			if not users_list:
-				print(f"[DEBUG] WARNING: No users found. Response: {repr(all_users)[:200]}")
+			if not users_list and log.isEnabledFor(logging.DEBUG):
+				log.debug("WARNING: No users found. Response: %s", repr(all_users)[:200])
 		except Exception as e:
-			print(f"[DEBUG] Error getting users: {e}")
-			import traceback
-			traceback.print_exc()
+			_log_exception("Error getting users: %s", e)
 			users_list = []
 		
 		debug_info = {
@@ -3174,16 +3908,14 @@ def debug_gym_accounts():
 				user_id = getattr(user, 'id', None) or (user.get('id') if isinstance(user, dict) else None)
 				user_email = getattr(user, 'email', None) or (user.get('email') if isinstance(user, dict) else 'unknown')
 				
-				# Get full user details
-				user_detail = admin_client.auth.admin.get_user_by_id(user_id)
-				user_obj = user_detail.user if hasattr(user_detail, 'user') else None
-				
+				# list_users already returns each user's metadata; no per-user lookup needed
 				user_meta = {}
-				if user_obj:
-					if hasattr(user_obj, 'user_metadata') and user_obj.user_metadata:
-						user_meta = user_obj.user_metadata
-					elif hasattr(user_obj, 'raw_user_meta_data') and user_obj.raw_user_meta_data:
-						user_meta = user_obj.raw_user_meta_data
+				if isinstance(user, dict):
+					user_meta = user.get("user_metadata") or user.get("raw_user_meta_data") or {}
+				elif getattr(user, 'user_metadata', None):
+					user_meta = user.user_metadata
+				elif getattr(user, 'raw_user_meta_data', None):
+					user_meta = user.raw_user_meta_data
 				
 				if user_meta:
 					is_gym_value = user_meta.get("is_gym_account")
@@ -3212,15 +3944,83 @@ def debug_gym_accounts():
 		return jsonify(debug_info), 200
 	except Exception as e:
 		return jsonify({"error": str(e)}), 500
+
+
+@lru_cache(maxsize=8192)
+def _parse_iso(value: str) -> Optional[datetime]:
+	"""datetime.fromisoformat for Supabase timestamps ('Z' suffix allowed), cached per string; None if unparseable."""
+	try:
+		return datetime.fromisoformat(value.replace('Z', '+00:00'))
+	except (AttributeError, TypeError, ValueError):
+		return None
+
+
+@lru_cache(maxsize=4096)
+def _iso_epoch(value: Any) -> Optional[float]:
+	"""Epoch seconds for a Supabase ISO timestamp or datetime (naive values are taken as UTC), or None if unparseable."""
+	parsed = value if isinstance(value, datetime) else _parse_iso(value)
+	if parsed is None:
+		return None
+	if parsed.tzinfo is None:
+		parsed = parsed.replace(tzinfo=timezone.utc)
+	return parsed.timestamp()
+
+
+_WEEKDAY_ABBR = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_WEEKDAY_FULL = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+@lru_cache(maxsize=4096)
+def _iso_week_key(day: date) -> str:
+	"""ISO week label ("YYYY-Www") for a date; many workouts share a day, so this is cached."""
+	iso_year, iso_week, _ = day.isocalendar()
+	return f"{iso_year}-W{iso_week:02d}"
+
+
+def _workout_exercise_count(workout: Dict[str, Any]) -> int:
+	"""Number of exercises in a workout row, from exercise_count when it was selected (ADD_WORKOUT_EXERCISE_COUNT.sql)."""
+	count = workout.get("exercise_count")
+	if count is not None:
+		return int(count)
+	exercises = workout.get("exercises")
+	return len(exercises) if isinstance(exercises, list) else 0
+
+
+def _workout_gym_key(workout: Dict[str, Any]) -> str:
+	"""Normalized gym_name of a workout row, computed once and kept on the row as "_gym_key"."""
+	key = workout.get("_gym_key")
+	if key is None:
+		key = workout["_gym_key"] = (workout.get("gym_name") or "").lower().strip()
+	return key
+
+
+# gym_id -> monotonic time of the last successful gym_analytics backfill
+_gym_backfill_done: Dict[str, float] = {}
+_GYM_BACKFILL_INTERVAL_SECONDS = 24 * 60 * 60
+
+# Serialized dashboard bodies per (gym_id, gym_name, is_premium, period, date), reused for a short TTL
+_dashboard_cache: "OrderedDict[tuple, tuple[float, str, str]]" = OrderedDict()
+_dashboard_cache_lock = threading.Lock()
+_DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("GYM_DASHBOARD_CACHE_SECONDS", "60"))
+_DASHBOARD_CACHE_MAX = 256
+
+
+def _dashboard_response(body: str, etag: str) -> Any:
+	"""JSON response for a dashboard body; answers 304 when the client already has this version."""
+	response = app.response_class(body, mimetype="application/json")
+	response.set_etag(etag)
+	response.cache_control.private = True
+	response.cache_control.no_cache = True
+	response.vary.add("Authorization")
+	return response.make_conditional(request)
+
+
 @app.route("/api/gym/dashboard", methods=["GET", "OPTIONS"])
 def get_gym_dashboard():
 	"""
 	Get dashboard data for a gym account.
 	Returns statistics about users linked to this gym.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -3232,11 +4032,7 @@ def get_gym_dashboard():
 	access_token = auth_header.replace("Bearer ", "").strip()
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-		SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-		
-		if not SUPABASE_URL or not SUPABASE_ANON_KEY or not SUPABASE_SERVICE_ROLE_KEY:
+		if not SUPABASE_CONFIGURED:
 			return jsonify({"error": "Supabase configuration missing"}), 500
 		
 		# Verify user
@@ -3278,76 +4074,82 @@ def get_gym_dashboard():
 				selected_date = None
 				selected_date_obj = None
 		
+		cache_key = (gym_id, gym_name, is_premium, period, selected_date)
+		if _DASHBOARD_CACHE_TTL_SECONDS > 0:
+			with _dashboard_cache_lock:
+				cached = _dashboard_cache.get(cache_key)
+				if cached and time.monotonic() - cached[0] < _DASHBOARD_CACHE_TTL_SECONDS:
+					return _dashboard_response(cached[1], cached[2])
+		
 		# Get analytics data for this gym
-		admin_client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+		admin_client = _get_admin_client()
 
 		# Backfill: if users already have consent + matching gym_name but weren't linked (e.g., older sync bug),
 		# link them now so the dashboard isn't empty.
 		try:
-			unlinked = admin_client.table("gym_analytics").select("user_id,gym_name,gym_id,data_collection_consent").eq("data_collection_consent", True).execute()
-			target = (gym_name or "").lower().strip()
-			if unlinked.data and target:
-				for row in unlinked.data:
-					if row.get("gym_id"):
-						continue
-					row_gym = (row.get("gym_name") or "").lower().strip()
-					if row_gym and row_gym == target:
-						try:
-							admin_client.table("gym_analytics").update({"gym_id": gym_id}).eq("user_id", row.get("user_id")).execute()
-						except Exception:
-							pass
+			target = (gym_name or "").strip()
+			last_backfill = _gym_backfill_done.get(gym_id)
+			if target and (last_backfill is None or time.monotonic() - last_backfill > _GYM_BACKFILL_INTERVAL_SECONDS):
+				# Single UPDATE; a case-insensitive regex on the escaped name, anchored but tolerant of
+				# surrounding whitespace, matches rows the way lower().strip() did (no LIKE wildcards such as * or %)
+				pattern = r"^\s*" + re.escape(target) + r"\s*$"
+				admin_client.table("gym_analytics") \
+					.update({"gym_id": gym_id}) \
+					.is_("gym_id", "null") \
+					.eq("data_collection_consent", True) \
+					.filter("gym_name", "imatch", pattern) \
+					.execute()
+				_gym_backfill_done[gym_id] = time.monotonic()
 		except Exception:
 			pass
 		
 		# Get users linked to this gym (all), and the subset with consent
-		analytics_all = admin_client.table("gym_analytics").select("*").eq("gym_id", gym_id).execute()
-		analytics_consent = admin_client.table("gym_analytics").select("*").eq("gym_id", gym_id).eq("data_collection_consent", True).execute()
-		
+		analytics_all = admin_client.table("gym_analytics").select("user_id,gym_name,created_at,consent_given_at,data_collection_consent,gym_id").eq("gym_id", gym_id).execute()
+		analytics_rows = analytics_all.data or []
+
+		# Single pass over the linked users: consent subset, ids, monthly growth and,
+		# for a selected date, the users that were linked by then
+		consent_rows = []
+		user_id_set = set()
+		monthly_growth = defaultdict(int)
+		selected_end_epoch = None
+		if selected_date_obj:
+			# Make timezone-aware (UTC) to match linked_at
+			selected_end_epoch = datetime.combine(selected_date_obj, datetime.max.time()).replace(tzinfo=timezone.utc).timestamp()
+		linked_by_date = 0
+		consent_by_date = 0
+		for u in analytics_rows:
+			has_consent = u.get("data_collection_consent") == True
+			if has_consent:
+				consent_rows.append(u)
+				# Monthly growth (users per month) - only users with consent
+				created = _parse_iso(u.get("created_at")) if u.get("created_at") else None
+				if created:
+					month_key = created.strftime("%Y-%m")
+					monthly_growth[month_key] += 1
+			user_id = u.get("user_id")
+			if not user_id:
+				continue
+			user_id_set.add(user_id)
+			if selected_end_epoch is not None:
+				# Use gym_analytics.created_at (when user was linked to gym), not account creation date.
+				# Users without a parseable linked_at are not counted (we can't determine when they were linked)
+				linked_epoch = _iso_epoch(u["created_at"]) if u.get("created_at") else None
+				if linked_epoch is not None and linked_epoch <= selected_end_epoch:
+					linked_by_date += 1
+					if has_consent:
+						consent_by_date += 1
+
 		# Calculate statistics
 		# If a specific date is selected, only count users that were linked to the gym up to and including that date
-		if selected_date:
-			try:
-				# Make timezone-aware (UTC) to match linked_at
-				selected_date_end = datetime.combine(selected_date_obj, datetime.max.time()).replace(tzinfo=timezone.utc)
-				total_users = 0
-				users_with_consent = 0
-				if analytics_all.data:
-					for u in analytics_all.data:
-						if not u.get("user_id"):
-							continue
-						# Use gym_analytics.created_at (when user was linked to gym), not account creation date
-						linked_at = None
-						if u.get("created_at"):
-							try:
-								linked_at = datetime.fromisoformat(u.get("created_at").replace('Z', '+00:00'))
-							except:
-								pass
-						
-						# Count user if they were linked to gym on or before selected date
-						if linked_at:
-							if linked_at <= selected_date_end:
-								total_users += 1
-								# Check if user has consent
-								if u.get("data_collection_consent") == True:
-									users_with_consent += 1
-							# If linked_at is after selected_date, don't count (user wasn't linked yet)
-						else:
-							# If no linked_at date, don't count (we can't determine when they were linked)
-							pass
-				users_linked = total_users
-				print(f"[GYM DASHBOARD] Users for date {selected_date}: total={total_users}, with_consent={users_with_consent}")
-			except Exception as e:
-				print(f"[GYM DASHBOARD] Error calculating users for date {selected_date}: {e}")
-				import traceback
-				traceback.print_exc()
-				# Fallback to normal calculation if date parsing fails
-				total_users = len(analytics_all.data) if analytics_all.data else 0
-				users_with_consent = len(analytics_consent.data) if analytics_consent.data else 0
-				users_linked = total_users
+		if selected_end_epoch is not None:
+			total_users = linked_by_date
+			users_with_consent = consent_by_date
+			dashboard_log.debug("Users for date %s: total=%s, with_consent=%s", selected_date, total_users, users_with_consent)
 		else:
-			total_users = len(analytics_all.data) if analytics_all.data else 0
-			users_with_consent = len(analytics_consent.data) if analytics_consent.data else 0
-			users_linked = total_users  # same as total users for this gym_id
+			total_users = len(analytics_rows)
+			users_with_consent = len(consent_rows)
+		users_linked = total_users  # same as total users for this gym_id
 		
 		# Calculate previous period comparisons (for KPI cards)
 		now = datetime.now(timezone.utc)
@@ -3359,60 +4161,58 @@ def get_gym_dashboard():
 		
 		# Get user creation dates from auth.users (more accurate than gym_analytics.created_at)
 		user_creation_dates = {}
-		if analytics_all.data:
-			user_ids = [u.get("user_id") for u in analytics_all.data if u.get("user_id")]
+		if user_id_set:
+			user_ids = list(user_id_set)
 			if user_ids:
 				try:
-					# Get user creation dates from auth.users
-					all_users = admin_client.auth.admin.list_users()
-					users_list = getattr(all_users, "data", None) or getattr(all_users, "users", None) or []
-					for auth_user in users_list:
-						if auth_user.id in user_ids:
-							# Use created_at from auth.users (when the account was created)
-							user_creation_dates[auth_user.id] = auth_user.created_at
-				except Exception as e:
-					print(f"[GYM DASHBOARD] Error fetching user creation dates: {e}")
+					# Only the linked users' rows (see ADD_USER_CREATED_ATS_RPC.sql)
+					created_res = admin_client.rpc("get_user_created_ats", {"p_user_ids": user_ids}).execute()
+					for row in created_res.data or []:
+						if row.get("id") and row.get("created_at"):
+							user_creation_dates[row["id"]] = row["created_at"]
+				except Exception as rpc_e:
+					dashboard_log.debug("get_user_created_ats RPC unavailable, listing users: %s", rpc_e)
+					try:
+						# Get user creation dates from auth.users
+						all_users = admin_client.auth.admin.list_users()
+						users_list = getattr(all_users, "data", None) or getattr(all_users, "users", None) or []
+						# Use created_at from auth.users (when the account was created)
+						user_creation_dates = {u.id: u.created_at for u in users_list if u.id in user_id_set}
+					except Exception as e:
+						dashboard_log.error("Error fetching user creation dates: %s", e)
 		
 		# Initialize comparison data - will be filled when we process workouts
 		# Users: count total users up to and including the comparison period
 		# For "yesterday", we want users that existed at the end of yesterday (before today)
 		today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-		if analytics_all.data:
+		# Sorted account creation times, shared by the yesterday/last week/last month user counts
+		created_epochs = []
+		undated_users = 0
+		if analytics_rows:
 			# Yesterday: total users whose accounts were created before today started
-			yesterday_users_count = 0
-			for u in analytics_all.data:
-				if not u.get("user_id"):
-					continue
+			for u in analytics_rows:
 				user_id = u.get("user_id")
-				# Use actual user creation date from auth.users if available
-				if user_id in user_creation_dates:
-					try:
-						created_str = user_creation_dates[user_id].replace('Z', '+00:00')
-						created = datetime.fromisoformat(created_str)
-						if created < today_start:
-							yesterday_users_count += 1
-					except:
-						pass
-				else:
-					# Fallback: use gym_analytics.created_at (less accurate)
-					if u.get("created_at"):
-						try:
-							created_str = u.get("created_at").replace('Z', '+00:00')
-							created = datetime.fromisoformat(created_str)
-							if created < today_start:
-								yesterday_users_count += 1
-						except:
-							pass
-					else:
-						# If no created_at, assume old user (count it as existing yesterday)
-						yesterday_users_count += 1
+				if not user_id:
+					continue
+				# Use actual user creation date from auth.users if available,
+				# falling back to gym_analytics.created_at (less accurate)
+				created_str = user_creation_dates[user_id] if user_id in user_creation_dates else u.get("created_at")
+				if not created_str:
+					# If no created_at, assume old user (count it as existing yesterday)
+					undated_users += 1
+					continue
+				created_epoch = _iso_epoch(created_str)
+				if created_epoch is not None:
+					created_epochs.append(created_epoch)
+			created_epochs.sort()
+			yesterday_users_count = undated_users + bisect.bisect_left(created_epochs, today_start.timestamp())
 			comparison_data["yesterday"]["users"] = yesterday_users_count
-			print(f"[GYM DASHBOARD] Yesterday users comparison: {comparison_data['yesterday']['users']} (total users: {total_users})")
+			dashboard_log.debug("Yesterday users comparison: %s (total users: %s)", comparison_data['yesterday']['users'], total_users)
 		
 		# Get recent users (last 10) - only users with consent
 		recent_users = []
-		if analytics_consent.data:
-			sorted_users = sorted(analytics_consent.data, key=lambda x: x.get("created_at", ""), reverse=True)[:10]
+		if consent_rows:
+			sorted_users = heapq.nlargest(10, consent_rows, key=lambda x: x.get("created_at", ""))
 			recent_users = [
 				{
 					"user_id": user.get("user_id"),
@@ -3423,52 +4223,55 @@ def get_gym_dashboard():
 				for user in sorted_users
 			]
 		
-		# Get monthly growth (users per month) - only users with consent
-		monthly_growth = {}
-		if analytics_consent.data:
-			for user in analytics_consent.data:
-				created_at = user.get("created_at")
-				if created_at:
-					try:
-						date = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-						month_key = date.strftime("%Y-%m")
-						monthly_growth[month_key] = monthly_growth.get(month_key, 0) + 1
-					except:
-						pass
-		
 		# ===== Workout analytics for charts (only users with consent) =====
-		def _count_sets(ex_obj: dict) -> int:
+		def _scan_sets(ex_obj: dict) -> tuple:
+			"""
+			One pass over an exercise's sets (same counters as the chart bundle RPC):
+			(filled-in sets, dict sets, sets with cardio fields, strength-only sets, volume in kg).
+			"""
 			sets = ex_obj.get("sets")
 			if not isinstance(sets, list):
-				return 0
-			count = 0
+				return 0, 0, 0, 0, 0
+			counted = object_sets = cardio_field = strength_only = 0
+			volume = 0
 			for s in sets:
 				if not isinstance(s, dict):
 					continue
+				object_sets += 1
 				# Strength set
 				w = s.get("weight", "")
 				r = s.get("reps", "")
-				# Cardio set
-				mins = s.get("min", "")
-				secs = s.get("sec", "")
-				km = s.get("km", "")
-				cal = s.get("cal", "")
-				if (w not in ("", None) or r not in ("", None)) or (mins not in ("", None) or secs not in ("", None) or km not in ("", None) or cal not in ("", None)):
-					count += 1
-			return count
+				has_weight = w not in ("", None)
+				has_reps = r not in ("", None)
+				# Cardio set (min/sec/km/cal)
+				has_cardio = s.get("min", "") not in ("", None) or s.get("sec", "") not in ("", None) or s.get("km", "") not in ("", None) or s.get("cal", "") not in ("", None)
+				if has_weight or has_reps or has_cardio:
+					counted += 1
+				if has_cardio:
+					cardio_field += 1
+				elif has_weight and has_reps:
+					strength_only += 1
+				if has_weight and has_reps:
+					try:
+						w_kg = float(str(w).replace(",", "."))
+						reps_n = int(str(r))
+						if w_kg > 0 and reps_n > 0:
+							volume += w_kg * reps_n
+					except (ValueError, TypeError):
+						pass
+			return counted, object_sets, cardio_field, strength_only, volume
 
 		def _exercise_display(ex_obj: dict) -> str:
 			key = ex_obj.get("key") or ""
-			if key and key in MACHINE_METADATA:
-				return str(MACHINE_METADATA[key].get("display") or key)
+			if key in _DISPLAY_BY_KEY:
+				return _DISPLAY_BY_KEY[key]
 			return str(ex_obj.get("display") or key or "Exercise")
 
 		def _exercise_muscles(ex_obj: dict) -> List[str]:
 			# Prefer MACHINE_METADATA by key; else any muscles already present
 			key = ex_obj.get("key") or ""
-			if key and key in MACHINE_METADATA:
-				muscles = MACHINE_METADATA[key].get("muscles") or []
-				return normalize_muscles(muscles) if isinstance(muscles, list) else []
+			if key in _MUSCLES_BY_KEY:
+				return _MUSCLES_BY_KEY[key]
 			m = ex_obj.get("muscles") or []
 			return normalize_muscles(m) if isinstance(m, list) else []
 
@@ -3485,8 +4288,8 @@ def get_gym_dashboard():
 
 		try:
 			consent_user_ids = []
-			if analytics_consent.data:
-				for row in analytics_consent.data:
+			if consent_rows:
+				for row in consent_rows:
 					uid = row.get("user_id")
 					if uid:
 						consent_user_ids.append(uid)
@@ -3510,99 +4313,123 @@ def get_gym_dashboard():
 				if selected_date:
 					stats_end_date = selected_date
 
-				# Get all workouts for charts (use period filter for charts)
-				all_workouts = []
-				# Supabase has an IN limit; chunk
-				for i in range(0, len(consent_user_ids), 50):
-					chunk = consent_user_ids[i:i+50]
+				def fetch_workouts(chunk, columns, fallback_columns, start=None, end=None):
 					# We want ONLY workouts saved with this gym. Prefer filtering by workouts.gym_name,
 					# but keep backwards compatibility if the column doesn't exist yet.
+					def run(select_columns):
+						q = admin_client.table("workouts").select(select_columns).in_("user_id", chunk)
+						if start:
+							q = q.gte("date", start)
+						if end:
+							q = q.lte("date", end)
+						return q.execute()
 					try:
-						q = admin_client.table("workouts") \
-							.select("user_id,date,inserted_at,created_at,exercises,gym_name,gym_place_id") \
-							.in_("user_id", chunk)
-						# Charts: use period filter
-						if chart_start_date:
-							q = q.gte("date", chart_start_date)
-						if chart_end_date:
-							q = q.lte("date", chart_end_date)
-						res = q.execute()
+						res = run(columns)
 					except Exception as e:
-						# If gym_name column doesn't exist, we can't do per-workout gym analytics reliably.
+						# If gym_name or exercise_count doesn't exist yet, use the older column set.
 						msg = str(e)
-						if "gym_name" in msg or "gym_place_id" in msg:
-							q = admin_client.table("workouts") \
-								.select("user_id,date,inserted_at,created_at,exercises") \
-								.in_("user_id", chunk)
-							if chart_start_date:
-								q = q.gte("date", chart_start_date)
-							if chart_end_date:
-								q = q.lte("date", chart_end_date)
-							res = q.execute()
+						if "gym_name" in msg or "gym_place_id" in msg or "exercise_count" in msg:
+							res = run(fallback_columns)
 						else:
 							raise
-					if res.data:
-						all_workouts.extend(res.data)
-				
+					return res.data or []
+
+				def fetch_all_chunks(columns, fallback_columns, start=None, end=None):
+					# Supabase has an IN limit; chunk and fetch the chunks concurrently
+					futures = [
+						_IO_EXECUTOR.submit(fetch_workouts, consent_user_ids[i:i+50], columns, fallback_columns, start, end)
+						for i in range(0, len(consent_user_ids), 50)
+					]
+					rows = []
+					for future in futures:
+						rows.extend(future.result())
+					return rows
+
+				# Chart aggregates computed in Postgres (ADD_GYM_CHART_BUNDLE_RPC.sql); runs while the statistics rows load
+				chart_bundle_future = _IO_EXECUTOR.submit(
+					lambda: admin_client.rpc(
+						"get_gym_chart_bundle",
+						{
+							"p_user_ids": consent_user_ids,
+							"p_gym_name": gym_name,
+							"p_start_date": chart_start_date,
+							"p_end_date": chart_end_date,
+						},
+					).execute()
+				)
+
 				# For statistics: if selected_date is provided, get ALL workouts up to that date (not just chart period)
-				stats_workouts = []
+				stats_workouts = None
 				if stats_end_date:
-					for i in range(0, len(consent_user_ids), 50):
-						chunk = consent_user_ids[i:i+50]
-						try:
-							q = admin_client.table("workouts") \
-								.select("user_id,date,exercises,gym_name,gym_place_id") \
-								.in_("user_id", chunk) \
-								.lte("date", stats_end_date)
-							res = q.execute()
-						except Exception as e:
-							msg = str(e)
-							if "gym_name" in msg or "gym_place_id" in msg:
-								q = admin_client.table("workouts") \
-									.select("user_id,date,exercises") \
-									.in_("user_id", chunk) \
-									.lte("date", stats_end_date)
-								res = q.execute()
-							else:
-								raise
-						if res.data:
-							stats_workouts.extend(res.data)
+					stats_workouts = fetch_all_chunks(
+						"user_id,date,exercise_count,gym_name,gym_place_id",
+						"user_id,date,exercises,gym_name,gym_place_id",
+						None,
+						stats_end_date
+					)
+
+				chart_bundle = None
+				try:
+					chart_bundle = chart_bundle_future.result().data
+					if not isinstance(chart_bundle, dict):
+						chart_bundle = None
+				except Exception as e:
+					dashboard_log.debug("Chart bundle SQL RPC unavailable, falling back to Python: %s", e)
+				bundle_has_peaks = chart_bundle is not None and isinstance(chart_bundle.get("peak_times"), list)
+
+				# Get all workouts for the period (use period filter for charts). With the bundle every chart
+				# comes from SQL, so only the light columns for counts, comparisons and busy status are loaded;
+				# the full exercises JSON is fetched only for the Python fallback.
+				if bundle_has_peaks:
+					all_workouts = fetch_all_chunks(
+						"user_id,date,exercise_count,gym_name,gym_place_id",
+						"user_id,date,exercises,gym_name,gym_place_id",
+						chart_start_date,
+						chart_end_date
+					)
 				else:
+					all_workouts = fetch_all_chunks(
+						"user_id,date,inserted_at,created_at,exercises,gym_name,gym_place_id",
+						"user_id,date,inserted_at,created_at,exercises",
+						chart_start_date,
+						chart_end_date
+					)
+				if stats_workouts is None:
 					# No date filter: use all_workouts for statistics too
 					stats_workouts = all_workouts
 
-				machine_sets = {}
-				muscle_sets = {}
-				weekday_counts = {k: 0 for k in ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]}
-				hour_counts = {h: 0 for h in range(24)}
-				week_counts = {}
-				day_counts = {}
+				machine_sets = defaultdict(int)
+				muscle_sets = defaultdict(int)
+				weekday_counts = dict.fromkeys(_WEEKDAY_ABBR, 0)
+				hour_counts = dict.fromkeys(range(24), 0)
+				week_counts = defaultdict(int)
+				day_counts = defaultdict(int)
 				# Per-weekday hourly data: { "Monday": { 0: count, 1: count, ... 23: count }, "Tuesday": {...}, ... }
-				weekday_hour_counts = {day: {h: 0 for h in range(24)} for day in ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]}
+				weekday_hour_counts = {day: dict.fromkeys(range(24), 0) for day in _WEEKDAY_FULL}
 				peak_times_from_sql = False
 				top_machines_from_sql = False
-				volume_by_week = {}  # Total kg per week (weight × reps × sets)
-				active_users_by_week = {}  # Unique users per week
+				volume_by_week = defaultdict(float)  # Total kg per week (weight × reps × sets)
+				active_week_users = set()  # (week_key, user_id) pairs seen
+				active_users_weekly = {}  # Unique user counts per week
 				cardio_sets = 0
 				strength_sets = 0
-				total_workouts = 0
-				total_exercises = 0
-
-				target_gym = (gym_name or "").lower().strip()
 
-				# Step 1 optimization: compute peak times in SQL (Postgres) instead of Python loops.
-				# Falls back to existing Python logic if RPC is not available yet.
-				try:
-					peak_res = admin_client.rpc(
-						"get_gym_peak_times",
-						{
-							"p_user_ids": consent_user_ids,
-							"p_gym_name": gym_name,
-							"p_start_date": chart_start_date,
-							"p_end_date": chart_end_date,
-						},
-					).execute()
-					peak_rows = peak_res.data or []
+				target_gym = (gym_name or "").lower().strip()
+
+				def saved_with_gym(rows):
+					# Only workouts that were actually saved with this gym (snapshot on the workout):
+					# gym_name must be set (not empty, "-" or "gym -") and match the target gym
+					if target_gym in ("-", "gym -"):
+						return []
+					if target_gym:
+						return [w for w in rows if _workout_gym_key(w) == target_gym]
+					return [w for w in rows if _workout_gym_key(w) not in ("", "-", "gym -")]
+
+				# Filter once; the statistics reuse the chart rows when no date is selected
+				chart_workouts = saved_with_gym(all_workouts)
+				stats_gym_workouts = chart_workouts if stats_workouts is all_workouts else saved_with_gym(stats_workouts)
+
+				def apply_peak_rows(peak_rows):
 					for row in peak_rows:
 						weekday_name = str(row.get("weekday_name") or "").strip()
 						hour_val = row.get("hour")
@@ -3614,235 +4441,212 @@ def get_gym_dashboard():
 							continue
 						if hour < 0 or hour > 23 or count < 0:
 							continue
-						hour_counts[hour] = hour_counts.get(hour, 0) + count
+						hour_counts[hour] += count
 						if weekday_name in weekday_hour_counts:
-							weekday_hour_counts[weekday_name][hour] = weekday_hour_counts[weekday_name].get(hour, 0) + count
-					if peak_rows:
-						peak_times_from_sql = True
-				except Exception as e:
-					print(f"[GYM DASHBOARD] Peak times SQL RPC unavailable, falling back to Python: {e}")
+							weekday_hour_counts[weekday_name][hour] += count
 
-				# Step 2 optimization: compute top machines in SQL (Postgres) instead of Python loops.
-				# Falls back to existing Python logic if RPC is not available yet.
-				try:
-					machines_res = admin_client.rpc(
-						"get_gym_top_machines",
-						{
-							"p_user_ids": consent_user_ids,
-							"p_gym_name": gym_name,
-							"p_start_date": chart_start_date,
-							"p_end_date": chart_end_date,
-						},
-					).execute()
-					machine_rows = machines_res.data or []
-					machine_sets = {}
-					for row in machine_rows:
-						label = str(row.get("label") or "").strip()
-						value = row.get("value") or 0
-						if not label:
-							continue
-						try:
-							sets_count = int(value)
-						except Exception:
-							continue
-						if sets_count <= 0:
-							continue
-						# Filter: only include exercises that have a key in MACHINE_METADATA
-						# Check if this label matches a known exercise display name
-						is_known_exercise = False
-						for key, metadata in MACHINE_METADATA.items():
-							if metadata.get("display") == label:
-								is_known_exercise = True
-								break
-						if is_known_exercise:
-							machine_sets[label] = sets_count
-					top_machines_from_sql = True
-				except Exception as e:
-					print(f"[GYM DASHBOARD] Top machines SQL RPC unavailable, falling back to Python: {e}")
-			
-				# Process workouts for charts (all_workouts)
-				for w in all_workouts:
-					# Filter to workouts that were actually saved with this gym (snapshot on the workout).
-					w_gym = (w.get("gym_name") or "").lower().strip()
-					
-					# CRITICAL: Only use workouts where gym_name is actually set (not "gym -" or empty)
-					# Skip workouts without a gym name or with "gym -"
-					if not w_gym or w_gym == "-" or w_gym == "gym -":
-						continue
-					
-					# If gym_name is present, it must match the target gym
-					if w_gym and target_gym and w_gym != target_gym:
-						continue
+				# Step 1 optimization: compute peak times in SQL (Postgres) instead of Python loops.
+				# The chart bundle carries them already; older deployments use the separate RPC,
+				# and the Python logic below remains the last fallback.
+				if bundle_has_peaks:
+					apply_peak_rows(chart_bundle["peak_times"])
+					peak_times_from_sql = True
+				else:
+					try:
+						peak_res = admin_client.rpc(
+							"get_gym_peak_times",
+							{
+								"p_user_ids": consent_user_ids,
+								"p_gym_name": gym_name,
+								"p_start_date": chart_start_date,
+								"p_end_date": chart_end_date,
+							},
+						).execute()
+						peak_rows = peak_res.data or []
+						apply_peak_rows(peak_rows)
+						if peak_rows:
+							peak_times_from_sql = True
+					except Exception as e:
+						dashboard_log.debug("Peak times SQL RPC unavailable, falling back to Python: %s", e)
 
-					# Parse workout date for charts
-					date_str = w.get("date")
-					dt = None
+				# Only the bundle with peak times fetched the light rows, so only then are the charts served from it
+				use_chart_bundle = bundle_has_peaks
+
+				# Step 2 optimization: compute top machines in SQL (Postgres) instead of Python loops.
+				# The chart bundle already yields per-exercise sets; otherwise falls back to the Python logic.
+				if not use_chart_bundle:
 					try:
-						# date is stored as YYYY-MM-DD
-						dt = datetime.fromisoformat(str(date_str))
-					except Exception:
-						# fallback
-						try:
-							dt = datetime.fromisoformat(str(date_str).split("T")[0])
-						except Exception:
-							dt = None
-					if dt:
-						day_key = dt.strftime("%Y-%m-%d")
-						day_counts[day_key] = day_counts.get(day_key, 0) + 1
-						weekday = dt.strftime("%a")
-						if weekday in weekday_counts:
-							weekday_counts[weekday] += 1
-						iso_year, iso_week, _ = dt.isocalendar()
-						week_key = f"{iso_year}-W{iso_week:02d}"
-						week_counts[week_key] = week_counts.get(week_key, 0) + 1
-						# Track active users per week
-						user_id = w.get("user_id")
-						if user_id and week_key not in active_users_by_week:
-							active_users_by_week[week_key] = set()
-						if user_id:
-							active_users_by_week[week_key].add(user_id)
-
-					# Peak hours fallback path (only when SQL RPC is not available yet).
-					if not peak_times_from_sql:
-						inserted = w.get("inserted_at") or w.get("created_at")
-						dti = None
-						if inserted:
+						machines_res = admin_client.rpc(
+							"get_gym_top_machines",
+							{
+								"p_user_ids": consent_user_ids,
+								"p_gym_name": gym_name,
+								"p_start_date": chart_start_date,
+								"p_end_date": chart_end_date,
+							},
+						).execute()
+						machine_rows = machines_res.data or []
+						machine_sets = {}
+						for row in machine_rows:
+							label = str(row.get("label") or "").strip()
+							value = row.get("value") or 0
+							if not label:
+								continue
 							try:
-								ts = str(inserted).replace("Z", "+00:00")
-								dti = datetime.fromisoformat(ts)
-								try:
-									from zoneinfo import ZoneInfo  # py3.9+
-									dti = dti.astimezone(ZoneInfo("Europe/Amsterdam"))
-								except Exception:
-									pass
+								sets_count = int(value)
 							except Exception:
-								pass
-						
-						# Fallback to workout date if no timestamp available
-						if not dti and dt:
-							dti = dt.replace(hour=12, minute=0, second=0, microsecond=0)  # Use noon as default time
-						
-						if dti:
-							hour = int(dti.hour)
-							hour_counts[hour] = hour_counts.get(hour, 0) + 1
-							# Track per weekday using workout.date (dt) to stay consistent with workouts_by_weekday
-							weekday_name = dt.strftime("%A") if dt else dti.strftime("%A")
-							if weekday_name in weekday_hour_counts:
-								weekday_hour_counts[weekday_name][hour] = weekday_hour_counts[weekday_name].get(hour, 0) + 1
-
-					# Process exercises for charts (all workouts)
-					exercises = w.get("exercises") or []
-					if not isinstance(exercises, list):
-						continue
-					
-					# Calculate volume for this workout (for volume_by_week)
-					workout_volume = 0
-					workout_week_key = week_key if dt else None
-					
-					for ex in exercises:
-						if not isinstance(ex, dict):
+								continue
+							if sets_count <= 0:
+								continue
+							# Filter: only include exercises that have a key in MACHINE_METADATA
+							# Check if this label matches a known exercise display name
+							if label in _KNOWN_DISPLAYS:
+								machine_sets[label] = sets_count
+						top_machines_from_sql = True
+					except Exception as e:
+						dashboard_log.debug("Top machines SQL RPC unavailable, falling back to Python: %s", e)
+
+				if use_chart_bundle:
+					# Per-day/week counts come pre-aggregated; exercise rows are grouped by key + muscles
+					for day_key, count in (chart_bundle.get("day_counts") or {}).items():
+						dt = _parse_iso(str(day_key))
+						if dt is None:
 							continue
-						sets_n = _count_sets(ex)
+						day_counts[day_key] = int(count)
+						weekday_counts[_WEEKDAY_ABBR[dt.weekday()]] += int(count)
+					week_counts = {k: int(v) for k, v in (chart_bundle.get("week_counts") or {}).items()}
+					volume_by_week = {k: float(v) for k, v in (chart_bundle.get("volume_by_week") or {}).items()}
+					active_users_weekly = {k: int(v) for k, v in (chart_bundle.get("active_users_by_week") or {}).items()}
+
+					for row in chart_bundle.get("exercises") or []:
+						ex = {"key": row.get("key") or "", "muscles": row.get("muscles") or []}
+						sets_n = int(row.get("sets") or 0)
 						if sets_n <= 0:
 							continue
-						if not top_machines_from_sql:
-							# Only include exercises that have a key in MACHINE_METADATA (exclude custom exercises)
-							ex_key = ex.get("key") or ""
-							if ex_key and ex_key in MACHINE_METADATA:
-								name = _exercise_display(ex)
-								machine_sets[name] = machine_sets.get(name, 0) + sets_n
-						
-						# Calculate volume (weight × reps) for strength exercises
-						sets = ex.get("sets") or []
-						if isinstance(sets, list):
-							for s in sets:
-								if not isinstance(s, dict):
-									continue
-								weight = s.get("weight")
-								reps = s.get("reps")
-								# Check if it's a strength exercise (has weight and reps)
-								if weight not in ("", None) and reps not in ("", None):
-									try:
-										w_kg = float(str(weight).replace(",", "."))
-										r = int(str(reps))
-										if w_kg > 0 and r > 0:
-											workout_volume += w_kg * r
-									except (ValueError, TypeError):
-										pass
-						
+						ex_key = ex["key"]
+						if not top_machines_from_sql and ex_key and ex_key in MACHINE_METADATA:
+							name = _exercise_display(ex)
+							machine_sets[name] += sets_n
+
 						# Muscle focus: ONLY count the PRIMARY muscle for each exercise (not every listed muscle)
 						muscles = _exercise_muscles(ex) or []
 						primary = muscles[0] if muscles else ""
 						if primary and primary != "-" and primary.lower() != "cardio":
-							# Normalize muscle name: capitalize first letter, lowercase rest (consistent with app)
 							normalized_muscle = primary.capitalize()
-							muscle_sets[normalized_muscle] = muscle_sets.get(normalized_muscle, 0) + sets_n
-						elif not primary or primary == "-":
-							# Debug: log exercises without primary muscle
-							ex_key = ex.get("key") or ex.get("display") or "unknown"
-							if ex_key not in ["cardio", "-"]:
-								print(f"[GYM DASHBOARD] Exercise {ex_key} has no primary muscle. Muscles: {muscles}")
+							muscle_sets[normalized_muscle] += sets_n
+
+						# Count Cardio vs Strength sets (same rules as the per-workout path below)
+						# Known keys use the precomputed set; other muscle lists are already normalized ("Cardio")
+						is_exercise_cardio = ex_key in _CARDIO_KEYS if ex_key in MACHINE_METADATA else "Cardio" in muscles
+						if is_exercise_cardio:
+							cardio_sets += int(row.get("object_sets") or 0)
+						else:
+							cardio_sets += int(row.get("cardio_field_sets") or 0)
+							strength_sets += int(row.get("strength_only_sets") or 0)
+				else:
+					# Process workouts for charts (all_workouts saved with this gym)
+					for w in chart_workouts:
+						# Parse workout date for charts
+						# date is stored as YYYY-MM-DD; only the day part is used, so parse just that.
+						# Dates repeat across workouts, so the cached parse mostly hits.
+						date_str = str(w.get("date") or "")[:10]
+						dt = _parse_iso(date_str) if date_str else None
+						if dt:
+							day_key = date_str
+							day_counts[day_key] += 1
+							weekday_counts[_WEEKDAY_ABBR[dt.weekday()]] += 1
+							week_key = _iso_week_key(dt.date())
+							week_counts[week_key] += 1
+							# Track active users per week
+							user_id = w.get("user_id")
+							if user_id:
+								active_week_users.add((week_key, user_id))
+
+						# Peak hours fallback path (only when SQL RPC is not available yet).
+						if not peak_times_from_sql:
+							inserted = w.get("inserted_at") or w.get("created_at")
+							dti = None
+							if inserted:
+								dti = _parse_iso(str(inserted))
+								if dti and AMSTERDAM_TZ is not None:
+									dti = dti.astimezone(AMSTERDAM_TZ)
+						
+							# Fallback to workout date if no timestamp available
+							if not dti and dt:
+								dti = dt.replace(hour=12, minute=0, second=0, microsecond=0)  # Use noon as default time
+						
+							if dti:
+								hour = int(dti.hour)
+								hour_counts[hour] += 1
+								# Track per weekday using workout.date (dt) to stay consistent with workouts_by_weekday
+								weekday_hour_counts[_WEEKDAY_FULL[(dt or dti).weekday()]][hour] += 1
+
+						# Process exercises for charts (all workouts)
+						exercises = w.get("exercises") or []
+						if not isinstance(exercises, list):
+							continue
+					
+						# Calculate volume for this workout (for volume_by_week)
+						workout_volume = 0
+						workout_week_key = week_key if dt else None
+					
+						for ex in exercises:
+							if not isinstance(ex, dict):
+								continue
+							sets_n, object_sets_n, cardio_field_n, strength_only_n, ex_volume = _scan_sets(ex)
+							if sets_n <= 0:
+								continue
+							if not top_machines_from_sql:
+								# Only include exercises that have a key in MACHINE_METADATA (exclude custom exercises)
+								ex_key = ex.get("key") or ""
+								if ex_key and ex_key in MACHINE_METADATA:
+									name = _exercise_display(ex)
+									machine_sets[name] += sets_n
+						
+							# Volume (weight × reps) for strength sets
+							workout_volume += ex_volume
+						
+							# Muscle focus: ONLY count the PRIMARY muscle for each exercise (not every listed muscle)
+							muscles = _exercise_muscles(ex) or []
+							primary = muscles[0] if muscles else ""
+							if primary and primary != "-" and primary.lower() != "cardio":
+								# Normalize muscle name: capitalize first letter, lowercase rest (consistent with app)
+								normalized_muscle = primary.capitalize()
+								muscle_sets[normalized_muscle] += sets_n
+							elif not primary or primary == "-":
+								# Debug: log exercises without primary muscle
+								ex_key = ex.get("key") or ex.get("display") or "unknown"
+								if ex_key not in ["cardio", "-"]:
+									dashboard_log.debug("Exercise %s has no primary muscle. Muscles: %s", ex_key, muscles)
 						
-						# Count Cardio vs Strength sets
-						# First, check if the exercise itself is cardio based on metadata
-						ex_key = ex.get("key") or ""
-						ex_muscles = _exercise_muscles(ex) or []
-						is_exercise_cardio = False
-						if ex_key and ex_key in MACHINE_METADATA:
-							meta_muscles = MACHINE_METADATA[ex_key].get("muscles") or []
-							# Check if "Cardio" is in the muscles list
-							is_exercise_cardio = any(m.lower() == "cardio" for m in meta_muscles if isinstance(m, str))
-						elif ex_muscles:
-							# Check if "Cardio" is in the exercise's muscles
-							is_exercise_cardio = any(m.lower() == "cardio" for m in ex_muscles if isinstance(m, str))
+							# Count Cardio vs Strength sets
+							# First, check if the exercise itself is cardio: known keys use the precomputed set,
+							# other exercises their (already normalized) muscle list
+							ex_key = ex.get("key") or ""
+							is_exercise_cardio = ex_key in _CARDIO_KEYS if ex_key in MACHINE_METADATA else "Cardio" in muscles
 						
-						sets_list = ex.get("sets") or []
-						if isinstance(sets_list, list):
-							for s in sets_list:
-								if not isinstance(s, dict):
-									continue
-								# Check if it's cardio (has min/sec/km/cal) OR exercise is marked as cardio
-								has_cardio_fields = any(s.get(k) not in ("", None) for k in ["min", "sec", "km", "cal"])
-								has_strength_fields = s.get("weight") not in ("", None) and s.get("reps") not in ("", None)
-								
-								# If exercise is marked as cardio, count as cardio
-								if is_exercise_cardio:
-									cardio_sets += 1
-								# Otherwise, check set fields
-								elif has_cardio_fields:
-									cardio_sets += 1
-								elif has_strength_fields:
-									strength_sets += 1
+							# If exercise is marked as cardio, every set counts as cardio; otherwise check set fields
+							if is_exercise_cardio:
+								cardio_sets += object_sets_n
+							else:
+								cardio_sets += cardio_field_n
+								strength_sets += strength_only_n
 					
-					# Add volume to week
-					if workout_week_key and workout_volume > 0:
-						volume_by_week[workout_week_key] = volume_by_week.get(workout_week_key, 0) + workout_volume
+						# Add volume to week
+						if workout_week_key and workout_volume > 0:
+							volume_by_week[workout_week_key] += workout_volume
 
 				# Calculate statistics (workouts and exercises) from stats_workouts
 				# This is separate from charts to ensure we count ALL workouts up to selected_date
-				for w in stats_workouts:
-					# Filter to workouts that were actually saved with this gym
-					w_gym = (w.get("gym_name") or "").lower().strip()
-					
-					# CRITICAL: Only use workouts where gym_name is actually set (not "gym -" or empty)
-					if not w_gym or w_gym == "-" or w_gym == "gym -":
-						continue
-					
-					# If gym_name is present, it must match the target gym
-					if w_gym and target_gym and w_gym != target_gym:
-						continue
-					
-					# Count workout and exercises for statistics
-					total_workouts += 1
-					exercises = w.get("exercises") or []
-					if isinstance(exercises, list):
-						total_exercises += len(exercises)
+				total_workouts = len(stats_gym_workouts)
+				total_exercises = sum(_workout_exercise_count(w) for w in stats_gym_workouts)
 
 				top_machines = sorted(machine_sets.items(), key=lambda kv: kv[1], reverse=True)  # Show all machines
 				top_muscles = sorted(muscle_sets.items(), key=lambda kv: kv[1], reverse=True)  # Show all muscles, not just top 8
-				print(f"[GYM DASHBOARD] Total unique muscles found: {len(top_muscles)}")
-				if len(top_muscles) > 0:
-					print(f"[GYM DASHBOARD] Top 10 muscles: {top_muscles[:10]}")
+				if dashboard_log.isEnabledFor(logging.DEBUG):
+					dashboard_log.debug("Total unique muscles found: %s", len(top_muscles))
+					if top_muscles:
+						dashboard_log.debug("Top 10 muscles: %s", top_muscles[:10])
 
 				# last 8 weeks (sorted)
 				last_weeks = sorted(week_counts.items(), key=lambda kv: kv[0])[-8:]
@@ -3856,42 +4660,39 @@ def get_gym_dashboard():
 					weekday: [{"label": f"{h:02d}:00", "value": hours.get(h, 0)} for h in range(24)]
 					for weekday, hours in weekday_hour_counts.items()
 				}
-				print(f"[GYM DASHBOARD] workouts_by_day_hour: {len(chart['workouts_by_day_hour'])} weekdays with hourly data")
+				if dashboard_log.isEnabledFor(logging.DEBUG):
+					dashboard_log.debug("workouts_by_day_hour: %s weekdays with hourly data", len(chart['workouts_by_day_hour']))
 				
 				# Volume by week (last 8 weeks, sorted)
 				sorted_weeks = sorted(volume_by_week.items(), key=lambda kv: kv[0])[-8:]
 				chart["volume_by_week"] = [{"label": k, "value": round(v, 1)} for k, v in sorted_weeks]
 				
 				# Active users by week (last 8 weeks, sorted)
-				active_users_weekly = {k: len(v) for k, v in active_users_by_week.items()}
+				if active_week_users:
+					active_users_weekly = Counter(week_key for week_key, _ in active_week_users)
 				sorted_active_weeks = sorted(active_users_weekly.items(), key=lambda kv: kv[0])[-8:]
 				chart["active_users_by_week"] = [{"label": k, "value": v} for k, v in sorted_active_weeks]
 				
 				# Exercise categories (Cardio vs Strength)
 				total_category_sets = cardio_sets + strength_sets
-				print(f"[GYM DASHBOARD] Exercise categories: cardio_sets={cardio_sets}, strength_sets={strength_sets}, total={total_category_sets}")
+				dashboard_log.debug("Exercise categories: cardio_sets=%s, strength_sets=%s, total=%s", cardio_sets, strength_sets, total_category_sets)
 				if total_category_sets > 0:
 					chart["exercise_categories"] = [
 						{"label": "Strength", "value": strength_sets},
 						{"label": "Cardio", "value": cardio_sets}
 					]
-					print(f"[GYM DASHBOARD] Exercise categories data: {chart['exercise_categories']}")
+					dashboard_log.debug("Exercise categories data: %s", chart['exercise_categories'])
 				else:
 					chart["exercise_categories"] = []
-					print(f"[GYM DASHBOARD] No exercise categories data (total_sets=0)")
+					dashboard_log.debug("No exercise categories data (total_sets=0)")
 				# Daily time series for line chart (X = days)
 				try:
 					end_d = datetime.now(timezone.utc).date()
 					# Use selected period; for "all" show last 365 days (still "all days" on the x-axis)
 					span_days = lookback_days if isinstance(lookback_days, int) and lookback_days > 0 else 365
-					start_d = end_d - timedelta(days=span_days - 1)
-					series = []
-					d = start_d
-					while d <= end_d:
-						k = d.isoformat()
-						series.append({"label": k, "value": int(day_counts.get(k, 0))})
-						d += timedelta(days=1)
-					chart["workouts_by_day"] = series
+					end_ordinal = end_d.toordinal()
+					iso_days = [date.fromordinal(o).isoformat() for o in range(end_ordinal - span_days + 1, end_ordinal + 1)]
+					chart["workouts_by_day"] = [{"label": k, "value": int(day_counts.get(k, 0))} for k in iso_days]
 				except Exception:
 					chart["workouts_by_day"] = []
 				chart["workouts_last_weeks"] = [{"label": k, "value": v} for k, v in last_weeks]
@@ -3905,56 +4706,56 @@ def get_gym_dashboard():
 				today_date = datetime.now(timezone.utc).date().isoformat()
 				yesterday_date = (datetime.now(timezone.utc) - timedelta(days=1)).date().isoformat()
 				
-				# Get TODAY's workouts and exercises for comparison
-				today_workouts = []
-				for i in range(0, len(consent_user_ids), 50):
-					chunk = consent_user_ids[i:i+50]
+				# Comparisons only count workouts whose normalized gym_name equals a real target gym
+				comparison_gym = target_gym if target_gym not in ("", "-", "gym -") else None
+				# Chart workouts saved with this gym, bucketed by date for the last week/month windows
+				workouts_by_date = defaultdict(list)
+				if comparison_gym:
+					for w in chart_workouts:
+						workouts_by_date[w.get("date") or ""].append(w)
+
+				# Get TODAY's and YESTERDAY's workouts with one query per chunk, split by date
+				def fetch_recent_workouts(chunk):
 					try:
-						q = admin_client.table("workouts") \
-							.select("user_id,date,exercises,gym_name") \
-							.in_("user_id", chunk) \
-							.eq("date", today_date)
-						res = q.execute()
-						if res.data:
-							today_workouts.extend(res.data)
+						return fetch_workouts(
+							chunk,
+							"user_id,date,exercise_count,gym_name",
+							"user_id,date,exercises,gym_name",
+							yesterday_date,
+							today_date,
+						)
 					except Exception as e:
-						print(f"[GYM DASHBOARD] Error fetching today workouts: {e}")
+						dashboard_log.error("Error fetching today/yesterday workouts: %s", e)
+						return []
+
+				recent_futures = [
+					_IO_EXECUTOR.submit(fetch_recent_workouts, consent_user_ids[i:i+50])
+					for i in range(0, len(consent_user_ids), 50)
+				]
+				today_workouts = []
+				yesterday_workouts = []
+				for future in recent_futures:
+					for w in future.result():
+						if w.get("date") == today_date:
+							today_workouts.append(w)
+						elif w.get("date") == yesterday_date:
+							yesterday_workouts.append(w)
 				
 				# Filter today's workouts to matching gym
 				today_workouts_filtered = [
 					w for w in today_workouts
-					if (w.get("gym_name") or "").lower().strip() == target_gym
-					and (w.get("gym_name") or "").lower().strip() not in ("", "-", "gym -")
+					if comparison_gym and _workout_gym_key(w) == comparison_gym
 				]
 				today_workouts_count = len(today_workouts_filtered)
-				today_exercises_count = sum([len(w.get("exercises") or []) for w in today_workouts_filtered])
-				
-				# Get YESTERDAY's workouts and exercises for comparison
-				yesterday_workouts = []
-				for i in range(0, len(consent_user_ids), 50):
-					chunk = consent_user_ids[i:i+50]
-					try:
-						q = admin_client.table("workouts") \
-							.select("user_id,date,exercises,gym_name") \
-							.in_("user_id", chunk) \
-							.eq("date", yesterday_date)
-						res = q.execute()
-						if res.data:
-							yesterday_workouts.extend(res.data)
-					except Exception as e:
-						print(f"[GYM DASHBOARD] Error fetching yesterday workouts: {e}")
+				today_exercises_count = sum(_workout_exercise_count(w) for w in today_workouts_filtered)
 				
 				# Filter yesterday's workouts to matching gym
 				yesterday_workouts_filtered = [
 					w for w in yesterday_workouts
-					if (w.get("gym_name") or "").lower().strip() == target_gym
-					and (w.get("gym_name") or "").lower().strip() not in ("", "-", "gym -")
+					if comparison_gym and _workout_gym_key(w) == comparison_gym
 				]
 				comparison_data["yesterday"]["workouts"] = len(yesterday_workouts_filtered)
-				comparison_data["yesterday"]["exercises"] = sum([
-					len(w.get("exercises") or [])
-					for w in yesterday_workouts_filtered
-				])
+				comparison_data["yesterday"]["exercises"] = sum(_workout_exercise_count(w) for w in yesterday_workouts_filtered)
 				
 				# Store today's counts for "yesterday" comparison
 				# We'll use these when the comparison is "yesterday"
@@ -3962,101 +4763,47 @@ def get_gym_dashboard():
 					"workouts": today_workouts_count,
 					"exercises": today_exercises_count
 				}
-				print(f"[GYM DASHBOARD] Today vs Yesterday: today={today_workouts_count} workouts ({today_exercises_count} exercises), yesterday={comparison_data['yesterday']['workouts']} workouts ({comparison_data['yesterday']['exercises']} exercises)")
+				dashboard_log.debug("Today vs Yesterday: today=%s workouts (%s exercises), yesterday=%s workouts (%s exercises)", today_workouts_count, today_exercises_count, comparison_data['yesterday']['workouts'], comparison_data['yesterday']['exercises'])
 				
 				# Last week: same period but 7 days ago
 				if lookback_days:
 					last_week_start = (datetime.now(timezone.utc) - timedelta(days=lookback_days + 7)).date().isoformat()
 					last_week_end = (datetime.now(timezone.utc) - timedelta(days=7)).date().isoformat()
 					last_week_workouts = [
-						w for w in all_workouts
-						if last_week_start <= w.get("date", "") <= last_week_end
-						and (w.get("gym_name") or "").lower().strip() == target_gym
-						and (w.get("gym_name") or "").lower().strip() not in ("", "-", "gym -")
+						w for day, rows in workouts_by_date.items()
+						if last_week_start <= day <= last_week_end
+						for w in rows
 					]
 					comparison_data["last_week"]["workouts"] = len(last_week_workouts)
-					comparison_data["last_week"]["exercises"] = sum([len(w.get("exercises") or []) for w in last_week_workouts])
+					comparison_data["last_week"]["exercises"] = sum(_workout_exercise_count(w) for w in last_week_workouts)
 				
 				# Last month: same period but 30 days ago
 				if lookback_days:
 					last_month_start = (datetime.now(timezone.utc) - timedelta(days=lookback_days + 30)).date().isoformat()
 					last_month_end = (datetime.now(timezone.utc) - timedelta(days=30)).date().isoformat()
 					last_month_workouts = [
-						w for w in all_workouts
-						if last_month_start <= w.get("date", "") <= last_month_end
-						and (w.get("gym_name") or "").lower().strip() == target_gym
-						and (w.get("gym_name") or "").lower().strip() not in ("", "-", "gym -")
+						w for day, rows in workouts_by_date.items()
+						if last_month_start <= day <= last_month_end
+						for w in rows
 					]
 					comparison_data["last_month"]["workouts"] = len(last_month_workouts)
-					comparison_data["last_month"]["exercises"] = sum([len(w.get("exercises") or []) for w in last_month_workouts])
+					comparison_data["last_month"]["exercises"] = sum(_workout_exercise_count(w) for w in last_month_workouts)
 				
 				# Last week/month users: count total users up to and including those periods
-				# Use the same user_creation_dates dict we created earlier
-				if analytics_all.data and lookback_days:
+				# Reuse the sorted creation times built for the yesterday comparison
+				if analytics_rows and lookback_days:
 					# Last week users: total users created up to and including the end of last week period
 					last_week_user_end = now - timedelta(days=7)
-					last_week_users_count = 0
-					for u in analytics_all.data:
-						if not u.get("user_id"):
-							continue
-						user_id = u.get("user_id")
-						# Use actual user creation date from auth.users if available
-						if user_id in user_creation_dates:
-							try:
-								created_str = user_creation_dates[user_id].replace('Z', '+00:00')
-								created = datetime.fromisoformat(created_str)
-								if created <= last_week_user_end:
-									last_week_users_count += 1
-							except:
-								pass
-						else:
-							# Fallback: use gym_analytics.created_at
-							if u.get("created_at"):
-								try:
-									created = datetime.fromisoformat(u.get("created_at").replace('Z', '+00:00'))
-									if created <= last_week_user_end:
-										last_week_users_count += 1
-								except:
-									pass
-							else:
-								# If no created_at, assume old user (count it)
-								last_week_users_count += 1
-					comparison_data["last_week"]["users"] = last_week_users_count
+					comparison_data["last_week"]["users"] = undated_users + bisect.bisect_right(created_epochs, last_week_user_end.timestamp())
 					
 					# Last month users: total users created up to and including the end of last month period
 					last_month_user_end = now - timedelta(days=30)
-					last_month_users_count = 0
-					for u in analytics_all.data:
-						if not u.get("user_id"):
-							continue
-						user_id = u.get("user_id")
-						# Use actual user creation date from auth.users if available
-						if user_id in user_creation_dates:
-							try:
-								created_str = user_creation_dates[user_id].replace('Z', '+00:00')
-								created = datetime.fromisoformat(created_str)
-								if created <= last_month_user_end:
-									last_month_users_count += 1
-							except:
-								pass
-						else:
-							# Fallback: use gym_analytics.created_at
-							if u.get("created_at"):
-								try:
-									created = datetime.fromisoformat(u.get("created_at").replace('Z', '+00:00'))
-									if created <= last_month_user_end:
-										last_month_users_count += 1
-								except:
-									pass
-							else:
-								# If no created_at, assume old user (count it)
-								last_month_users_count += 1
-					comparison_data["last_month"]["users"] = last_month_users_count
+					comparison_data["last_month"]["users"] = undated_users + bisect.bisect_right(created_epochs, last_month_user_end.timestamp())
 			else:
 				kpi_total_workouts = 0
 				kpi_total_exercises = 0
 		except Exception as e:
-			print(f"[GYM DASHBOARD] Failed to build workout charts: {e}")
+			dashboard_log.warning("Failed to build workout charts: %s", e)
 			kpi_total_workouts = 0
 			kpi_total_exercises = 0
 
@@ -4115,32 +4862,34 @@ def get_gym_dashboard():
 			today_workouts = 0
 			if consent_user_ids and all_workouts:
 				for w in all_workouts:
-					w_gym = (w.get("gym_name") or "").lower().strip()
+					w_gym = _workout_gym_key(w)
 					if w_gym and w_gym == target_gym and w.get("date") == today_str:
 						today_workouts += 1
 			
 			historical_workouts = []
 			if consent_user_ids:
 				four_weeks_ago = today - timedelta(days=28)
+
+				def fetch_history(chunk):
+					q = admin_client.table("workouts").select("date,gym_name").in_("user_id", chunk).gte("date", four_weeks_ago.isoformat()).lte("date", (today - timedelta(days=1)).isoformat())
+					return q.execute().data or []
+
 				try:
-					for i in range(0, len(consent_user_ids), 50):
-						chunk = consent_user_ids[i:i+50]
-						q = admin_client.table("workouts").select("date,gym_name").in_("user_id", chunk).gte("date", four_weeks_ago.isoformat()).lte("date", (today - timedelta(days=1)).isoformat())
-						res = q.execute()
-						if res.data:
-							for w in res.data:
-								w_gym = (w.get("gym_name") or "").lower().strip()
-								if w_gym and w_gym == target_gym:
-									w_date = w.get("date")
-									if w_date:
-										try:
-											w_date_obj = datetime.fromisoformat(w_date).date()
-											if w_date_obj.weekday() == current_weekday:
-												historical_workouts.append(w_date_obj)
-										except:
-											pass
+					history_futures = [
+						_IO_EXECUTOR.submit(fetch_history, consent_user_ids[i:i+50])
+						for i in range(0, len(consent_user_ids), 50)
+					]
+					for future in history_futures:
+						for w in future.result():
+							w_gym = _workout_gym_key(w)
+							if w_gym and w_gym == target_gym:
+								w_date = w.get("date")
+								if w_date:
+									w_dt = _parse_iso(w_date)
+									if w_dt and w_dt.date().weekday() == current_weekday:
+										historical_workouts.append(w_dt.date())
 				except Exception as e:
-					print(f"[GYM DASHBOARD] Error calculating busy status: {e}")
+					dashboard_log.error("Error calculating busy status: %s", e)
 			
 			if historical_workouts:
 				weeks = {}
@@ -4184,21 +4933,27 @@ def get_gym_dashboard():
 				"percentage": round(percentage, 0) if historical_avg > 0 else 0
 			}
 		except Exception as e:
-			print(f"[GYM DASHBOARD] Error calculating busy status: {e}")
+			dashboard_log.error("Error calculating busy status: %s", e)
 		
-		return jsonify({
+		body = app.json.dumps({
 			"success": True,
 			"gym_id": gym_id,
 			"gym_name": gym_name,
 			"is_premium": is_premium,
 			"statistics": statistics,
 			"busy_status": busy_status
-		}), 200
+		})
+		etag = hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+		if _DASHBOARD_CACHE_TTL_SECONDS > 0:
+			with _dashboard_cache_lock:
+				_dashboard_cache[cache_key] = (time.monotonic(), body, etag)
+				_dashboard_cache.move_to_end(cache_key)
+				while len(_dashboard_cache) > _DASHBOARD_CACHE_MAX:
+					_dashboard_cache.popitem(last=False)
+		return _dashboard_response(body, etag)
 		
 	except Exception as e:
-		print(f"[GYM DASHBOARD] Error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("[GYM DASHBOARD] Error: %s", e)
 		return jsonify({"error": f"Failed to get gym dashboard: {str(e)}"}), 500
 
 
@@ -4207,9 +4962,6 @@ def check_gym_account():
 	"""
 	Check if the current user is a gym account.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	if not SUPABASE_AVAILABLE:
 		return jsonify({"error": "Supabase not available"}), 500
 	
@@ -4221,19 +4973,15 @@ def check_gym_account():
 	access_token = auth_header.replace("Bearer ", "").strip()
 	
 	try:
-		SUPABASE_URL = os.getenv("SUPABASE_URL")
-		SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-		
 		if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 			return jsonify({"is_gym_account": False}), 200
 		
-		supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-		user_response = supabase_client.auth.get_user(access_token)
+		user = _verify_token(access_token)
 		
-		if not user_response.user:
+		if not user:
 			return jsonify({"is_gym_account": False}), 200
 		
-		user_metadata = user_response.user.user_metadata or {}
+		user_metadata = user.user_metadata or {}
 		is_gym_account = user_metadata.get("is_gym_account") == True
 		
 		return jsonify({
@@ -4242,7 +4990,7 @@ def check_gym_account():
 		}), 200
 		
 	except Exception as e:
-		print(f"[GYM CHECK] Error: {e}")
+		log.error("[GYM CHECK] Error: %s", e)
 		return jsonify({"is_gym_account": False}), 200
 
 
@@ -4252,9 +5000,6 @@ def get_google_places_key():
 	Get Google Places API key for frontend autocomplete.
 	This endpoint returns the API key that should be restricted to specific domains/IPs in Google Cloud Console.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-	
 	# SECURITY: Do not expose the Google Places API key to the frontend.
 	# Autocomplete is proxied through /api/gym-suggestions instead.
 	return jsonify({"error": "This endpoint is disabled. Use /api/gym-suggestions."}), 410
@@ -4269,17 +5014,39 @@ def _google_places_get_json(base_url: str, params: dict) -> dict:
 	url = f"{base_url}?{urllib.parse.urlencode(params)}"
 	req = urllib.request.Request(url, headers={"User-Agent": "GymVision-AI/1.0"})
 	with urllib.request.urlopen(req, timeout=8) as resp:
-		body = resp.read().decode("utf-8")
-	return json.loads(body)
+		body = resp.read()
+	return app.json.loads(body)
 
 
-_gym_suggestions_requests: dict[str, list[float]] = defaultdict(list)
-_gym_suggestions_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_gym_suggestions_requests: "dict[str, deque[float]]" = defaultdict(deque)
+_gym_suggestions_request_count = 0
+_gym_suggestions_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()  # query -> (expires_at, payload)
+_gym_suggestions_lock = threading.Lock()  # guards both maps (threaded workers)
 _GYM_SUGGESTIONS_CACHE_TTL_SECONDS = 300  # 5 minutes
 _GYM_SUGGESTIONS_CACHE_MAX = 500
 _GYM_SUGGESTIONS_RATE_WINDOW_SECONDS = 60
 _GYM_SUGGESTIONS_RATE_MAX_REQUESTS = 30
 _GYM_SUGGESTIONS_RATE_MAX_IPS = 2000
+_GYM_SUGGESTIONS_SWEEP_EVERY = 1000  # requests between full stale-IP sweeps
+
+
+def _sweep_gym_suggestion_ips(now: float) -> None:
+	"""Drop expired IP buckets and cap how many are kept. Caller holds _gym_suggestions_lock."""
+	window_seconds = _GYM_SUGGESTIONS_RATE_WINDOW_SECONDS
+	for known_ip in list(_gym_suggestions_requests.keys()):
+		times = _gym_suggestions_requests[known_ip]
+		if not times or now - times[-1] >= window_seconds:
+			del _gym_suggestions_requests[known_ip]
+
+	# Hard cap the amount of IP buckets as a safety valve.
+	if len(_gym_suggestions_requests) > _GYM_SUGGESTIONS_RATE_MAX_IPS:
+		# Remove oldest buckets first based on latest request timestamp.
+		ordered_ips = sorted(
+			_gym_suggestions_requests.items(),
+			key=lambda item: item[1][-1] if item[1] else 0
+		)
+		for stale_ip, _ in ordered_ips[:len(_gym_suggestions_requests) - _GYM_SUGGESTIONS_RATE_MAX_IPS]:
+			_gym_suggestions_requests.pop(stale_ip, None)
 
 
 @app.route("/api/gym-suggestions", methods=["GET", "OPTIONS"])
@@ -4288,9 +5055,6 @@ def gym_suggestions():
 	Backend-proxy for gym autocomplete suggestions (Google Places).
 	Keeps the API key server-side and applies basic per-IP rate limiting.
 	"""
-	if request.method == "OPTIONS":
-		return jsonify({}), 200
-
 	q = (request.args.get("q") or "").strip()
 	if len(q) < 2:
 		return jsonify({"predictions": [], "status": "OK"}), 200
@@ -4298,11 +5062,18 @@ def gym_suggestions():
 	# Cache (reduces Google billable calls; key is never exposed)
 	cache_key = q.lower().strip()
 	now_ts = time.time()
-	cached = _gym_suggestions_cache.get(cache_key)
-	if cached and (now_ts - cached[0] < _GYM_SUGGESTIONS_CACHE_TTL_SECONDS):
-		# refresh LRU position
-		_gym_suggestions_cache.move_to_end(cache_key)
-		return jsonify(cached[1]), 200
+	cached_payload = None
+	with _gym_suggestions_lock:
+		cached = _gym_suggestions_cache.get(cache_key)
+		if cached is not None:
+			if cached[0] > now_ts:
+				# refresh LRU position
+				_gym_suggestions_cache.move_to_end(cache_key)
+				cached_payload = cached[1]
+			else:
+				del _gym_suggestions_cache[cache_key]
+	if cached_payload is not None:
+		return jsonify(cached_payload), 200
 
 	# Basic rate limit: 60 requests/minute per IP (best-effort; per-process)
 	ip = (request.headers.get("X-Forwarded-For") or request.remote_addr or "unknown").split(",")[0].strip()
@@ -4310,32 +5081,27 @@ def gym_suggestions():
 	window_seconds = _GYM_SUGGESTIONS_RATE_WINDOW_SECONDS
 	max_requests = _GYM_SUGGESTIONS_RATE_MAX_REQUESTS
 
-	# Cleanup stale IP buckets so this map cannot grow forever.
-	# Keep this lightweight and local (per-process best effort).
-	for known_ip in list(_gym_suggestions_requests.keys()):
-		old_times = _gym_suggestions_requests.get(known_ip) or []
-		fresh_times = [t for t in old_times if now - t < window_seconds]
-		if fresh_times:
-			_gym_suggestions_requests[known_ip] = fresh_times
+	global _gym_suggestions_request_count
+	with _gym_suggestions_lock:
+		# Stale IP buckets are swept every so often (or when over the cap) so this map cannot grow forever,
+		# without scanning every IP on each request.
+		_gym_suggestions_request_count += 1
+		if (
+			_gym_suggestions_request_count % _GYM_SUGGESTIONS_SWEEP_EVERY == 0
+			or len(_gym_suggestions_requests) > _GYM_SUGGESTIONS_RATE_MAX_IPS
+		):
+			_sweep_gym_suggestion_ips(now)
+
+		times = _gym_suggestions_requests[ip]
+		while times and now - times[0] >= window_seconds:
+			times.popleft()
+		if len(times) >= max_requests:
+			over_limit = True
 		else:
-			_gym_suggestions_requests.pop(known_ip, None)
-
-	# Hard cap the amount of IP buckets as a safety valve.
-	if len(_gym_suggestions_requests) > _GYM_SUGGESTIONS_RATE_MAX_IPS:
-		# Remove oldest buckets first based on latest request timestamp.
-		ordered_ips = sorted(
-			_gym_suggestions_requests.items(),
-			key=lambda item: item[1][-1] if item[1] else 0
-		)
-		for stale_ip, _ in ordered_ips[:len(_gym_suggestions_requests) - _GYM_SUGGESTIONS_RATE_MAX_IPS]:
-			_gym_suggestions_requests.pop(stale_ip, None)
-
-	times = [t for t in _gym_suggestions_requests[ip] if now - t < window_seconds]
-	if len(times) >= max_requests:
-		_gym_suggestions_requests[ip] = times
+			times.append(now)
+			over_limit = False
+	if over_limit:
 		return jsonify({"predictions": [], "status": "OVER_QUERY_LIMIT"}), 429
-	times.append(now)
-	_gym_suggestions_requests[ip] = times
 
 	try:
 		# IMPORTANT: We only want gyms/sportscholen (not McDonald's/Albert Heijn/etc).
@@ -4378,24 +5144,204 @@ def gym_suggestions():
 			)
 
 		payload = {"predictions": preds, "status": status}
-		_gym_suggestions_cache[cache_key] = (now_ts, payload)
-		_gym_suggestions_cache.move_to_end(cache_key)
-		if len(_gym_suggestions_cache) > _GYM_SUGGESTIONS_CACHE_MAX:
-			_gym_suggestions_cache.popitem(last=False)
+		with _gym_suggestions_lock:
+			_gym_suggestions_cache[cache_key] = (now_ts + _GYM_SUGGESTIONS_CACHE_TTL_SECONDS, payload)
+			_gym_suggestions_cache.move_to_end(cache_key)
+			if len(_gym_suggestions_cache) > _GYM_SUGGESTIONS_CACHE_MAX:
+				_gym_suggestions_cache.popitem(last=False)
 		return jsonify(payload), 200
 	except Exception as e:
-		print(f"[GYM SUGGESTIONS] Error: {e}")
+		log.error("[GYM SUGGESTIONS] Error: %s", e)
 		return jsonify({"predictions": [], "status": "ERROR"}), 200
 
 
+def _drop_trailing_comma(out: List[str]) -> None:
+	"""Remove a "," that is the last non-space character of the output being built."""
+	i = len(out) - 1
+	while i >= 0 and out[i].isspace():
+		i -= 1
+	if i >= 0 and out[i] == ",":
+		del out[i]
+
+
+def _repair_json(text: str) -> str:
+	"""Tolerant fix-up of an AI JSON reply: drops trailing commas, a dangling key and closes a cut-off string and open brackets."""
+	out: List[str] = []
+	# Open containers as [closer, start of the current object member, member has its ":"]
+	frames: List[list] = []
+	in_string = False
+	escaped = False
+	for ch in text:
+		if in_string:
+			out.append(ch)
+			if escaped:
+				escaped = False
+			elif ch == "\\":
+				escaped = True
+			elif ch == '"':
+				in_string = False
+			continue
+		if ch == '"':
+			in_string = True
+		elif ch in "{[":
+			frames.append(["}" if ch == "{" else "]", len(out) + 1, False])
+		elif ch in "}]":
+			_drop_trailing_comma(out)
+			if frames:
+				frames.pop()
+		elif frames and ch == ",":
+			frames[-1][1] = len(out) + 1
+			frames[-1][2] = False
+		elif frames and ch == ":":
+			frames[-1][2] = True
+		out.append(ch)
+	if in_string:
+		if escaped:
+			out.pop()
+		out.append('"')
+	if frames and frames[-1][0] == "}" and not frames[-1][2]:
+		# Cut off before the ":" of the last member; drop the bare key
+		del out[frames[-1][1]:]
+	_drop_trailing_comma(out)
+	if "".join(out).rstrip().endswith(":"):
+		out.append(" null")
+	out.extend(frame[0] for frame in reversed(frames))
+	return "".join(out)
+
+
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+
+def _parse_workout_content(content: str) -> Dict[str, Any]:
+	"""Parse the workout JSON object out of an AI reply; code fences, extra text and trailing commas are tolerated."""
+	# Take the body of a markdown code block if there is one, then the outermost {...}
+	# (up to the end when the closing brace was cut off)
+	match = _JSON_FENCE_RE.search(content)
+	if match:
+		content = match.group(1)
+	start_idx = content.find("{")
+	end_idx = content.rfind("}")
+	if start_idx != -1:
+		content = content[start_idx:end_idx + 1] if end_idx > start_idx else content[start_idx:]
+	
+	# Parse JSON with better error handling
+	try:
+		workout_json = app.json.loads(content)
+	except json.JSONDecodeError as parse_error:
+		log.error("JSON parse error: %s", parse_error)
+		log.debug("Content was: %.500s", content)
+		# Fix trailing commas and truncated output in one pass
+		try:
+			workout_json = app.json.loads(_repair_json(content))
+		except ValueError:
+			raise ValueError(f"Failed to parse JSON response from AI. The AI may have returned invalid JSON. Original error: {parse_error}")
+	return workout_json
+
+
+def _vision_workout_result(content: str) -> tuple[Dict[str, Any], int]:
+	"""Body and status for /api/vision-workout from the AI's full reply, with exercises resolved against MACHINE_METADATA."""
+	workout_json = _parse_workout_content(content)
+
+	# Validate and clean up the workout
+	if not workout_json.get("exercises"):
+		return {"error": "No exercises generated in workout"}, 500
+	
+	exercise_list = workout_json.get("exercises", [])
+	log.debug("Found %s exercises in workout JSON", len(exercise_list))
+	
+	# Validate exercises exist in metadata
+	valid_exercises = []
+	for ex in exercise_list:
+		key = ex.get("key", "").lower().strip()
+		display = ex.get("display", "").strip()
+		
+		meta_key = _match_exercise_key(key, display)
+		
+		if meta_key:
+			meta = MACHINE_METADATA[meta_key]
+			valid_exercises.append({
+				"key": meta_key,
+				"display": meta.get("display", display)
+			})
+		else:
+			log.warning("Could not find exercise: key='%s', display='%s'", key, display)
+	
+	if not valid_exercises:
+		# Try to provide helpful error message (nothing matched, so every suggested exercise is invalid)
+		invalid_exercises = [ex.get("display", ex.get("key", "unknown")) for ex in exercise_list[:3]]
+		error_msg = f"No valid exercises found in workout. "
+		if invalid_exercises:
+			error_msg += f"Could not find: {', '.join(invalid_exercises[:3])}. "
+		error_msg += "Please try using exercise names from the exercise list."
+		return {"error": error_msg}, 500
+	
+	return {
+		"workout": {
+			"name": workout_json.get("name", "AI Workout"),
+			"exercises": valid_exercises
+		}
+	}, 200
+
+
+# A complete {"key": ..., "display": ...} entry in a partially streamed workout reply
+_STREAMED_EXERCISE_RE = re.compile(r"\{[^{}]*\}")
+
+
+def _stream_vision_workout(client: Any, messages: List[Dict[str, str]]):
+	"""NDJSON for /api/vision-workout with "stream": true: each exercise once the model has written it, then the full result."""
+	content = ""
+	scan_pos = -1
+	try:
+		stream = client.chat.completions.create(
+			model="llama-3.3-70b-versatile",
+			messages=messages,
+			temperature=0.3,
+			max_tokens=_WORKOUT_MAX_TOKENS,
+			stream=True,
+		)
+		for chunk in stream:
+			delta = chunk.choices[0].delta.content if chunk.choices else None
+			if not delta:
+				continue
+			content += delta
+			if scan_pos < 0:
+				scan_pos = content.find('"exercises"')
+				if scan_pos < 0:
+					continue
+			for match in _STREAMED_EXERCISE_RE.finditer(content, scan_pos):
+				scan_pos = match.end()
+				try:
+					ex = app.json.loads(match.group(0))
+				except ValueError:
+					continue
+				if not isinstance(ex, dict):
+					continue
+				display = str(ex.get("display") or "").strip()
+				meta_key = _match_exercise_key(str(ex.get("key") or "").lower().strip(), display)
+				if meta_key:
+					exercise = {"key": meta_key, "display": MACHINE_METADATA[meta_key].get("display", display)}
+					yield app.json.dumps({"exercise": exercise}) + "\n"
+	except Exception as e:
+		_log_exception("Groq API error: %s", e)
+		yield app.json.dumps({"error": "AI service temporarily unavailable. Please try again in a moment."}) + "\n"
+		return
+
+	try:
+		result, _ = _vision_workout_result(content)
+	except ValueError as e:
+		log.error("Failed to parse workout JSON: %s", e)
+		log.debug("Content was: %.500s", content)
+		result = {"error": "The AI returned an invalid response. Please try rephrasing your request or try again."}
+	yield app.json.dumps(result) + "\n"
+
+
 @app.route("/api/vision-workout", methods=["POST"])
 def vision_workout():
 	"""AI workout generation endpoint for Vision chat - uses Groq API."""
 	if not GROQ_AVAILABLE:
 		return jsonify({"error": "Groq API not available. Please install groq package."}), 500
 	
-	# Load API key from environment variable only
-	GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+	# API key is read from the environment once at startup
 	if not GROQ_API_KEY:
 		return jsonify({"error": "Groq API key not configured. Set GROQ_API_KEY environment variable."}), 500
 	
@@ -4414,17 +5360,7 @@ def vision_workout():
 		return jsonify({"error": "Message is required"}), 400
 	
 	# Build exercise list with keys for workout generation
-	exercise_list = []
-	exercise_map = {}
-	for key, meta in MACHINE_METADATA.items():
-		display_name = meta.get("display", key.replace("_", " ").title())
-		muscles = meta.get("muscles", [])
-		muscle_str = ", ".join([m for m in muscles if m and m != "-"])
-		exercise_list.append(f"{display_name} (key: {key})" + (f" - targets: {muscle_str}" if muscle_str else ""))
-		exercise_map[display_name.lower()] = key
-		exercise_map[key] = key
-	
-	exercises_context = "\n".join(exercise_list[:150])
+	exercises_context = _workout_exercises_context(_MACHINE_METADATA_VERSION)
 	
 	context_info = ""
 	if workout_context:
@@ -4470,27 +5406,34 @@ Examples:
 - User: "I'm doing back exercises" → This is a statement, not a request for a workout. But if they say "make me a back workout", then create one.
 """
 	
+	messages = [
+		{"role": "system", "content": "You are a fitness expert. Return ONLY valid JSON, no explanations. Start your response with { and end with }."},
+		{"role": "user", "content": prompt}
+	]
 	try:
 		# Groq SDK handles Authorization header internally
-		# API key is loaded from environment variable only
-		client = Groq(api_key=GROQ_API_KEY)
-		
+		# API key is read from the environment once at startup
+		client = _get_groq_client(GROQ_API_KEY)
+
+		if data.get("stream"):
+			return app.response_class(
+				stream_with_context(_stream_vision_workout(client, messages)),
+				mimetype="application/x-ndjson",
+			)
+
+		# Repeat prompts ("push workout", "leg day") are answered from the cache without calling Groq
+		cache_key = _workout_cache_key(message, workout_context)
+		cached_content = _cached_workout_content(cache_key)
+		if cached_content is not None:
+			result, status = _vision_workout_result(cached_content)
+			return jsonify(result), status
+
 		# Wrap API call in try-except to catch any Groq SDK errors
 		try:
-			response = client.chat.completions.create(
-			model="llama-3.3-70b-versatile",
-			messages=[
-				{"role": "system", "content": "You are a fitness expert. Return ONLY valid JSON, no explanations. Start your response with { and end with }."},
-				{"role": "user", "content": prompt}
-			],
-			temperature=0.3,
-			max_tokens=800
-		)
+			response = _groq_workout_completion(client, messages)
 		except Exception as groq_error:
 			error_str = str(groq_error)
-			print(f"[ERROR] Groq API error: {error_str}")
-			import traceback
-			traceback.print_exc()
+			_log_exception("Groq API error: %s", error_str)
 			# Return a generic error message - frontend will use fallback workout
 			return jsonify({"error": "AI service temporarily unavailable. Please try again in a moment."}), 500
 		
@@ -4507,132 +5450,20 @@ Examples:
 		if not content:
 			return jsonify({"error": "Empty content from AI. Please try again."}), 500
 		
-		content = content.strip()
-		
-		# Try to extract JSON from response (might have markdown code blocks)
-		if "```" in content:
-			# Extract JSON from code block
-			start = content.find("```")
-			if start != -1:
-				start = content.find("\n", start) + 1
-				end = content.find("```", start)
-				if end != -1:
-					content = content[start:end].strip()
-		
-		# Remove markdown code block markers if present
-		if content.startswith("```json"):
-			content = content[7:].strip()
-		if content.startswith("```"):
-			content = content[3:].strip()
-		if content.endswith("```"):
-			content = content[:-3].strip()
-		
-		# Try to find JSON object in the content (in case there's extra text)
-		if "{" in content and "}" in content:
-			start_idx = content.find("{")
-			end_idx = content.rfind("}")
-			if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-				content = content[start_idx:end_idx + 1]
-		
-		# Parse JSON with better error handling
-		try:
-			workout_json = json.loads(content)
-		except json.JSONDecodeError as parse_error:
-			print(f"[ERROR] JSON parse error: {parse_error}")
-			print(f"[DEBUG] Content was: {content[:500]}")
-			# Try to fix common JSON issues
-			# Remove any trailing commas before closing braces/brackets
-			import re
-			content = re.sub(r',\s*}', '}', content)
-			content = re.sub(r',\s*]', ']', content)
-			try:
-				workout_json = json.loads(content)
-			except:
-				raise ValueError(f"Failed to parse JSON response from AI. The AI may have returned invalid JSON. Original error: {parse_error}")
-		
-		# Validate and clean up the workout
-		if not workout_json.get("exercises"):
-			return jsonify({"error": "No exercises generated in workout"}), 500
-		
-		exercise_list = workout_json.get("exercises", [])
-		print(f"[DEBUG] Found {len(exercise_list)} exercises in workout JSON")
-		
-		# Validate exercises exist in metadata
-		valid_exercises = []
-		for ex in exercise_list:
-			key = ex.get("key", "").lower().strip()
-			display = ex.get("display", "").strip()
-			
-			# Try to find exercise by key (exact match)
-			meta_key = None
-			for meta_key_candidate, meta in MACHINE_METADATA.items():
-				if meta_key_candidate.lower() == key:
-					meta_key = meta_key_candidate
-					break
-			
-			# If not found by key, try by display name (exact match)
-			if not meta_key:
-				for meta_key_candidate, meta in MACHINE_METADATA.items():
-					if meta.get("display", "").lower().strip() == display.lower():
-						meta_key = meta_key_candidate
-						break
-			
-			# If still not found, try fuzzy matching on display name
-			if not meta_key and display:
-				display_lower = display.lower()
-				for meta_key_candidate, meta in MACHINE_METADATA.items():
-					meta_display = meta.get("display", "").lower()
-					# Check if display name contains key parts or vice versa
-					if (display_lower in meta_display or meta_display in display_lower) and len(display_lower) > 3:
-						meta_key = meta_key_candidate
-						break
-			
-			# If still not found, try matching key parts
-			if not meta_key and key:
-				key_parts = key.replace("_", " ").split()
-				for meta_key_candidate, meta in MACHINE_METADATA.items():
-					meta_key_lower = meta_key_candidate.lower().replace("_", " ")
-					# Check if all key parts are in the metadata key
-					if all(part in meta_key_lower for part in key_parts if len(part) > 2):
-						meta_key = meta_key_candidate
-						break
-			
-			if meta_key:
-				meta = MACHINE_METADATA[meta_key]
-				valid_exercises.append({
-					"key": meta_key,
-					"display": meta.get("display", display)
-				})
-			else:
-				print(f"[WARNING] Could not find exercise: key='{key}', display='{display}'")
-		
-		if not valid_exercises:
-			# Try to provide helpful error message
-			invalid_exercises = [ex.get("display", ex.get("key", "unknown")) for ex in exercise_list if ex not in [{"key": v["key"], "display": v["display"]} for v in valid_exercises]]
-			error_msg = f"No valid exercises found in workout. "
-			if invalid_exercises:
-				error_msg += f"Could not find: {', '.join(invalid_exercises[:3])}. "
-			error_msg += "Please try using exercise names from the exercise list."
-			return jsonify({"error": error_msg}), 500
-		
-		return jsonify({
-			"workout": {
-				"name": workout_json.get("name", "AI Workout"),
-				"exercises": valid_exercises
-			}
-		})
+		result, status = _vision_workout_result(content)
+		if status == 200:
+			_store_workout_content(cache_key, content)
+		return jsonify(result), status
 	except (json.JSONDecodeError, ValueError) as e:
 		error_msg = str(e)
-		print(f"[ERROR] Failed to parse workout JSON: {error_msg}")
+		log.error("Failed to parse workout JSON: %s", error_msg)
 		if 'content' in locals():
-			print(f"[DEBUG] Content was: {content[:500]}")
+			log.debug("Content was: %.500s", content)
 		# Provide user-friendly error message
 		return jsonify({"error": "The AI returned an invalid response. Please try rephrasing your request or try again."}), 500
 	except Exception as e:
 		error_msg = str(e)
-		print(f"[ERROR] Workout generation failed: {error_msg}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Workout generation failed: %s", error_msg)
 		# Check if it's a pattern matching error from Groq or any other error
 		if "pattern" in error_msg.lower() or "match" in error_msg.lower() or "expected" in error_msg.lower() or "string" in error_msg.lower():
 			# This is likely a Groq API error - return a generic error message
@@ -4641,6 +5472,43 @@ Examples:
 		return jsonify({"error": "Failed to generate workout. Please try again."}), 500
 
 
+# {exercises_context} is filled in once per MACHINE_METADATA version, {context_note} per request
+_CHAT_SYSTEM_PROMPT_TEMPLATE = """You are Vision, an AI fitness assistant for the GymVision AI app. Your role is to help users with fitness and gym-related questions.
+
+IMPORTANT RULES:
+1. ONLY answer questions related to fitness, exercise, gym, nutrition, health, and wellness
+2. If asked about non-fitness topics (math, general knowledge, etc.), politely decline and redirect to fitness topics
+3. You have access to the following exercises available in the app:
+{exercises_context}
+
+4. When recommending exercises, prioritize exercises from the list above
+5. Be helpful, encouraging, and provide practical advice
+6. Keep responses concise but informative
+7. If asked about workout splits, provide practical recommendations based on training frequency
+8. If asked about equipment limitations (e.g., "only have dumbbells"), suggest exercises that match the available equipment
+9. If the user asks to create or modify a workout (e.g., "make a push workout", "add bench press", "remove overhead press"), you should generate a workout JSON response{context_note}
+
+Remember: You are a fitness expert assistant. Stay focused on fitness topics only."""
+
+
+# Substring needles that send a /chat message to workout generation, each list matched with one regex
+_CHAT_MUSCLE_GROUPS = ["chest", "shoulder", "back", "bicep", "tricep", "leg", "quad", "hamstring", "glute", "calf", "abs", "core", "borst"]
+_CHAT_WORKOUT_HINTS = ["workout", "make", "create", "maak", "train", "push", "pull", "legs", "oefeningen", "exercises"]
+_CHAT_WORKOUT_KEYWORDS = ["workout maken", "maak workout", "create workout", "make workout", "push trainen", "pull trainen", "leg trainen", "geen", "niet", "vervang", "verander", "change", "replace", "remove", "add", "voeg toe", "doe", "wil", "train", "workout", "oefeningen", "exercises"]
+# More specific: the user explicitly asks for a workout
+_CHAT_EXPLICIT_WORKOUT_PHRASES = ["make a workout", "maak een workout", "create a workout", "workout voor", "workout for", "train vandaag", "train today"]
+_CHAT_WORKOUT_HINT_RE = re.compile("|".join(map(re.escape, _CHAT_MUSCLE_GROUPS + _CHAT_WORKOUT_HINTS)))
+_CHAT_WORKOUT_REQUEST_RE = re.compile("|".join(map(re.escape, _CHAT_EXPLICIT_WORKOUT_PHRASES + _CHAT_WORKOUT_KEYWORDS)))
+
+
+@lru_cache(maxsize=2)
+def _chat_system_prompt_parts(version: int = 0) -> tuple[str, str]:
+	"""/chat system prompt split around the per-request workout note, built once per MACHINE_METADATA version."""
+	prompt = _CHAT_SYSTEM_PROMPT_TEMPLATE.replace("{exercises_context}", _chat_exercises_context(version))
+	head, _, tail = prompt.partition("{context_note}")
+	return head, tail
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
 	"""AI chatbot endpoint for fitness-related questions."""
@@ -4648,8 +5516,7 @@ def chat():
 	if not GROQ_AVAILABLE:
 		return jsonify({"error": "Groq API not available. Please install groq package."}), 500
 	
-	# Load API key from environment variable only
-	GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+	# API key is read from the environment once at startup
 	if not GROQ_API_KEY:
 		return jsonify({"error": "Groq API key not configured. Set GROQ_API_KEY environment variable."}), 500
 	
@@ -4660,30 +5527,14 @@ def chat():
 	if not message:
 		return jsonify({"error": "Message is required"}), 400
 	
-	# Build context about available exercises
-	exercise_list = []
-	for key, meta in MACHINE_METADATA.items():
-		display_name = meta.get("display", key.replace("_", " ").title())
-		muscles = meta.get("muscles", [])
-		muscle_str = ", ".join([m for m in muscles if m and m != "-"])
-		exercise_list.append(f"- {display_name}" + (f" (targets: {muscle_str})" if muscle_str else ""))
-	
-	exercises_context = "\n".join(exercise_list[:100])  # Limit to first 100 exercises to avoid token limits
-	
 	context_note = ""
 	if workout_context:
 		current_exercises = ", ".join([ex.get("display", ex.get("key", "")) for ex in workout_context.get("exercises", [])])
 		context_note = f"\n\nNOTE: The user is currently building a workout called '{workout_context.get('name', 'Workout')}' with these exercises: {current_exercises}. If they ask to modify, add, or remove exercises, you should generate a workout JSON response."
 	
-	# Check if message mentions muscle groups - if so, this should be handled by workout generation, not chat
-	muscle_groups = ["chest", "shoulder", "back", "bicep", "tricep", "leg", "quad", "hamstring", "glute", "calf", "abs", "core", "borst"]
-	workout_keywords = ["workout", "make", "create", "maak", "train", "push", "pull", "legs", "oefeningen", "exercises"]
+	# Check if message mentions muscle groups or workout keywords - if so, this should be handled by workout generation, not chat
 	msg_lower = message.lower()
-	mentions_muscle = any(muscle in msg_lower for muscle in muscle_groups)
-	mentions_workout = any(keyword in msg_lower for keyword in workout_keywords)
-	
-	# If user mentions muscle groups or workout keywords, redirect to workout generation
-	if mentions_muscle or mentions_workout:
+	if _CHAT_WORKOUT_HINT_RE.search(msg_lower):
 		try:
 			workout_data = generate_workout_from_chat(message, "", workout_context)
 			if workout_data and workout_data.get("exercises"):
@@ -4691,29 +5542,15 @@ def chat():
 					"workout": workout_data
 				})
 		except Exception as e:
-			print(f"[ERROR] Workout generation error in chat: {e}")
+			log.error("Workout generation error in chat: %s", e)
 	
-	system_prompt = f"""You are Vision, an AI fitness assistant for the GymVision AI app. Your role is to help users with fitness and gym-related questions.
-
-IMPORTANT RULES:
-1. ONLY answer questions related to fitness, exercise, gym, nutrition, health, and wellness
-2. If asked about non-fitness topics (math, general knowledge, etc.), politely decline and redirect to fitness topics
-3. You have access to the following exercises available in the app:
-{exercises_context}
-
-4. When recommending exercises, prioritize exercises from the list above
-5. Be helpful, encouraging, and provide practical advice
-6. Keep responses concise but informative
-7. If asked about workout splits, provide practical recommendations based on training frequency
-8. If asked about equipment limitations (e.g., "only have dumbbells"), suggest exercises that match the available equipment
-9. If the user asks to create or modify a workout (e.g., "make a push workout", "add bench press", "remove overhead press"), you should generate a workout JSON response{context_note}
-
-Remember: You are a fitness expert assistant. Stay focused on fitness topics only."""
+	head, tail = _chat_system_prompt_parts(_MACHINE_METADATA_VERSION)
+	system_prompt = head + context_note + tail
 
 	try:
 		# Groq SDK handles Authorization header internally
-		# API key is loaded from environment variable only
-		client = Groq(api_key=GROQ_API_KEY)
+		# API key is read from the environment once at startup
+		client = _get_groq_client(GROQ_API_KEY)
 		response = client.chat.completions.create(
 			model="llama-3.3-70b-versatile",  # Updated to current Groq model
 			messages=[
@@ -4721,39 +5558,30 @@ Remember: You are a fitness expert assistant. Stay focused on fitness topics onl
 				{"role": "user", "content": message}
 			],
 			temperature=0.7,
-			max_tokens=500
+			max_tokens=_CHAT_MAX_TOKENS
 		)
 		
 		reply = response.choices[0].message.content
 		
 		# Check if the message is about creating or modifying a workout
-		workout_keywords = ["workout maken", "maak workout", "create workout", "make workout", "push trainen", "pull trainen", "leg trainen", "geen", "niet", "vervang", "verander", "change", "replace", "remove", "add", "voeg toe", "doe", "wil", "train", "workout", "oefeningen", "exercises"]
-		# More specific: if user explicitly asks for a workout
-		explicit_workout_request = any(phrase in message.lower() for phrase in ["make a workout", "maak een workout", "create a workout", "workout voor", "workout for", "train vandaag", "train today"])
-		is_workout_request = explicit_workout_request or any(keyword in message.lower() for keyword in workout_keywords)
-		
-		if is_workout_request:
+		if _CHAT_WORKOUT_REQUEST_RE.search(msg_lower):
 			# Try to generate or modify workout
 			try:
 				workout_data = generate_workout_from_chat(message, reply, workout_context)
 				if workout_data and workout_data.get("exercises"):
-					print(f"[INFO] Workout generated successfully: {len(workout_data.get('exercises', []))} exercises")
+					log.info("Workout generated successfully: %s exercises", len(workout_data.get('exercises', [])))
 					return jsonify({
 						"reply": reply,
 						"workout": workout_data
 					})
 				else:
-					print(f"[WARNING] Workout generation returned no exercises")
+					log.warning("Workout generation returned no exercises")
 			except Exception as e:
-				print(f"[ERROR] Workout generation error: {e}")
-				import traceback
-				traceback.print_exc()
+				_log_exception("Workout generation error: %s", e)
 		
 		return jsonify({"reply": reply})
 	except Exception as e:
-		print(f"[ERROR] Chat API error: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Chat API error: %s", e)
 		return jsonify({"error": f"Failed to get response: {str(e)}"}), 500
 
 
@@ -4762,23 +5590,12 @@ def generate_workout_from_chat(message: str, ai_reply: str, workout_context: Opt
 	if not GROQ_AVAILABLE:
 		return None
 	
-	# Load API key from environment variable only
-	GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+	# API key is read from the environment once at startup
 	if not GROQ_API_KEY:
 		return None
 	
 	# Build exercise list with keys
-	exercise_list = []
-	exercise_map = {}
-	for key, meta in MACHINE_METADATA.items():
-		display_name = meta.get("display", key.replace("_", " ").title())
-		muscles = meta.get("muscles", [])
-		muscle_str = ", ".join([m for m in muscles if m and m != "-"])
-		exercise_list.append(f"{display_name} (key: {key})" + (f" - targets: {muscle_str}" if muscle_str else ""))
-		exercise_map[display_name.lower()] = key
-		exercise_map[key] = key
-	
-	exercises_context = "\n".join(exercise_list[:150])
+	exercises_context = _workout_exercises_context(_MACHINE_METADATA_VERSION)
 	
 	context_info = ""
 	if workout_context:
@@ -4818,48 +5635,31 @@ Examples:
 - User: "bench press and tricep pushdown" → {{"name": "Workout", "exercises": [{{"key": "bench_press", "display": "Bench Press"}}, {{"key": "tricep_pushdown", "display": "Tricep Pushdown"}}]}}
 """
 	
+	cache_key = _workout_cache_key(message, workout_context, ai_reply)
 	try:
-		# Groq SDK handles Authorization header internally
-		# API key is loaded from environment variable only
-		client = Groq(api_key=GROQ_API_KEY)
-		response = client.chat.completions.create(
-			model="llama-3.3-70b-versatile",
-			messages=[
+		content = _cached_workout_content(cache_key)
+		if content is None:
+			# Groq SDK handles Authorization header internally
+			# API key is read from the environment once at startup
+			client = _get_groq_client(GROQ_API_KEY)
+			response = _groq_workout_completion(client, [
 				{"role": "system", "content": "You are a fitness expert. Return ONLY valid JSON, no explanations. Start your response with { and end with }."},
 				{"role": "user", "content": prompt}
-			],
-			temperature=0.3,
-			max_tokens=800
-		)
+			])
+			content = response.choices[0].message.content
 		
-		content = response.choices[0].message.content.strip()
-		# Try to extract JSON from response (might have markdown code blocks)
-		if "```" in content:
-			# Extract JSON from code block
-			start = content.find("```")
-			if start != -1:
-				start = content.find("\n", start) + 1
-				end = content.find("```", start)
-				if end != -1:
-					content = content[start:end].strip()
-		# Find first { and last }
-		start_brace = content.find("{")
-		end_brace = content.rfind("}")
-		if start_brace != -1 and end_brace != -1 and end_brace > start_brace:
-			content = content[start_brace:end_brace + 1]
-		
-		workout_json = json.loads(content)
+		workout_json = _parse_workout_content(content)
 		
 		# Validate and clean up the workout
 		exercises = []
 		exercise_list = workout_json.get("exercises", [])
-		print(f"[DEBUG] Found {len(exercise_list)} exercises in workout JSON")
+		log.debug("Found %s exercises in workout JSON", len(exercise_list))
 		
 		for ex in exercise_list:
 			key = ex.get("key", "").lower().strip()
 			display = ex.get("display", "")
 			
-			print(f"[DEBUG] Processing exercise: key='{key}', display='{display}'")
+			log.debug("Processing exercise: key='%s', display='%s'", key, display)
 			
 			# Find matching exercise
 			if key in MACHINE_METADATA:
@@ -4869,47 +5669,50 @@ Examples:
 					"muscles": MACHINE_METADATA[key].get("muscles", []),
 					"sets": [{"weight": "", "reps": ""}, {"weight": "", "reps": ""}, {"weight": "", "reps": ""}]
 				})
-				print(f"[DEBUG] Found exercise by key: {key}")
+				log.debug("Found exercise by key: %s", key)
 			else:
 				# Try to find by display name
-				found = False
-				for meta_key, meta in MACHINE_METADATA.items():
-					if meta.get("display", "").lower() == display.lower() or meta_key.lower() == key:
-						exercises.append({
-							"key": meta_key,
-							"display": meta.get("display", display),
-							"muscles": meta.get("muscles", []),
-							"sets": [{"weight": "", "reps": ""}, {"weight": "", "reps": ""}, {"weight": "", "reps": ""}]
-						})
-						print(f"[DEBUG] Found exercise by display name: {display} -> {meta_key}")
-						found = True
-						break
-				if not found:
-					print(f"[WARNING] Could not find exercise: key='{key}', display='{display}'")
+				meta_key = _DISPLAY_LC.get(display.lower().strip()) or _KEY_LC.get(key)
+				if meta_key:
+					meta = MACHINE_METADATA[meta_key]
+					exercises.append({
+						"key": meta_key,
+						"display": meta.get("display", display),
+						"muscles": meta.get("muscles", []),
+						"sets": [{"weight": "", "reps": ""}, {"weight": "", "reps": ""}, {"weight": "", "reps": ""}]
+					})
+					log.debug("Found exercise by display name: %s -> %s", display, meta_key)
+				else:
+					log.warning("Could not find exercise: key='%s', display='%s'", key, display)
 		
-		print(f"[DEBUG] Final exercises count: {len(exercises)}")
+		log.debug("Final exercises count: %s", len(exercises))
 		if not exercises:
-			print("[ERROR] No valid exercises found in workout")
+			log.error("No valid exercises found in workout")
 			return None
 		
+		_store_workout_content(cache_key, content)
 		return {
 			"name": workout_json.get("name", "AI Workout"),
 			"exercises": exercises
 		}
 	except json.JSONDecodeError as e:
-		print(f"[ERROR] Failed to parse workout JSON: {e}")
-		print(f"[DEBUG] Content received: {content[:500] if 'content' in locals() else 'N/A'}")
+		log.error("Failed to parse workout JSON: %s", e)
+		log.debug("Content received: %.500s", content if 'content' in locals() else 'N/A')
 		return None
 	except Exception as e:
-		print(f"[ERROR] Workout generation failed: {e}")
-		import traceback
-		traceback.print_exc()
+		_log_exception("Workout generation failed: %s", e)
 		return None
 
 
 if __name__ == "__main__":
 	# Initialize database on startup
 	init_db()
+	# Build the Groq client (and its connection pool) before the first chat request
+	if GROQ_AVAILABLE and GROQ_API_KEY:
+		try:
+			_get_groq_client(GROQ_API_KEY)
+		except Exception as e:
+			log.warning("Could not create Groq client at startup: %s", e)
 	# Use PORT environment variable for Render, default to 5000 for local development
 	port = int(os.environ.get("PORT", 5000))
 	app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for _match_exercise_key (AI workout exercises -> MACHINE_METADATA keys)
+Compares the indexed matcher with the original MACHINE_METADATA scans
+
+Run with: python3 -m pytest test_exercise_matching.py
+"""
+import app
+from app import MACHINE_METADATA, _match_exercise_key
+
+
+def reference_match(key, display):
+    """The original matcher from generate_workout: four scans in MACHINE_METADATA order."""
+    for meta_key, meta in MACHINE_METADATA.items():
+        if meta_key.lower() == key:
+            return meta_key
+    for meta_key, meta in MACHINE_METADATA.items():
+        if meta.get("display", "").lower().strip() == display.lower():
+            return meta_key
+    if display:
+        display_lower = display.lower()
+        for meta_key, meta in MACHINE_METADATA.items():
+            meta_display = meta.get("display", "").lower()
+            if (display_lower in meta_display or meta_display in display_lower) and len(display_lower) > 3:
+                return meta_key
+    if key:
+        key_parts = key.replace("_", " ").split()
+        for meta_key in MACHINE_METADATA:
+            meta_key_lower = meta_key.lower().replace("_", " ")
+            if all(part in meta_key_lower for part in key_parts if len(part) > 2):
+                return meta_key
+    return None
+
+
+def sample_inputs():
+    """(key, display) pairs built from every MACHINE_METADATA key and display."""
+    words = set()
+    for meta_key, meta in MACHINE_METADATA.items():
+        display = meta.get("display", "")
+        words.update(meta_key.split("_"))
+        words.update(display.lower().split())
+        yield meta_key, display
+        yield meta_key, ""
+        yield "", display
+        yield "", display.lower()[1:-1]
+        yield "", "dumbbell " + display
+        yield "", display + "\nvariation"
+        yield meta_key + "_variation", "Unknown Exercise"
+        yield meta_key.split("_")[0], ""
+        yield "_".join(reversed(meta_key.split("_"))), ""
+    for word in sorted(words):
+        yield word, word
+        yield word, ""
+        yield "", word
+    yield "dip", ""
+    yield "chin", ""
+    yield "", ""
+
+
+def test_matches_original_scans():
+    mismatches = [
+        (key, display, _match_exercise_key(key, display), reference_match(key, display))
+        for key, display in sample_inputs()
+        if _match_exercise_key(key, display) != reference_match(key, display)
+    ]
+    assert not mismatches, mismatches[:10]
+
+
+def test_exact_key_and_display():
+    for meta_key, meta in MACHINE_METADATA.items():
+        assert _match_exercise_key(meta_key, "") == app._KEY_LC[meta_key.lower()]
+        display = meta.get("display", "")
+        if display:
+            assert _match_exercise_key("", display) == app._DISPLAY_LC[display.lower().strip()]
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for _EXERCISE_PREFIX_RE (filler phrases stripped from /api/recognize-exercise replies)
+
+Run with: python3 -m pytest test_exercise_prefix.py
+"""
+import pytest
+
+from app import _EXERCISE_PREFIX_RE
+
+
+@pytest.mark.parametrize("reply, expected", [
+    # Single prefixes (English)
+    ("this is a bench press", "bench press"),
+    ("this is bench press", "bench press"),
+    ("looks like lat pulldown", "lat pulldown"),
+    ("appears to be leg press", "leg press"),
+    ("i see a squat", "squat"),
+    ("it's a deadlift", "deadlift"),
+    ("it is a deadlift", "deadlift"),
+    ("probably a chest fly", "chest fly"),
+    ("likely a cable row", "cable row"),
+    # Single prefixes (Dutch)
+    ("dit is een bench press", "bench press"),
+    ("dit is bench press", "bench press"),
+    # Stacked prefixes
+    ("this is probably a bench press", "bench press"),
+    ("looks like it's a squat", "squat"),
+    ("i see likely a leg press", "leg press"),
+    ("dit is een probably a lat pulldown", "lat pulldown"),
+    ("dit is looks like it is a deadlift", "deadlift"),
+    # No prefix, or a phrase that is not at the start
+    ("bench press", "bench press"),
+    ("unknown exercise", "unknown exercise"),
+    ("bench press, this is a guess", "bench press, this is a guess"),
+])
+def test_strips_prefixes(reply, expected):
+    assert _EXERCISE_PREFIX_RE.sub("", reply) == expected